@@ -0,0 +1,214 @@
+# analysis.py
+"""
+One-request analysis pipeline behind POST /analyze.
+
+The dashboard used to make four round trips per "Analyze" click: /compile,
+then /hardware/update, /explain_error and /autofix in parallel, and /autofix
+compiled the code a second time. Here the route compiles once and this module
+fans out from that single result:
+
+    speech + hardware   queued right away (both are non-blocking queues)
+    analysis            local rules first (local_explainer.py), then one structured
+                        Gemini call (chatbot.AnalysisStream) for the explanation,
+                        fix steps and corrected program of whatever they didn't
+                        cover; the explanation streams token by token
+    fix                 the corrected program, compile-checked (and retried) by
+                        autofix.autofix_engine before it is handed out
+
+The stages run on a small thread pool under a latency budget; any that haven't
+finished by then are listed under "incomplete" in the final document instead
+of holding the response.
+
+    result = compile_submission(code)
+    for event, payload in analysis_pipeline.events(code, result, describe=compile_response):
+        ...  # "compile", "token", "autofix", "fix", "error", then one "done"
+
+With a session_id the diagnostics are diffed against the session's previous
+submission (see incremental.py) and only new ones are explained; when nothing
+is new there is no LLM call at all.
+
+Environment:
+    ANALYZE_BUDGET_S    seconds the analysis and fix stages may take after the compile (45)
+    ANALYZE_WORKERS     concurrent LLM calls across all /analyze requests (8)
+"""
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chatbot as cb
+from autofix import autofix_engine
+from incremental import analysis_sessions
+
+ANALYZE_BUDGET_S = float(os.getenv("ANALYZE_BUDGET_S", "45"))
+ANALYZE_WORKERS = int(os.getenv("ANALYZE_WORKERS", "8"))
+
+
+def fix_note(fix):
+    if fix["verified"]:
+        return "Verified fix (compiles)" + (" from cache" if fix["cached"] else "")
+    return "Unverified fix: it still has compile errors"
+
+
+class AnalysisPipeline:
+    """Fans one compile result out to speech, hardware and the LLM analysis under a budget."""
+
+    def __init__(self, workers=ANALYZE_WORKERS, budget=ANALYZE_BUDGET_S):
+        self.workers = workers
+        self.budget = budget
+        self._pool = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.over_budget = 0
+        self.stage_ms = {"analysis": 0.0, "fix": 0.0}
+        self.stage_runs = {"analysis": 0, "fix": 0}
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analyze")
+            return self._pool
+
+    def _stage(self, name, events, fn):
+        """Run fn() on the pool; its outcome arrives on events as (name, result, error, ms)."""
+        def run():
+            start = time.perf_counter()
+            try:
+                value, error = fn(), None
+            except Exception as e:
+                value, error = None, str(e)
+            ms = round((time.perf_counter() - start) * 1000, 2)
+            with self._lock:
+                self.stage_ms[name] += ms
+                self.stage_runs[name] += 1
+            events.put((name, value, error, ms))
+        # Carry the request's context (e.g. the LLM gateway's current user) onto the pool thread
+        self.pool().submit(contextvars.copy_context().run, run)
+
+    def events(self, code, result, describe, mode="student", session_id=None, announce=None, budget=None):
+        """
+        Yield (event, payload) pairs for an already-compiled submission.
+        describe(result) builds the public compile document; announce(result, delta)
+        queues speech/hardware (delta is None without a session).
+        """
+        budget = self.budget if budget is None else budget
+        deadline = time.monotonic() + budget
+        with self._lock:
+            self.runs += 1
+
+        doc = describe(result)
+        doc["timings_ms"] = {"compile": result.get("classification", {}).get("compile_time_ms")}
+        delta = None
+        if session_id:
+            delta = analysis_sessions.update(session_id, code, result)
+            doc["classification"] = {k: v for k, v in doc["classification"].items() if k != "diagnostics"}
+            doc["session_id"] = session_id
+            doc["delta"] = {key: delta[key] for key in ("new", "unchanged", "resolved")}
+        if announce is not None:
+            announce(result, delta)
+        yield "compile", dict(doc)
+
+        doc["explanation"] = ""
+        doc["fixed_code"] = ""
+        if result["status"] == "success":
+            yield "done", doc
+            return
+
+        events = queue.Queue()
+        self._stage("analysis", events, lambda: self._analyze(code, result, mode, session_id, delta, events))
+
+        extractor = cb.AutofixStreamExtractor()
+        outstanding = {"analysis"}
+        errors = {}
+        while outstanding:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item[0] == "token":
+                yield "token", {"text": item[1]}
+                fix = extractor.feed(item[1])
+                if fix:
+                    yield "autofix", {"text": fix}
+                continue
+
+            stage, value, error, ms = item
+            outstanding.discard(stage)
+            doc["timings_ms"][stage] = ms
+            if error:
+                errors[stage] = error
+                yield "error", {"stage": stage, "error": error}
+            elif stage == "analysis":
+                doc["explanation"] = value["explanation"]
+                if session_id:
+                    doc["explanations"] = value["explanations"]
+                outstanding.add("fix")
+                self._stage("fix", events, lambda analysis=value: autofix_engine.fix(
+                    code, result, mode=mode, analysis=analysis, deadline=deadline))
+            elif value["fixed_code"]:
+                doc["fixed_code"], doc["diff"] = value["fixed_code"], value["diff"]
+                doc["fix_verified"], doc["fix_rounds"] = value["verified"], value["rounds"]
+                doc["fix_note"] = fix_note(value)
+                yield "fix", {key: doc[key] for key in ("fixed_code", "diff", "fix_verified", "fix_note")}
+        if outstanding:
+            doc["incomplete"] = sorted(outstanding)
+            with self._lock:
+                self.over_budget += 1
+        if errors:
+            doc["errors"] = errors
+        yield "done", doc
+
+    def _analyze(self, code, result, mode, session_id, delta, events):
+        """
+        Run the structured analysis, streaming its explanation as "token" events.
+        With a session only the pending diagnostics are explained, and a session with
+        nothing pending makes no call: the fix comes from the stored corrected lines.
+        """
+        records = None
+        if session_id is not None:
+            if not delta["pending"]:
+                explanations = analysis_sessions.current_explanations(session_id)
+                return {
+                    "explanation": "\n\n".join(e["explanation"] for e in explanations.values()),
+                    "explanations": explanations,
+                    "fixed_program": "",
+                    "fixed_lines": "\n".join(e["autofix"] for e in explanations.values() if e["autofix"]),
+                }
+            records = delta["pending"]
+
+        stream = cb.AnalysisStream(code, result["raw_error"], result["classification"], mode=mode, records=records)
+        for chunk in stream:
+            events.put(("token", chunk))
+        analysis = stream.result
+        out = {
+            "explanation": cb.format_analysis(analysis),
+            "fixed_program": analysis["fixed_program"],
+            "fixed_lines": analysis["fixed_lines"],
+        }
+        if session_id is not None:
+            analysis_sessions.attach_explanation(session_id, delta["pending"], out["explanation"],
+                                                 analysis["fixed_lines"])
+            out["explanations"] = analysis_sessions.current_explanations(session_id)
+            out["explanation"] = "\n\n".join(e["explanation"] for e in out["explanations"].values())
+        return out
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "budget_s": self.budget,
+                "runs": self.runs,
+                "over_budget": self.over_budget,
+                "avg_ms": {
+                    stage: round(self.stage_ms[stage] / n, 2) if (n := self.stage_runs[stage]) else 0.0
+                    for stage in self.stage_ms
+                },
+            }
+
+
+analysis_pipeline = AnalysisPipeline()
@@ -3,66 +3,188 @@ import sys
 sys.stdout.reconfigure(encoding="utf-8")
 sys.stderr.reconfigure(encoding="utf-8")
 
-from flask import Flask, request, jsonify
+from startup import subsystems  # first, so the report covers every import below
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
-import uuid
-import subprocess
-
-from compiler import compile_c_program
+import re
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from compiler import compile_c_program, lookup_build, restore_cached_binary, GCC_FLAGS
+from compile_cache import compile_cache
+from llm_cache import llm_cache
+from compile_scheduler import compile_scheduler, SchedulerBusy, SchedulerTimeout
+from workspace import workspace_manager
+from sandbox import sandbox
+from pch import pch_manager
+from incremental import analysis_sessions, explain_input, describe_delta
+from local_explainer import local_explainer
+from conversation import conversations
+from model_router import model_router, ModelsUnavailable
+from llm_gateway import llm_gateway, GatewayBusy, current_user
+from metrics import registry, start_trace, finish_trace, current_trace
+from analysis import analysis_pipeline, fix_note
+from autofix import autofix_engine
 import chatbot as cb
-from emotional_module import speak_emotional
+from speech_queue import speech_queue, PRIORITY_HIGH
 from voice_input import listen_to_user
 import hardware_module as hw
+import batch_grader
+
+subsystems.mark("imports")  # Gemini, TTS, speech recognition and serial load on first use
 
 app = Flask(__name__)
 CORS(app)  # allow frontend running on another port
 
-UPLOAD_DIR = "temp_submissions"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
 
 
-# Helper: write code to a unique file
-def save_code_to_file(code_text, extension="c"):
-    fname = f"{uuid.uuid4().hex}.{extension}"
-    path = os.path.join(UPLOAD_DIR, fname)
-    with open(path, "w", encoding="utf-8", errors="replace") as f:
-        f.write(code_text)
-    return path
+# /compile hands out a build_id (the compile cache key); /run uses it to skip gcc
+def restore_build(build_id, output_file):
+    """Write the binary for a build handle to output_file; None if unknown or evicted."""
+    entry = lookup_build(build_id)
+    if entry is None:
+        return None
+    return restore_cached_binary(entry, output_file)
 
 
-# POST /compile
-@app.route("/compile", methods=["POST"])
-def compile_route():
-    data = request.get_json(force=True)
-    code = data.get("code", "")
-    if not code:
-        return jsonify({"error": "No code provided"}), 400
+# Compile jobs go through the bounded worker pool; a full queue becomes a 429
+def scheduled_compile(*args, **kwargs):
+    return compile_scheduler.run(compile_c_program, *args, **kwargs)
+
 
-    code_file = save_code_to_file(code)
-    exe_file = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.exe")
-    
-    # Check if program needs input before compiling
+def compile_submission(code):
+    """Full build of one submission in a scratch workspace (programs that read stdin aren't run)."""
     from compiler import program_needs_input
-    needs_input = program_needs_input(code)
-    
-    result = compile_c_program(code_file, output_file=exe_file, skip_execution=needs_input)
+    with workspace_manager.job() as ws:
+        return scheduled_compile(ws.write_source(code), output_file=ws.exe_path,
+                                 skip_execution=program_needs_input(code))
 
-    try:
-        if result["status"] == "success":
-            speak_emotional("No Error", "Your code compiled successfully!", "female")
-        else:
-            speak_emotional(result["classification"]["error_type"],
-                            f"Found {result['classification']['error_count']} errors and {result['classification']['warning_count']} warnings.",
-                            "female")
-    except Exception as e:
-        app.logger.debug("TTS error: %s", e)
 
+def request_user(headers, body, remote_addr):
+    """Who a request is for, for fair LLM queueing: X-User-Id, else its session_id, else the client address."""
+    user = headers.get("X-User-Id")
+    if not user and isinstance(body, dict):
+        user = body.get("session_id")
+    return str(user or remote_addr or "anonymous")
+
+
+@app.before_request
+def set_llm_user():
+    current_user.set(request_user(request.headers, request.get_json(silent=True), request.remote_addr))
+
+
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def request_trace_id(headers):
+    """The caller's X-Request-Id when it is a sane token, else None (a new id is made)."""
+    trace_id = headers.get("X-Request-Id", "")
+    return trace_id if _TRACE_ID_RE.match(trace_id) else None
+
+
+def request_route(req):
+    return req.url_rule.rule if req.url_rule is not None else "unmatched"
+
+
+@app.before_request
+def begin_request_trace():
+    start_trace(request_trace_id(request.headers))
+
+
+# The trace is logged when the response is closed, so streamed bodies are timed in full
+@app.after_request
+def end_request_trace(response):
+    trace = current_trace.get()
+    if trace is None:
+        return response
+    response.headers["X-Request-Id"] = trace.id
+    method, path, route, status = request.method, request.path, request_route(request), response.status_code
+    user = current_user.get()
+    response.call_on_close(lambda: finish_trace(trace, method, path, route, status, user=user))
+    return response
+
+
+# Server-sent events helpers (used by the */stream routes)
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def sse_response(generator):
+    return Response(
+        stream_with_context(generator),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.errorhandler(SchedulerBusy)
+def handle_scheduler_busy(e):
+    resp = jsonify({"error": "Compiler is busy. Please try again shortly.", "retry_after": e.retry_after})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@app.errorhandler(GatewayBusy)
+def handle_gateway_busy(e):
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@app.errorhandler(ModelsUnavailable)
+def handle_models_unavailable(e):
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@app.errorhandler(SchedulerTimeout)
+def handle_scheduler_timeout(e):
+    return jsonify({"error": str(e)}), 504
+
+
+def announce_compile_result(result):
+    """Queue speech and the hardware update for a compile result (both non-blocking)."""
+    if result["status"] == "success":
+        speech_queue.say("No Error", "Your code compiled successfully!", "female",
+                         priority=PRIORITY_HIGH, channel="compile")
+    else:
+        speech_queue.say(result["classification"]["error_type"],
+                         f"Found {result['classification']['error_count']} errors and {result['classification']['warning_count']} warnings.",
+                         "female", priority=PRIORITY_HIGH, channel="compile")
+    update_hardware(result.get("classification", {}))
+
+
+def update_hardware(classification):
     try:
-        hw.update_hardware_from_classification(result.get("classification", {}))
+        hw.update_hardware_from_classification(classification)
     except Exception as e:
         app.logger.debug("Hardware update error: %s", e)
 
+
+def announce_delta(result, delta):
+    """Like announce_compile_result, but silent when a re-analysis changed nothing."""
+    if delta["first"] or (result["status"] == "success" and delta["resolved"]):
+        announce_compile_result(result)
+        return
+    summary = describe_delta(delta)
+    if not summary:
+        return  # same diagnostics as last time: nothing new to say
+    speech_queue.say(result["classification"]["error_type"], summary, "female",
+                     priority=PRIORITY_HIGH, channel="compile")
+    update_hardware(result.get("classification", {}))
+
+
+def compile_response(result):
     response = {
         "status": result["status"],
         "raw_error": result.get("raw_error", ""),
@@ -71,10 +193,154 @@ def compile_route():
     # Include program_output if compilation was successful
     if result.get("status") == "success" and "program_output" in result:
         response["program_output"] = result.get("program_output", "")
+    if result.get("build_id"):
+        response["build_id"] = result["build_id"]
+    return response
+
+
+def chat_error_response(e):
+    """Map a chatbot exception to (payload, status) for /chat."""
+    error_msg = str(e)
+
+    if isinstance(e, ModelsUnavailable):
+        return {"error": error_msg, "retry_after": e.retry_after}, 503
+    if isinstance(e, GatewayBusy):
+        return {"error": error_msg, "retry_after": e.retry_after}, 429
+
+    # Quota errors: the model router has already opened that model's breaker,
+    # so the next request goes to another model
+    if "quota" in error_msg.lower() or "429" in error_msg:
+        return {
+            "error": "API quota exceeded. Please wait a moment and try again. The system will automatically try a different model."
+        }, 429
+
+    # Handle API key errors
+    if "api" in error_msg.lower() and "key" in error_msg.lower():
+        return {
+            "error": "API key error. Please check your GEMINI_API_KEY in the .env file."
+        }, 401
+
+    return {"error": f"Internal server error: {error_msg}"}, 500
+
+
+# POST /compile
+@app.route("/compile", methods=["POST"])
+def compile_route():
+    data = request.get_json(force=True)
+    code = data.get("code", "")
+    if not code:
+        return jsonify({"error": "No code provided"}), 400
+
+    result = compile_submission(code)
+    announce_compile_result(result)
+    response = compile_response(result)
     return jsonify(response)
 
 
+# POST /analyze
+# Body: {"code", "mode"?, "session_id"?, "stream"?}
+# One compile, then explanation, corrected code, speech and hardware fanned out server-side.
+# Returns one JSON document; with "stream": true, SSE events compile {...}, token {"text"},
+# autofix {"text"}, fix {"fixed_code", ...}, error {"stage", "error"}, then done {document}.
+@app.route("/analyze", methods=["POST"])
+def analyze_route():
+    data = request.get_json(force=True)
+    code = data.get("code", "")
+    if not code:
+        return jsonify({"error": "No code provided"}), 400
+
+    result = compile_submission(code)
+    events = analysis_pipeline.events(
+        code, result, describe=compile_response, mode=data.get("mode", "student"),
+        session_id=data.get("session_id"),
+        announce=lambda r, delta: announce_delta(r, delta) if delta else announce_compile_result(r),
+    )
+    if data.get("stream"):
+        return sse_response(sse_event(event, payload) for event, payload in events)
+    for event, payload in events:
+        if event == "done":
+            return jsonify(payload)
+
+
+# POST /compile/session
+# Body: {"session_id", "code", "mode"?, "explain"?}
+# Re-analysis for edit-compile loops: the diagnostics come back as a delta against the
+# session's previous submission and only the new ones are sent to Gemini.
+@app.route("/compile/session", methods=["POST"])
+def compile_session_route():
+    data = request.get_json(force=True)
+    code = data.get("code", "")
+    session_id = data.get("session_id")
+    if not code:
+        return jsonify({"error": "No code provided"}), 400
+    if not session_id:
+        return jsonify({"error": "No session_id provided"}), 400
+
+    result = compile_submission(code)
+    delta = analysis_sessions.update(session_id, code, result)
+    response = compile_response(result)
+    response["classification"] = {k: v for k, v in response["classification"].items() if k != "diagnostics"}
+    response["session_id"] = session_id
+    response["delta"] = {key: delta[key] for key in ("new", "unchanged", "resolved")}
+    response["explanations"] = {}
+
+    pending = delta["pending"]
+    if pending and data.get("explain", True):
+        raw_error, classification = explain_input(pending, code)
+        try:
+            explanation = cb.explain_error(raw_error, classification, mode=data.get("mode", "student"))
+            autofix = cb.extract_autofix_block(explanation).strip()
+            explanation_id = analysis_sessions.attach_explanation(session_id, pending, explanation, autofix)
+            response["explanations"][explanation_id] = {"explanation": explanation, "autofix": autofix}
+        except Exception as e:
+            app.logger.error(f"Session explain error: {e}")
+            response["explain_error"] = str(e)
+
+    announce_delta(result, delta)
+    return jsonify(response)
+
+
+# DELETE /compile/session/<session_id>
+@app.route("/compile/session/<session_id>", methods=["DELETE"])
+def compile_session_drop_route(session_id):
+    return jsonify({"dropped": analysis_sessions.drop(session_id)})
+
+
+# Long-lived process pool for batch grading (created on first use). Workers are spawned,
+# not forked: this process already runs compile, sandbox, speech and serial threads.
+def get_batch_pool():
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(max_workers=compile_scheduler.workers,
+                                              mp_context=multiprocessing.get_context("spawn"))
+    return _batch_pool
+
+
+# POST /compile/batch
+# Body: {"sources": [{"name": "a.c", "code": "..."}, ...]}
+# Streams one NDJSON line per file, then a {"summary": ...} line. Files go through the compile
+# scheduler; a full queue is a 429 up front.
+@app.route("/compile/batch", methods=["POST"])
+def compile_batch_route():
+    data = request.get_json(force=True)
+    items = data.get("sources") or []
+    if not items:
+        return jsonify({"error": "No sources provided"}), 400
+    if len(items) > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many sources (max {BATCH_MAX_FILES})"}), 413
+
+    sources = [(item.get("name") or f"source_{i}.c", item.get("code", "")) for i, item in enumerate(items)]
+    compile_scheduler.check_capacity()
+    return Response(
+        stream_with_context(batch_grader.stream_ndjson(sources, executor=get_batch_pool(),
+                                                       scheduler=compile_scheduler)),
+        mimetype="application/x-ndjson"
+    )
+
+
 # POST /explain_error
+# With "code" in the body the explanation comes from the same structured call /autofix uses
 @app.route("/explain_error", methods=["POST"])
 def explain_error_route():
     data = request.get_json(force=True)
@@ -83,9 +349,47 @@ def explain_error_route():
     if not errors:
         return jsonify({"error": "No errors provided"}), 400
 
-    explanation = cb.explain_error(errors, classification)
+    if data.get("code"):
+        analysis = cb.analyze_errors(data["code"], errors, classification, mode=data.get("mode", "student"))
+        return jsonify({"explanation": cb.format_analysis(analysis)})
+    explanation = cb.explain_error(errors, classification, mode=data.get("mode", "student"))
     return jsonify({"explanation": explanation})
 
+# POST /explain_error/stream
+# Events: token {"text"}, autofix {"text"} (incremental AUTO-FIX CODE section),
+#         done {"explanation"}, error {"error"}
+@app.route("/explain_error/stream", methods=["POST"])
+def explain_error_stream_route():
+    data = request.get_json(force=True)
+    errors = data.get("errors") or data.get("raw_error") or ""
+    classification = data.get("classification") or {}
+    mode = data.get("mode", "student")
+    if not errors:
+        return jsonify({"error": "No errors provided"}), 400
+
+    if data.get("code"):
+        chunks = cb.AnalysisStream(data["code"], errors, classification, mode=mode)
+    else:
+        chunks = cb.explain_error_stream(errors, classification, mode=mode)
+
+    def generate():
+        extractor = cb.AutofixStreamExtractor()
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event("token", {"text": chunk})
+                fix = extractor.feed(chunk)
+                if fix:
+                    yield sse_event("autofix", {"text": fix})
+            yield sse_event("done", {"explanation": "".join(parts).strip()})
+        except Exception as e:
+            app.logger.error(f"Explain stream error: {e}")
+            yield sse_event("error", {"error": str(e)})
+
+    return sse_response(generate())
+
+
 @app.route("/autofix", methods=["POST"])
 def autofix_route():
     data = request.get_json(force=True)
@@ -93,59 +397,21 @@ def autofix_route():
     if not code:
         return jsonify({"error": "No code provided"}), 400
 
-    tmp_file = save_code_to_file(code)
-    compile_result = compile_c_program(tmp_file)
+    with workspace_manager.job() as ws:
+        # Only the diagnostics are needed here, so skip assembling and linking
+        compile_result = scheduled_compile(ws.write_source(code), output_file=ws.exe_path, profile="diagnostics")
 
     if compile_result["status"] == "success":
         return jsonify({"fixed_code": code, "diff": "", "note": "No errors found"})
 
-    # 1) Ask for FULL corrected code (preferred)
-    full_fixed = ""
-    try:
-        import google.generativeai as genai
-        # Use the same model from chatbot module
-        model_name = cb.get_available_model()
-        if model_name == "default":
-            model = genai.GenerativeModel()  # Use default model
-        else:
-            model = genai.GenerativeModel(model_name)
-        prompt = f"""
-Return ONLY the full corrected C program, ready to compile. No explanations, no comments, no markdown.
-
-Original C code:
-{code}
-
-Compiler errors:
-{compile_result["raw_error"]}
-
-Rules:
-- Output must be valid C.
-- Do not include backticks or markdown.
-"""
-        resp = model.generate_content(prompt)
-        full_fixed = (getattr(resp, "text", "") or "").strip()
-
-        # strip ``` fences if present
-        if full_fixed.startswith("```"):
-            lines = full_fixed.split("\n")
-            if lines and lines[0].startswith("```"): lines = lines[1:]
-            if lines and lines[-1].strip() == "```": lines = lines[:-1]
-            full_fixed = "\n".join(lines).strip()
-    except Exception:
-        full_fixed = ""
-
-    if full_fixed:
-        return jsonify({"fixed_code": full_fixed, "diff": "", "note": "Full corrected code provided"})
-
-    # 2) Fallback: AUTO-FIX block patching
-    explanation = cb.explain_error(compile_result["raw_error"], compile_result["classification"])
-    autofix_block = cb.extract_autofix_block(explanation).strip()
-    if autofix_block:
-        patched = cb.apply_autofix_patch(code, autofix_block).strip()
-        if patched:
-            return jsonify({"fixed_code": patched, "diff": autofix_block})
-
-    return jsonify({"error": "Autofix content not available", "explanation": explanation}), 400
+    # Candidates are compile-checked and retried; known-good fixes come from the cache
+    fix = autofix_engine.fix(code, compile_result, mode=data.get("mode", "student"))
+    if fix["fixed_code"]:
+        return jsonify({"fixed_code": fix["fixed_code"], "diff": fix["diff"], "note": fix_note(fix),
+                        "verified": fix["verified"], "rounds": fix["rounds"], "cached": fix["cached"],
+                        "remaining_errors": fix["remaining_errors"]})
+
+    return jsonify({"error": "Autofix content not available"}), 400
 
 
 # POST /run
@@ -155,48 +421,34 @@ def run_route():
     code = data.get("code")
     stdin_input = data.get("stdin", "")  # Get stdin input from request
 
-    exe_name = f"{uuid.uuid4().hex}.exe" if os.name == "nt" else f"{uuid.uuid4().hex}.out"
-    exe_path = os.path.join(UPLOAD_DIR, exe_name)
-
-    if code:
-        code_file = save_code_to_file(code)
-        # Don't skip execution here - we want to compile and run with user input
-        cmp_result = compile_c_program(code_file, output_file=exe_path, skip_execution=False)
-        if cmp_result.get("status") != "success":
-            return jsonify({"status": "failed", "stderr": cmp_result.get("raw_error", "")}), 400
-    else:
-        if not os.path.exists(exe_path):
-            return jsonify({"status": "failed", "error": "No executable found"}), 400
-
-    try:
-        # Ensure .exe extension on Windows
-        if os.name == 'nt' and not exe_path.endswith('.exe'):
-            exe_path = exe_path + '.exe'
-        
-        # Run program with user-provided stdin input (not empty/garbage)
-        proc = subprocess.run(
-            [exe_path],
-            input=stdin_input,  # Pass user-provided input to the program
-            capture_output=True,
-            text=True,
-            timeout=10,
-            encoding="utf-8",
-            errors="replace",
-            cwd=os.path.dirname(exe_path) or os.getcwd()  # Run from the directory containing the exe
-        )
-        output = proc.stdout.strip() if proc.stdout else ''
-        if proc.stderr:
-            stderr_msg = proc.stderr.strip()
-            if stderr_msg:
-                output += f"\n{stderr_msg}" if output else stderr_msg
-        return jsonify({"status": "success", "stdout": output, "stderr": proc.stderr or ""})
-    except subprocess.TimeoutExpired:
-        return jsonify({"status": "failed", "error": "Program execution timed out"}), 500
-    except Exception as e:
-        return jsonify({"status": "failed", "error": str(e)}), 500
+    with workspace_manager.job() as ws:
+        # Prefer the binary /compile already built; only compile (once, without running) as a fallback
+        exe_path = restore_build(data.get("build_id"), ws.exe_path)
+        if exe_path is None:
+            if not code:
+                return jsonify({"status": "failed", "error": "No executable found"}), 400
+            cmp_result = scheduled_compile(ws.write_source(code), output_file=ws.exe_path, skip_execution=True)
+            if cmp_result.get("status") != "success":
+                return jsonify({"status": "failed", "stderr": cmp_result.get("raw_error", "")}), 400
+            exe_path = ws.exe_path
+
+        # Run program with user-provided stdin input under the sandbox's resource limits
+        try:
+            result = sandbox.run(exe_path, stdin_input, timeout=10, cwd=ws.path)
+        except Exception as e:
+            return jsonify({"status": "failed", "error": str(e)}), 500
+        if result["timed_out"]:
+            return jsonify({"status": "failed", "error": "Program execution timed out"}), 500
+        output = result["stdout"].strip()
+        stderr_msg = result["stderr"].strip()
+        if stderr_msg:
+            output += f"\n{stderr_msg}" if output else stderr_msg
+        return jsonify({"status": "success", "stdout": output, "stderr": result["stderr"]})
 
 
 # POST /chat
+# Body: {"message", "mode"?, "session_id"?, "tts"?, "voice"?}
+# With a session_id the question is answered in the context of that conversation.
 @app.route("/chat", methods=["POST"])
 def chat_route():
     try:
@@ -209,38 +461,76 @@ def chat_route():
         if not message:
             return jsonify({"error": "No message provided"}), 400
 
-        reply = cb.answer_question(message, mode=mode)
+        reply = cb.answer_question(message, mode=mode, session_id=data.get("session_id"))
         
         if not reply:
             return jsonify({"error": "Empty response from chatbot"}), 500
         
-        try:
-            if data.get("tts", True):  # Only speak if TTS is enabled (default True)
-                speak_emotional("chat", reply, data.get("voice", "female"))
-        except Exception as e:
-            app.logger.debug(f"TTS error: {e}")
+        if data.get("tts", True):  # Only speak if TTS is enabled (default True)
+            speech_queue.say("chat", reply, data.get("voice", "female"), channel="chat")
 
         app.logger.info(f"Chat response sent - Length: {len(reply)}")
         return jsonify({"reply": reply})
     except Exception as e:
-        error_msg = str(e)
         app.logger.error(f"Chat route error: {e}", exc_info=True)
-        
-        # Handle quota errors specifically
-        if "quota" in error_msg.lower() or "429" in error_msg:
-            # Reset model cache to try different model next time
-            cb.reset_model_cache()
-            return jsonify({
-                "error": "API quota exceeded. Please wait a moment and try again. The system will automatically try a different model."
-            }), 429
-        
-        # Handle API key errors
-        if "api" in error_msg.lower() and "key" in error_msg.lower():
-            return jsonify({
-                "error": "API key error. Please check your GEMINI_API_KEY in the .env file."
-            }), 401
-        
-        return jsonify({"error": f"Internal server error: {error_msg}"}), 500
+        payload, status = chat_error_response(e)
+        return jsonify(payload), status
+
+
+# POST /chat/stream
+# Events: token {"text"}, done {"reply"}, error {"error"}
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream_route():
+    data = request.get_json(force=True)
+    message = data.get("message", "")
+    mode = data.get("mode", "student")
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+
+    def generate():
+        parts = []
+        try:
+            for chunk in cb.answer_question_stream(message, mode=mode, session_id=data.get("session_id")):
+                parts.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            yield sse_event("done", {"reply": "".join(parts).strip()})
+        except Exception as e:
+            error_msg = str(e)
+            app.logger.error(f"Chat stream error: {e}")
+            yield sse_event("error", {"error": error_msg})
+
+    return sse_response(generate())
+
+
+# DELETE /chat/session/<session_id>
+@app.route("/chat/session/<session_id>", methods=["DELETE"])
+def chat_session_drop_route(session_id):
+    return jsonify({"dropped": conversations.drop(session_id)})
+
+
+# POST /tts/speak
+@app.route("/tts/speak", methods=["POST"])
+def tts_speak_route():
+    data = request.get_json(force=True)
+    text = data.get("text", "")
+    if not text:
+        return jsonify({"error": "No text provided"}), 400
+    queued = speech_queue.say(data.get("error_type", "chat"), text, data.get("voice", "female"),
+                              channel=data.get("channel", "ui"))
+    return jsonify({"queued": queued}), 202 if queued else 503
+
+
+# POST /tts/stop
+@app.route("/tts/stop", methods=["POST"])
+def tts_stop_route():
+    speech_queue.stop()
+    return jsonify({"ok": True})
+
+
+# GET /tts/status
+@app.route("/tts/status", methods=["GET"])
+def tts_status_route():
+    return jsonify(speech_queue.status())
 
 
 # POST /voice_input
@@ -262,6 +552,96 @@ def hardware_update_route():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+# GET /compile/cache
+@app.route("/compile/cache", methods=["GET"])
+def compile_cache_route():
+    return jsonify(compile_cache.stats())
+
+
+# GET /compile/pch
+@app.route("/compile/pch", methods=["GET"])
+def compile_pch_route():
+    return jsonify(pch_manager.stats())
+
+
+# GET /analyze/status
+@app.route("/analyze/status", methods=["GET"])
+def analyze_status_route():
+    return jsonify(analysis_pipeline.stats())
+
+
+# GET /autofix/status
+@app.route("/autofix/status", methods=["GET"])
+def autofix_status_route():
+    return jsonify(autofix_engine.stats())
+
+
+# GET /compile/sessions
+@app.route("/compile/sessions", methods=["GET"])
+def compile_sessions_route():
+    return jsonify(analysis_sessions.stats())
+
+
+# GET /chat/sessions
+@app.route("/chat/sessions", methods=["GET"])
+def chat_sessions_route():
+    return jsonify(conversations.stats())
+
+
+# GET /explain_error/cache
+@app.route("/explain_error/cache", methods=["GET"])
+def explain_cache_route():
+    return jsonify(llm_cache.stats())
+
+
+# GET /llm/status
+@app.route("/llm/status", methods=["GET"])
+def llm_status_route():
+    return jsonify(llm_gateway.stats())
+
+
+# GET /models/status
+@app.route("/models/status", methods=["GET"])
+def models_status_route():
+    return jsonify(model_router.stats())
+
+
+# GET /explain_error/local
+@app.route("/explain_error/local", methods=["GET"])
+def explain_local_route():
+    return jsonify(local_explainer.stats())
+
+
+# GET /compile/queue
+@app.route("/compile/queue", methods=["GET"])
+def compile_queue_route():
+    return jsonify(compile_scheduler.stats())
+
+
+# GET /workspace/status
+@app.route("/workspace/status", methods=["GET"])
+def workspace_status_route():
+    return jsonify(workspace_manager.stats())
+
+
+# GET /sandbox/status
+@app.route("/sandbox/status", methods=["GET"])
+def sandbox_status_route():
+    return jsonify(sandbox.stats())
+
+
+# GET /startup
+@app.route("/startup", methods=["GET"])
+def startup_route():
+    return jsonify(subsystems.stats())
+
+
+# GET /metrics (Prometheus text format)
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 # GET /hardware/status
 @app.route("/hardware/status", methods=["GET"])
 def hw_status_route():
@@ -274,4 +654,19 @@ def home():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    if "--startup-report" in sys.argv:
+        subsystems.load_all()
+        subsystems.mark("subsystems")
+        print(json.dumps(subsystems.stats(), indent=2))
+        sys.exit(0)
+    debug = True
+    # With debug on, the reloader runs this block twice: in a watcher process that only restarts
+    # the server, and in the child that serves requests (WERKZEUG_RUN_MAIN=true). COM ports are
+    # exclusive on Windows, so only the serving process may open the Arduino.
+    serving = not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    if serving:
+        hw.init_arduino()  # connect in the background before the first compile
+        sandbox.start()  # fork servers ready before the first run
+        pch_manager.warm(GCC_FLAGS)  # precompile the common header prefixes in the background
+    subsystems.mark("warm_up")
+    app.run(host="0.0.0.0", port=5000, debug=debug)
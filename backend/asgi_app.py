@@ -0,0 +1,312 @@
+# asgi_app.py
+"""
+Async serving mode for the CodeMate backend.
+
+The hot routes (/compile, /run, /autofix, /explain_error, /chat and their
+streaming variants) are implemented natively on Quart; gcc jobs share the Flask
+routes' compile_scheduler (awaited, not blocking the loop), and program
+execution and Gemini calls are non-blocking. Every other route falls through to the
+Flask app in app.py, so paths and JSON contracts are identical.
+
+Run with:
+
+    hypercorn asgi_app:application --bind 0.0.0.0:5000
+    # or: uvicorn asgi_app:application --port 5000
+"""
+import asyncio
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, request, jsonify, Response
+from quart.wrappers.response import ResponseBody
+from quart_cors import cors
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+
+import app as flask_backend
+import chatbot as cb
+from app import (restore_build, announce_compile_result, compile_response, chat_error_response, request_user,
+                 request_trace_id, request_route)
+from analysis import fix_note
+from autofix import autofix_engine
+from async_compiler import compile_c_program_async, run_executable_async
+from compile_scheduler import SchedulerBusy, SchedulerTimeout
+from compiler import program_needs_input
+from model_router import ModelsUnavailable
+from llm_gateway import GatewayBusy, current_user
+from metrics import start_trace, finish_trace, current_trace
+from speech_queue import speech_queue
+from workspace import workspace_manager
+
+quart_app = cors(Quart(__name__), allow_origin="*")
+
+
+@quart_app.before_request
+async def set_llm_user():
+    current_user.set(request_user(request.headers, await request.get_json(silent=True), request.remote_addr))
+
+
+@quart_app.before_request
+async def begin_request_trace():
+    start_trace(request_trace_id(request.headers))
+
+
+class _TracedBody(ResponseBody):
+    """
+    A response body that finishes its request's trace once it has been sent.
+    Quart sends the body from another task than the handler's, so the trace and
+    LLM user are set again there for the stages a stream runs (e.g. Gemini calls).
+    """
+
+    def __init__(self, body, trace, user, finish):
+        self._body = body
+        self._trace = trace
+        self._user = user
+        self._finish = finish
+
+    async def __aenter__(self):
+        current_trace.set(self._trace)
+        current_user.set(self._user)
+        return await self._body.__aenter__()
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        try:
+            await self._body.__aexit__(exc_type, exc_value, tb)
+        finally:
+            self._finish()
+
+
+# Like Flask's call_on_close: the trace is logged when the body is done, so streams are timed in full
+@quart_app.after_request
+async def end_request_trace(response):
+    trace = current_trace.get()
+    if trace is None:
+        return response
+    response.headers["X-Request-Id"] = trace.id
+    method, path, route, status = request.method, request.path, request_route(request), response.status_code
+    user = current_user.get()
+    response.response = _TracedBody(response.response, trace, user,
+                                    lambda: finish_trace(trace, method, path, route, status, user=user))
+    return response
+
+
+@quart_app.errorhandler(GatewayBusy)
+async def handle_gateway_busy(e):
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@quart_app.errorhandler(ModelsUnavailable)
+async def handle_models_unavailable(e):
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@quart_app.errorhandler(SchedulerBusy)
+async def handle_scheduler_busy(e):
+    resp = jsonify({"error": "Compiler is busy. Please try again shortly.", "retry_after": e.retry_after})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@quart_app.errorhandler(SchedulerTimeout)
+async def handle_scheduler_timeout(e):
+    resp = jsonify({"error": str(e)})
+    resp.status_code = 504
+    return resp
+
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def sse_response(generator):
+    return Response(generator, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# POST /compile
+@quart_app.route("/compile", methods=["POST"])
+async def compile_route():
+    data = await request.get_json(force=True)
+    code = data.get("code", "")
+    if not code:
+        return jsonify({"error": "No code provided"}), 400
+
+    with workspace_manager.job() as ws:
+        result = await compile_c_program_async(ws.write_source(code), output_file=ws.exe_path,
+                                               skip_execution=program_needs_input(code), workspace=ws)
+    announce_compile_result(result)
+    return jsonify(compile_response(result))
+
+
+# POST /run
+@quart_app.route("/run", methods=["POST"])
+async def run_route():
+    data = await request.get_json(force=True)
+    code = data.get("code")
+    with workspace_manager.job() as ws:
+        exe_path = restore_build(data.get("build_id"), ws.exe_path)
+        if exe_path is None:
+            if not code:
+                return jsonify({"status": "failed", "error": "No executable found"}), 400
+            cmp_result = await compile_c_program_async(ws.write_source(code), output_file=ws.exe_path,
+                                                       skip_execution=True, workspace=ws)
+            if cmp_result.get("status") != "success":
+                return jsonify({"status": "failed", "stderr": cmp_result.get("raw_error", "")}), 400
+            exe_path = ws.exe_path
+
+        try:
+            stdout, stderr, _ = await run_executable_async(exe_path, data.get("stdin", ""), timeout=10)
+        except asyncio.TimeoutError:
+            return jsonify({"status": "failed", "error": "Program execution timed out"}), 500
+        except Exception as e:
+            return jsonify({"status": "failed", "error": str(e)}), 500
+
+    output = stdout.strip()
+    if stderr.strip():
+        output += f"\n{stderr.strip()}" if output else stderr.strip()
+    return jsonify({"status": "success", "stdout": output, "stderr": stderr})
+
+
+# POST /explain_error
+@quart_app.route("/explain_error", methods=["POST"])
+async def explain_error_route():
+    data = await request.get_json(force=True)
+    errors = data.get("errors") or data.get("raw_error") or ""
+    if not errors:
+        return jsonify({"error": "No errors provided"}), 400
+    if data.get("code"):
+        analysis = await cb.analyze_errors_async(data["code"], errors, data.get("classification") or {},
+                                                 mode=data.get("mode", "student"))
+        return jsonify({"explanation": cb.format_analysis(analysis)})
+    explanation = await cb.explain_error_async(errors, data.get("classification") or {},
+                                               mode=data.get("mode", "student"))
+    return jsonify({"explanation": explanation})
+
+
+# POST /explain_error/stream
+@quart_app.route("/explain_error/stream", methods=["POST"])
+async def explain_error_stream_route():
+    data = await request.get_json(force=True)
+    errors = data.get("errors") or data.get("raw_error") or ""
+    if not errors:
+        return jsonify({"error": "No errors provided"}), 400
+
+    async def analysis_chunks():
+        # Structured replies aren't streamed here; the whole analysis arrives as one chunk
+        analysis = await cb.analyze_errors_async(data["code"], errors, data.get("classification") or {},
+                                                 mode=data.get("mode", "student"))
+        yield cb.format_analysis(analysis)
+
+    async def generate():
+        extractor = cb.AutofixStreamExtractor()
+        parts = []
+        if data.get("code"):
+            chunks = analysis_chunks()
+        else:
+            chunks = cb.explain_error_stream_async(errors, data.get("classification") or {},
+                                                   mode=data.get("mode", "student"))
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event("token", {"text": chunk})
+                fix = extractor.feed(chunk)
+                if fix:
+                    yield sse_event("autofix", {"text": fix})
+            yield sse_event("done", {"explanation": "".join(parts).strip()})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    return sse_response(generate())
+
+
+# POST /autofix
+@quart_app.route("/autofix", methods=["POST"])
+async def autofix_route():
+    data = await request.get_json(force=True)
+    code = data.get("code", "")
+    if not code:
+        return jsonify({"error": "No code provided"}), 400
+
+    with workspace_manager.job() as ws:
+        compile_result = await compile_c_program_async(ws.write_source(code), output_file=ws.exe_path,
+                                                       profile="diagnostics", workspace=ws)
+    if compile_result["status"] == "success":
+        return jsonify({"fixed_code": code, "diff": "", "note": "No errors found"})
+
+    fix = await asyncio.to_thread(autofix_engine.fix, code, compile_result, mode=data.get("mode", "student"))
+    if fix["fixed_code"]:
+        return jsonify({"fixed_code": fix["fixed_code"], "diff": fix["diff"], "note": fix_note(fix),
+                        "verified": fix["verified"], "rounds": fix["rounds"], "cached": fix["cached"],
+                        "remaining_errors": fix["remaining_errors"]})
+    return jsonify({"error": "Autofix content not available"}), 400
+
+
+# POST /chat
+@quart_app.route("/chat", methods=["POST"])
+async def chat_route():
+    try:
+        data = await request.get_json(force=True)
+        message = data.get("message", "")
+        mode = data.get("mode", "student")
+        if not message:
+            return jsonify({"error": "No message provided"}), 400
+
+        reply = await cb.answer_question_async(message, mode=mode, session_id=data.get("session_id"))
+        if not reply:
+            return jsonify({"error": "Empty response from chatbot"}), 500
+        if data.get("tts", True):
+            speech_queue.say("chat", reply, data.get("voice", "female"), channel="chat")
+        return jsonify({"reply": reply})
+    except Exception as e:
+        payload, status = chat_error_response(e)
+        return jsonify(payload), status
+
+
+# POST /chat/stream
+@quart_app.route("/chat/stream", methods=["POST"])
+async def chat_stream_route():
+    data = await request.get_json(force=True)
+    message = data.get("message", "")
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+
+    async def generate():
+        parts = []
+        try:
+            async for chunk in cb.answer_question_stream_async(message, mode=data.get("mode", "student"),
+                                                               session_id=data.get("session_id")):
+                parts.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            yield sse_event("done", {"reply": "".join(parts).strip()})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    return sse_response(generate())
+
+
+# --- Dispatcher: native async routes first, everything else via Flask ---
+_flask_asgi = WsgiToAsgi(flask_backend.app)
+_native_routes = quart_app.url_map.bind("localhost")
+
+
+def _is_native(scope):
+    if scope["type"] != "http":
+        return True  # lifespan events go to Quart
+    try:
+        _native_routes.match(scope["path"], method=scope["method"])
+        return True
+    except (NotFound, MethodNotAllowed):
+        return False
+
+
+async def application(scope, receive, send):
+    if _is_native(scope):
+        await quart_app(scope, receive, send)
+    else:
+        await _flask_asgi(scope, receive, send)
@@ -0,0 +1,35 @@
+# async_compiler.py
+"""
+asyncio versions of the compile / run helpers for the ASGI server.
+
+Compiles go through the same compile_scheduler as the Flask routes, so native
+ASGI routes and the routes that fall through to Flask share one gcc worker
+limit, one queue and one compile/cache path (compiler.compile_c_program). The
+event loop only awaits the job. Student programs run in the sandbox on a
+worker thread, so the loop can keep hundreds of requests in flight while they
+wait on child processes.
+"""
+import asyncio
+
+from compiler import compile_c_program
+from compile_scheduler import compile_scheduler
+from sandbox import sandbox
+
+
+async def run_executable_async(exe_path, stdin_text="", timeout=10):
+    """Run a binary in the sandbox without blocking the loop. Returns (stdout, stderr, returncode)."""
+    result = await asyncio.to_thread(sandbox.run, exe_path, stdin_text, timeout)
+    if result["timed_out"]:
+        raise asyncio.TimeoutError()
+    return result["stdout"], result["stderr"], result["returncode"]
+
+
+async def compile_c_program_async(file_path, output_file="output.exe", skip_execution=False, use_cache=True,
+                                  profile="run", workspace=None):
+    """
+    compiler.compile_c_program on a scheduler worker; raises SchedulerBusy / SchedulerTimeout like app.py.
+    Pass the Workspace holding file_path so it outlives a compile whose request is cancelled.
+    """
+    return await compile_scheduler.run_async(compile_c_program, file_path, output_file=output_file,
+                                             skip_execution=skip_execution, use_cache=use_cache, profile=profile,
+                                             workspace=workspace)
@@ -0,0 +1,146 @@
+# autofix.py
+"""
+Verify-and-retry autofix.
+
+A fix from Gemini is only handed out after it compiles. Each candidate is
+checked with the fast "diagnostics" profile (-fsyntax-only, no link); if it
+still fails, Gemini is asked again with the candidate and its new errors, for
+at most AUTOFIX_MAX_ROUNDS candidates and within AUTOFIX_BUDGET_S seconds.
+
+Verified fixes are cached by (source hash, diagnostics hash), so the same
+broken submission gets its known-good fix instantly and without an API call:
+
+    fix = autofix_engine.fix(code, compile_result)
+    fix["fixed_code"], fix["verified"], fix["rounds"], fix["cached"]
+
+When no candidate compiles, the one with the fewest errors is returned with
+"verified": False (and its remaining diagnostics) rather than nothing.
+
+Environment:
+    AUTOFIX_MAX_ROUNDS   candidates compiled per request (3)
+    AUTOFIX_BUDGET_S     time allowed for retries (30)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import chatbot as cb
+from compile_scheduler import compile_scheduler
+from compiler import compile_c_program
+from llm_cache import llm_cache, normalize_diagnostics
+from workspace import workspace_manager
+
+AUTOFIX_MAX_ROUNDS = int(os.getenv("AUTOFIX_MAX_ROUNDS", "3"))
+AUTOFIX_BUDGET_S = float(os.getenv("AUTOFIX_BUDGET_S", "30"))
+
+
+def fix_key(code, raw_error):
+    """Verified-fix cache key: hash of the source plus hash of its normalized diagnostics."""
+    source_hash = hashlib.sha256(code.encode("utf-8", errors="replace")).hexdigest()
+    diag_hash = hashlib.sha256(normalize_diagnostics(raw_error).encode("utf-8", errors="replace")).hexdigest()
+    return f"verified_fix:{source_hash}:{diag_hash}"
+
+
+def check_compiles(code):
+    """Syntax-only compile of a candidate through the shared compile pool."""
+    with workspace_manager.job() as ws:
+        return compile_scheduler.run(compile_c_program, ws.write_source(code), output_file=ws.exe_path,
+                                     profile="diagnostics")
+
+
+def first_candidate(code, analysis):
+    """(candidate, diff) from a structured analysis: the full program, else the patched lines."""
+    if analysis.get("fixed_program"):
+        return analysis["fixed_program"], ""
+    block = (analysis.get("fixed_lines") or "").strip()
+    if not block:
+        return "", ""
+    return cb.apply_autofix_patch(code, block).strip(), block
+
+
+class AutofixEngine:
+    """Compiles every candidate fix and re-prompts with the new errors until one builds."""
+
+    def __init__(self, max_rounds=AUTOFIX_MAX_ROUNDS, budget=AUTOFIX_BUDGET_S, cache=llm_cache):
+        self.max_rounds = max_rounds
+        self.budget = budget
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+        self.verified = 0
+        self.unverified = 0
+        self.llm_retries = 0
+        self.rounds_hist = {}   # candidates compiled -> verified fixes that needed that many
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def fix(self, code, compile_result, mode="student", analysis=None, deadline=None):
+        """
+        Return {"fixed_code", "diff", "verified", "cached", "rounds", "remaining_errors"}.
+        analysis is a chatbot.analyze_errors() result when the caller already has one;
+        deadline (time.monotonic()) tightens the engine's own budget.
+        """
+        self._count("requests")
+        key = fix_key(code, compile_result["raw_error"])
+        cached = self.cache.get(key)
+        if cached:
+            self._count("cache_hits")
+            return dict(json.loads(cached), cached=True, rounds=0)
+
+        start = time.monotonic()
+        deadline = min(deadline or float("inf"), start + self.budget)
+        if analysis is None:
+            analysis = cb.analyze_errors(code, compile_result["raw_error"], compile_result["classification"], mode=mode)
+        candidate, diff = first_candidate(code, analysis)
+
+        best, seen, rounds = None, set(), 0
+        while candidate and candidate not in seen and rounds < self.max_rounds:
+            seen.add(candidate)
+            rounds += 1
+            check = check_compiles(candidate)
+            if check["status"] == "success":
+                fix = {"fixed_code": candidate, "diff": diff, "verified": True, "remaining_errors": ""}
+                self.cache.put(key, json.dumps(fix))
+                self._count("verified")
+                with self._lock:
+                    self.rounds_hist[rounds] = self.rounds_hist.get(rounds, 0) + 1
+                return dict(fix, cached=False, rounds=rounds)
+
+            errors = check["classification"].get("error_count", 0)
+            if best is None or errors < best[0]:
+                best = (errors, candidate, diff, check["raw_error"])
+            if rounds >= self.max_rounds or time.monotonic() >= deadline:
+                break
+            self._count("llm_retries")
+            candidate, diff = cb.retry_fix(code, candidate, check["raw_error"]), ""
+
+        self._count("unverified")
+        if best is None:
+            return {"fixed_code": "", "diff": "", "verified": False, "cached": False, "rounds": rounds,
+                    "remaining_errors": ""}
+        _, candidate, diff, remaining = best
+        return {"fixed_code": candidate, "diff": diff, "verified": False, "cached": False, "rounds": rounds,
+                "remaining_errors": remaining}
+
+    def stats(self):
+        with self._lock:
+            attempts = self.verified + self.unverified
+            return {
+                "max_rounds": self.max_rounds,
+                "budget_s": self.budget,
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "verified": self.verified,
+                "unverified": self.unverified,
+                "verify_rate": round(self.verified / attempts, 3) if attempts else 0.0,
+                "llm_retries": self.llm_retries,
+                "rounds": {str(k): v for k, v in sorted(self.rounds_hist.items())},
+            }
+
+
+autofix_engine = AutofixEngine()
@@ -0,0 +1,209 @@
+# batch_grader.py
+"""
+Batch grading: compile and classify many C sources across a process pool.
+
+Used by POST /compile/batch and from the command line:
+
+    python batch_grader.py temp_submissions/ --workers 8 > results.ndjson
+
+Each graded file is emitted as one NDJSON line; the final line is a
+{"summary": {...}} record with the severity histogram, the most common
+error types and p50/p95 compile time. Duplicate sources are compile-cache
+hits that take well under a millisecond, so the percentiles cover cold
+compiles only; cache hits are counted and reported separately.
+
+In the server, files go through compile_scheduler (grade_scheduled), so a
+batch shares the gcc worker limit with interactive compiles.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from compile_scheduler import SchedulerBusy
+from compiler import compile_c_program
+
+DEFAULT_WORKERS = os.cpu_count() or 2
+
+
+# --- Worker side ---
+def grade_source(name, code):
+    """Compile one source in a scratch directory and return its grading record."""
+    with tempfile.TemporaryDirectory(prefix="grade_") as tmp:
+        src = os.path.join(tmp, "submission.c")
+        with open(src, "w", encoding="utf-8", errors="replace") as f:
+            f.write(code)
+        result = compile_c_program(src, output_file=os.path.join(tmp, "submission.exe"),
+                                   skip_execution=True)
+
+    cls = result.get("classification", {})
+    return {
+        "file": name,
+        "status": result.get("status"),
+        "error_type": cls.get("error_type", "Unknown Error"),
+        "error_count": cls.get("error_count", 0),
+        "warning_count": cls.get("warning_count", 0),
+        "severity_percent": cls.get("severity_percent", 0),
+        "severity_label": cls.get("severity_label", "Unknown"),
+        "severity_level": cls.get("severity_level", 0),
+        "compile_time_ms": cls.get("compile_time_ms", 0),
+        "cached": bool(result.get("cached")),
+    }
+
+
+def failed_record(name, error):
+    return {
+        "file": name, "status": "failed", "error_type": "Unknown Error",
+        "error_count": 0, "warning_count": 0, "severity_percent": 0,
+        "severity_label": "Unknown", "severity_level": 0,
+        "compile_time_ms": 0, "cached": False, "error": str(error),
+    }
+
+
+# --- Aggregation ---
+def percentile(values, pct):
+    """Nearest-rank percentile (values need not be sorted)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(records, wall_time_s=None, top_n=5):
+    compiled = [r for r in records if "error" not in r]  # failed_record: gcc never ran
+    cold = [r["compile_time_ms"] for r in compiled if not r.get("cached")]
+    cached = [r["compile_time_ms"] for r in compiled if r.get("cached")]
+    summary = {
+        "total": len(records),
+        "passed": sum(1 for r in records if r["status"] == "success"),
+        "failed": sum(1 for r in records if r["status"] != "success"),
+        "severity_histogram": dict(Counter(r["severity_label"] for r in records)),
+        "top_error_types": Counter(
+            r["error_type"] for r in records if r["status"] != "success"
+        ).most_common(top_n),
+        "compile_time_ms_p50": percentile(cold, 50),
+        "compile_time_ms_p95": percentile(cold, 95),
+        "cache_hits": len(cached),
+        "cached_compile_time_ms_p50": percentile(cached, 50),
+    }
+    if wall_time_s is not None:
+        summary["wall_time_s"] = round(wall_time_s, 3)
+    return summary
+
+
+# --- Driver ---
+def grade_many(sources, workers=DEFAULT_WORKERS, executor=None):
+    """
+    Grade (name, code) pairs in parallel, yielding records as they finish.
+    Pass an existing executor to reuse a long-lived pool (the Flask route does).
+    """
+    own_pool = executor is None
+    pool = executor or ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(grade_source, name, code): name for name, code in sources}
+        for fut in as_completed(futures):
+            try:
+                yield fut.result()
+            except Exception as e:
+                yield failed_record(futures[fut], e)
+    finally:
+        if own_pool:
+            pool.shutdown(wait=True)
+
+
+def _grade_in_pool(executor, name, code):
+    return executor.submit(grade_source, name, code).result()
+
+
+def grade_scheduled(sources, executor, scheduler):
+    """
+    Grade (name, code) pairs through the scheduler's queue, at most scheduler.workers
+    at a time; each job runs in the process pool. When the queue is full the batch
+    waits for its own jobs (or the scheduler's Retry-After) instead of failing.
+    """
+    pending = deque(sources)
+    in_flight = {}
+    while pending or in_flight:
+        while pending and len(in_flight) < scheduler.workers:
+            name, code = pending[0]
+            try:
+                future = scheduler.submit(_grade_in_pool, executor, name, code)
+            except SchedulerBusy as e:
+                if in_flight:
+                    break
+                time.sleep(e.retry_after)
+                continue
+            pending.popleft()
+            in_flight[future] = name
+        if not in_flight:
+            continue
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = in_flight.pop(fut)
+            try:
+                yield fut.result()
+            except Exception as e:
+                yield failed_record(name, e)
+
+
+def stream_ndjson(sources, workers=DEFAULT_WORKERS, executor=None, scheduler=None):
+    """Yield NDJSON lines for every graded source, followed by the summary line."""
+    start = time.time()
+    records = []
+    graded = (grade_scheduled(sources, executor, scheduler) if scheduler is not None
+              else grade_many(sources, workers=workers, executor=executor))
+    for rec in graded:
+        records.append(rec)
+        yield json.dumps(rec) + "\n"
+    yield json.dumps({"summary": summarize(records, time.time() - start)}) + "\n"
+
+
+def collect_paths(inputs):
+    """Expand directories and globs into a sorted list of .c files."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(glob.glob(os.path.join(item, "*.c")))
+        else:
+            paths.extend(glob.glob(item) or [item])
+    return sorted(set(paths))
+
+
+def _read_sources(paths):
+    for p in paths:
+        with open(p, "r", encoding="utf-8", errors="replace") as f:
+            yield p, f.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile and grade many C submissions.")
+    parser.add_argument("inputs", nargs="+", help=".c files, globs or directories")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--out", help="write NDJSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    paths = collect_paths(args.inputs)
+    if not paths:
+        print("No .c files found.", file=sys.stderr)
+        return 1
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        for line in stream_ndjson(_read_sources(paths), workers=args.workers):
+            out.write(line)
+            out.flush()
+    finally:
+        if args.out:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
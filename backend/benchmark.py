@@ -0,0 +1,437 @@
+# benchmark.py
+"""
+Reproducible benchmark for the compile → classify → severity pipeline.
+
+    python benchmark.py --out bench.json                    # full run
+    python benchmark.py --baseline bench.json --out new.json  # compare, exit 1 on regression
+    python benchmark.py --stages needs_input,classify,severity --repeat 5
+
+The corpus is fixed: every .c file in backend/temp_submissions and programs/,
+in sorted order (override with --corpus). Reported per stage: p50/p95/p99/max
+latency; plus throughput of cold compiles at several concurrency levels,
+peak RSS of the benchmark process and of gcc, and file-system churn in the
+directories the pipeline writes to.
+
+gcc's peak RSS cannot come from RUSAGE_CHILDREN: a child forked from this
+process starts with its memory, so the figure is never below our own. Instead
+a small helper interpreter spawns gcc on every corpus file and takes the
+largest os.wait4 ru_maxrss (cc1 included). The helper's own ~8 MB is the
+floor; POSIX only.
+
+Stages:
+    needs_input     compiler.program_needs_input
+    compile         compile_c_program, cache off ("run" profile, no execution)
+    compile_cached  compile_c_program, cache hit
+    diagnostics     compile_c_program with the "diagnostics" profile, cache off
+    classify        compiler.classify_error on the gcc output of failing files
+    severity        compiler.calculate_severity_engine on their counts
+    severity_batch  severity.SeverityModel.score_batch on the same records (time per record;
+                    environment.severity_backend says whether NumPy was used)
+    execute         sandbox run of files that compile and read no input
+    route_compile   POST /compile through the Flask test client, cache cleared
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep side effects quiet: no speech, no serial port (importing app for route_compile
+# would otherwise start the hardware manager thread)
+os.environ.setdefault("TTS_DRIVER", "none")
+os.environ.setdefault("SERIAL_PORT", "none")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from batch_grader import percentile
+from compile_cache import compile_cache, get_gcc_version
+from severity import BATCH_BACKEND, default_model
+from compiler import (
+    GCC_FLAGS, program_needs_input, compile_c_program, classify_error, calculate_severity_engine, gcc_command,
+    run_program,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = [os.path.join(HERE, "temp_submissions"), os.path.join(HERE, "..", "programs")]
+ALL_STAGES = ["needs_input", "compile", "compile_cached", "diagnostics", "classify", "severity",
+              "severity_batch", "execute", "route_compile"]
+DEFAULT_CONCURRENCY = [1, 4, 16]
+DEFAULT_TOLERANCE = 0.15  # 15% slower than baseline counts as a regression
+MIN_DELTA_MS = 0.05  # ...and by more than this, so microsecond noise is not flagged
+MICRO_LOOPS = 200  # pure-Python stages are timed over many calls
+
+
+# --- Corpus ---
+def load_corpus(dirs, limit=None):
+    paths = []
+    for d in dirs:
+        paths.extend(glob.glob(os.path.join(d, "*.c")))
+    paths = sorted(set(os.path.normpath(p) for p in paths))[:limit]
+    corpus = []
+    for p in paths:
+        with open(p, "r", encoding="utf-8", errors="replace") as f:
+            corpus.append((os.path.relpath(p, HERE), f.read()))
+    return corpus
+
+
+def corpus_digest(corpus):
+    h = hashlib.sha256()
+    for name, code in corpus:
+        h.update(name.encode() + b"\0" + code.encode("utf-8", "replace") + b"\0")
+    return h.hexdigest()[:16]
+
+
+# --- Measurement helpers ---
+def latency_summary(samples_ms):
+    return {
+        "n": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 4),
+        "p95_ms": round(percentile(samples_ms, 95), 4),
+        "p99_ms": round(percentile(samples_ms, 99), 4),
+        "max_ms": round(max(samples_ms), 4) if samples_ms else 0.0,
+        "total_s": round(sum(samples_ms) / 1000, 3),
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def _compile(code, tmp, **kwargs):
+    src = os.path.join(tmp, "main.c")
+    with open(src, "w", encoding="utf-8", errors="replace") as f:
+        f.write(code)
+    return compile_c_program(src, output_file=os.path.join(tmp, "main.out"), skip_execution=True, **kwargs)
+
+
+# Runs as "python -I -S -c": reads a JSON list of gcc argvs, prints the largest ru_maxrss
+_GCC_RSS_HELPER = """
+import json, os, sys
+peak = 0
+for argv in json.load(sys.stdin):
+    pid = os.posix_spawnp(argv[0], argv, os.environ)
+    peak = max(peak, os.wait4(pid, 0)[2].ru_maxrss)
+print(peak)
+"""
+
+
+def gcc_peak_rss_kb(corpus):
+    """Largest gcc peak RSS over the corpus ("run" profile flags), or None where unmeasurable."""
+    if not corpus or not hasattr(os, "wait4") or not hasattr(os, "posix_spawnp"):
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        commands = []
+        for i, (_, code) in enumerate(corpus):
+            src = os.path.join(tmp, f"f{i}.c")
+            with open(src, "w", encoding="utf-8", errors="replace") as f:
+                f.write(code)
+            commands.append(gcc_command(GCC_FLAGS, src, os.path.join(tmp, f"f{i}.out")))
+        try:
+            out = subprocess.run([sys.executable, "-I", "-S", "-c", _GCC_RSS_HELPER], input=json.dumps(commands),
+                                 capture_output=True, text=True, timeout=60 + 10 * len(commands))
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+    if out.returncode != 0:
+        return None
+    scale = 1024 if sys.platform == "darwin" else 1  # macOS reports bytes
+    return int(out.stdout) // scale
+
+
+def peak_rss_kb(corpus):
+    """Peak resident set size of this process and of gcc (see the module docstring)."""
+    if resource is None:
+        return {"self_kb": None, "gcc_kb": None}
+    scale = 1024 if sys.platform == "darwin" else 1  # macOS reports bytes
+    return {
+        "self_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        "gcc_kb": gcc_peak_rss_kb(corpus),
+    }
+
+
+def _io_blocks():
+    if resource is None:
+        return 0
+    return sum(resource.getrusage(who).ru_oublock
+               for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def _count_entries(path):
+    total = 0
+    for _, dirs, files in os.walk(path):
+        total += len(files) + len(dirs)
+    return total
+
+
+def watched_dirs():
+    from workspace import workspace_manager
+    from pch import pch_manager
+    return {
+        "workspaces": workspace_manager.root,
+        "temp_submissions": os.path.join(HERE, "temp_submissions"),
+        "pch_cache": pch_manager.base,
+        "system_tmp": tempfile.gettempdir(),
+    }
+
+
+def fs_snapshot():
+    return {name: _count_entries(path) if os.path.isdir(path) else 0 for name, path in watched_dirs().items()}
+
+
+# --- Stages ---
+def bench_stages(corpus, stages, repeat):
+    results = {}
+    outputs = {}  # name -> compile result, reused by classify/severity/execute
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        if "needs_input" in stages:
+            samples = []
+            for _ in range(repeat):
+                for _, code in corpus:
+                    ms, _ = _timed(lambda: [program_needs_input(code) for _ in range(MICRO_LOOPS)])
+                    samples.append(ms / MICRO_LOOPS)
+            results["needs_input"] = latency_summary(samples)
+
+        if {"compile", "classify", "severity", "severity_batch", "execute"} & set(stages):
+            samples = []
+            for _ in range(repeat if "compile" in stages else 1):
+                for name, code in corpus:
+                    ms, res = _timed(_compile, code, tmp, use_cache=False)
+                    samples.append(ms)
+                    outputs[name] = res
+            if "compile" in stages:
+                results["compile"] = latency_summary(samples)
+
+        if "compile_cached" in stages:
+            compile_cache.clear()
+            for _, code in corpus:
+                _compile(code, tmp)  # fill
+            samples = []
+            for _ in range(repeat):
+                for _, code in corpus:
+                    samples.append(_timed(_compile, code, tmp)[0])
+            results["compile_cached"] = latency_summary(samples)
+
+        if "diagnostics" in stages:
+            samples = []
+            for _ in range(repeat):
+                for _, code in corpus:
+                    samples.append(_timed(_compile, code, tmp, use_cache=False, profile="diagnostics")[0])
+            results["diagnostics"] = latency_summary(samples)
+
+        failing = [r for r in outputs.values() if r["status"] != "success" and r.get("raw_error")]
+        if "classify" in stages and failing:
+            samples = []
+            for _ in range(repeat):
+                for r in failing:
+                    samples.append(_timed(classify_error, r["raw_error"])[0])
+            results["classify"] = latency_summary(samples)
+
+        if "severity" in stages and failing:
+            samples = []
+            for _ in range(repeat):
+                for r in failing:
+                    cls = r["classification"]
+                    args = (cls["error_count"], cls["warning_count"], cls["error_type"])
+                    ms, _ = _timed(lambda: [calculate_severity_engine(*args) for _ in range(MICRO_LOOPS)])
+                    samples.append(ms / MICRO_LOOPS)
+            results["severity"] = latency_summary(samples)
+
+        if "severity_batch" in stages and failing:
+            classes = [r["classification"] for r in failing] * MICRO_LOOPS
+            errors = [c["error_count"] for c in classes]
+            warnings = [c["warning_count"] for c in classes]
+            codes = default_model.encode_types([c["error_type"] for c in classes])
+            samples = []
+            for _ in range(repeat):
+                ms, _ = _timed(default_model.score_batch, errors, warnings, codes)
+                samples.append(ms / len(classes))
+            results["severity_batch"] = latency_summary(samples)
+
+        if "execute" in stages:
+            runnable = [code for name, code in corpus
+                        if outputs.get(name, {}).get("status") == "success" and not program_needs_input(code)]
+            samples = []
+            for code in runnable:
+                _compile(code, tmp)  # binary lands in tmp/main.out
+                for _ in range(repeat):
+                    samples.append(_timed(run_program, os.path.join(tmp, "main.out"))[0])
+            if samples:
+                results["execute"] = latency_summary(samples)
+
+    if "route_compile" in stages:
+        import app as flask_backend
+        client = flask_backend.app.test_client()
+        samples = []
+        for _ in range(repeat):
+            for _, code in corpus:
+                compile_cache.clear()
+                ms, resp = _timed(client.post, "/compile", json={"code": code})
+                samples.append(ms)
+        results["route_compile"] = latency_summary(samples)
+
+    return results
+
+
+def bench_throughput(corpus, levels):
+    """Cold compiles of the whole corpus at each concurrency level."""
+    out = []
+    for level in levels:
+        latencies = []
+
+        def one(code):
+            with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+                ms, _ = _timed(_compile, code, tmp, use_cache=False)
+                return ms
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            latencies = list(pool.map(one, [code for _, code in corpus]))
+        wall = time.perf_counter() - start
+        out.append({
+            "concurrency": level,
+            "files": len(corpus),
+            "wall_s": round(wall, 3),
+            "files_per_s": round(len(corpus) / wall, 2) if wall else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+        })
+    return out
+
+
+def environment_info(corpus):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=HERE).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "gcc": get_gcc_version(),
+        "severity_backend": BATCH_BACKEND,
+        "git_commit": commit,
+        "corpus_files": len(corpus),
+        "corpus_digest": corpus_digest(corpus),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_benchmark(corpus, stages=ALL_STAGES, repeat=3, concurrency=DEFAULT_CONCURRENCY):
+    fs_before, blocks_before = fs_snapshot(), _io_blocks()
+    start = time.perf_counter()
+    report = {
+        "environment": environment_info(corpus),
+        "stages": bench_stages(corpus, stages, repeat),
+        "throughput": bench_throughput(corpus, concurrency) if concurrency else [],
+    }
+    fs_after = fs_snapshot()
+    report["fs_churn"] = {
+        "entries_left_behind": {k: fs_after[k] - fs_before[k] for k in fs_before},
+        "blocks_written": _io_blocks() - blocks_before,
+    }
+    report["peak_rss"] = peak_rss_kb(corpus)  # after fs_churn: the gcc measurement writes files too
+    report["wall_s"] = round(time.perf_counter() - start, 3)
+    return report
+
+
+# --- Baseline comparison ---
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE, min_delta_ms=MIN_DELTA_MS):
+    """List of regressions (metric, baseline, current, change) beyond tolerance."""
+    regressions = []
+    if report["environment"].get("corpus_digest") != baseline.get("environment", {}).get("corpus_digest"):
+        print("⚠️ Corpus differs from the baseline; comparison is indicative only.", file=sys.stderr)
+
+    for stage, cur in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if (base[metric] > 0 and cur[metric] > base[metric] * (1 + tolerance)
+                    and cur[metric] - base[metric] > min_delta_ms):
+                regressions.append((f"{stage}.{metric}", base[metric], cur[metric],
+                                    round(cur[metric] / base[metric] - 1, 3)))
+
+    base_tp = {t["concurrency"]: t for t in baseline.get("throughput", [])}
+    for cur in report["throughput"]:
+        base = base_tp.get(cur["concurrency"])
+        if base and base["files_per_s"] > 0 and cur["files_per_s"] < base["files_per_s"] * (1 - tolerance):
+            regressions.append((f"throughput@{cur['concurrency']}.files_per_s", base["files_per_s"],
+                                cur["files_per_s"], round(cur["files_per_s"] / base["files_per_s"] - 1, 3)))
+
+    for key in ("self_kb", "gcc_kb"):
+        base_rss = baseline.get("peak_rss", {}).get(key)
+        cur_rss = report["peak_rss"].get(key)
+        if base_rss and cur_rss and cur_rss > base_rss * (1 + tolerance):
+            regressions.append((f"peak_rss.{key}", base_rss, cur_rss, round(cur_rss / base_rss - 1, 3)))
+    return regressions
+
+
+def print_table(report):
+    print(f"{'stage':16s} {'n':>6s} {'p50 ms':>10s} {'p95 ms':>10s} {'p99 ms':>10s}", file=sys.stderr)
+    for stage, s in report["stages"].items():
+        print(f"{stage:16s} {s['n']:6d} {s['p50_ms']:10.4f} {s['p95_ms']:10.4f} {s['p99_ms']:10.4f}",
+              file=sys.stderr)
+    for t in report["throughput"]:
+        print(f"concurrency {t['concurrency']:3d}: {t['files_per_s']:8.2f} files/s  p95 {t['p95_ms']:.1f} ms",
+              file=sys.stderr)
+    print(f"peak RSS: {report['peak_rss']}  fs churn: {report['fs_churn']}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compile/classify/severity pipeline.")
+    parser.add_argument("--corpus", action="append", help="directory of .c files (repeatable)")
+    parser.add_argument("--limit", type=int, help="only the first N files of the corpus")
+    parser.add_argument("--stages", default=",".join(ALL_STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                        help="comma-separated levels; empty to skip")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="saved report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS)
+    args = parser.parse_args(argv)
+
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(ALL_STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+
+    corpus = load_corpus(args.corpus or DEFAULT_CORPUS, args.limit)
+    if not corpus:
+        parser.error("corpus is empty")
+    report = run_benchmark(corpus, stages, args.repeat, levels)
+    print_table(report)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for metric, base, cur, change in regressions:
+            print(f"❌ {metric}: {base} → {cur} ({change:+.1%})", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
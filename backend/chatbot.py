@@ -1,126 +1,43 @@
-import google.generativeai as genai
+import difflib
+import json
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+from diagnostics import diagnostics_for_prompt, format_diagnostics
+from llm_cache import llm_cache, make_key
+from conversation import conversations
+from local_explainer import local_explainer
+from llm_gateway import llm_gateway, GatewayBusy
+from model_router import model_router, ModelsUnavailable, is_rate_limit
 
-# Validate API key
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY not found in environment variables. Please check your .env file.")
+load_dotenv()
 
-genai.configure(api_key=api_key)
-print(f"✅ Gemini API configured successfully")
+# google.generativeai is imported and configured on the first call (see startup.py);
+# a missing GEMINI_API_KEY fails that call instead of the whole backend. Model
+# discovery, client reuse, health scoring and failover live in model_router.py;
+# every call goes through llm_gateway.py for rate limits and single-flight.
 
-# Cache for available model name
-_available_model = None
 
 def reset_model_cache():
-    """Reset the cached model - useful if quota errors occur"""
-    global _available_model
-    _available_model = None
-
-def get_available_model():
-    """Get an available Gemini model by listing models from the API"""
-    global _available_model
-    if _available_model:
-        return _available_model
-    
-    print("🔍 Listing available models from API...")
-    try:
-        # List all available models
-        models = genai.list_models()
-        available_models = []
-        
-        for model in models:
-            # Check if model supports generateContent
-            if 'generateContent' in model.supported_generation_methods:
-                model_name = model.name
-                # Skip experimental models
-                if 'exp' in model_name.lower() or 'experimental' in model_name.lower():
-                    continue
-                # Prefer flash models (faster, free tier friendly)
-                if 'flash' in model_name.lower():
-                    available_models.insert(0, model_name)  # Add flash models to front
-                else:
-                    available_models.append(model_name)
-        
-        if available_models:
-            # Use the first available model (prefer flash)
-            _available_model = available_models[0]
-            print(f"✅ Found {len(available_models)} available model(s)")
-            print(f"✅ Using model: {_available_model}")
-            return _available_model
-        else:
-            print("⚠️  No models found that support generateContent")
-    except Exception as e:
-        print(f"⚠️  Error listing models: {e}")
-    
-    # Fallback: try common model names
-    print("🔄 Trying fallback model names...")
-    fallback_models = [
-        "gemini-1.5-flash",      # Most common free tier model
-        "gemini-pro",            # Classic model
-        "gemini-1.0-pro",        # Alternative
-    ]
-    
-    for model_name in fallback_models:
-        try:
-            # Try with models/ prefix
-            test_model = genai.GenerativeModel(f"models/{model_name}")
-            _available_model = f"models/{model_name}"
-            print(f"✅ Using fallback model: {_available_model}")
-            return _available_model
-        except Exception as e1:
-            try:
-                # Try without prefix
-                test_model = genai.GenerativeModel(model_name)
-                _available_model = model_name
-                print(f"✅ Using fallback model: {_available_model}")
-                return model_name
-            except Exception as e2:
-                print(f"⚠️  Tried {model_name}, errors: {str(e1)[:80]}, {str(e2)[:80]}")
-                continue
-    
-    # Last resort: use default
-    try:
-        print("🔄 Trying default model...")
-        test_model = genai.GenerativeModel()
-        _available_model = "default"
-        print(f"✅ Using default model")
-        return "default"
-    except Exception as e:
-        raise Exception(f"Could not find any available Gemini model. Please check your API key. Error: {e}")
-
+    """Forget the discovered models so the next call lists them again."""
+    model_router.invalidate()
 
-# chatbot.py (replace only the answer_question function with this)
 
-def answer_question(user_question, mode="student"):
-    """
-    Answer general programming questions.
-    mode: "student" (clear, educational) or "pro" (concise, technical)
-    """
-    # Get the specified model
-    model_name = get_available_model()
+def _chunk_text(chunk):
+    """Text of one streamed chunk ('' for chunks without text parts)."""
     try:
-        if model_name == "default":
-            model = genai.GenerativeModel()  # Use default model
-        else:
-            model = genai.GenerativeModel(model_name)
-        print(f"✅ Model initialized: {model_name}")
-    except Exception as e:
-        error_msg = str(e)
-        print(f"❌ Error creating model with {model_name}: {e}")
-        # Reset cache and try again
-        reset_model_cache()
-        raise Exception(f"Could not initialize Gemini model '{model_name}'. Please check your API key and model availability. Error: {error_msg}")
+        return chunk.text
+    except (AttributeError, ValueError, IndexError):
+        return ""
 
+
+# Static tutor instructions, built once and reused on every turn; only the
+# conversation so far and the question are appended per call.
+CHAT_PROMPTS = {
     # Student/learner prompt (clear, educational, medium-sized)
-    student_prompt = f"""
+    "student": """
 You are CodeMate, a friendly and patient C programming tutor for students.
 
-The user asked: "{user_question}"
-
 TASKS (Student mode):
 1. Give a clear, understandable explanation suitable for a student learning C programming.
 2. Start with a simple definition or overview (1-2 sentences).
@@ -131,14 +48,11 @@ TASKS (Student mode):
 7. IMPORTANT: Keep your response between 150-200 words. Be concise but thorough.
 8. Use simple language - avoid jargon unless you explain it.
 9. Structure your answer with clear paragraphs for readability.
-"""
-
+""",
     # Pro prompt (concise, technical, medium-sized)
-    pro_prompt = f"""
+    "pro": """
 You are CodeMate, an expert C programmer and systems engineer.
 
-The user asked: "{user_question}"
-
 TASKS (Pro mode):
 1. Provide a concise, technical explanation (2-3 sentences covering the core concept).
 2. Show the exact minimal code or fix if relevant (inline code block, 2-5 lines max).
@@ -148,25 +62,64 @@ TASKS (Pro mode):
 6. IMPORTANT: Keep your response between 100-150 words. Be precise and to the point.
 7. Focus on actionable information - what they need to know to solve the problem.
 8. Avoid unnecessary background - assume they understand C fundamentals.
-"""
+""",
+}
 
-    prompt = student_prompt if mode == "student" else pro_prompt
 
-    # Add generation config to help control response length
+def format_history(history):
+    """Conversation section of the chat prompt ('' for a new conversation)."""
+    if not history or not (history["summary"] or history["turns"]):
+        return ""
+    parts = ["Conversation so far (use it to understand follow-up questions):"]
+    if history["summary"]:
+        parts.append("Earlier in this conversation:\n" + history["summary"])
+    parts.extend(f"User: {question}\nCodeMate: {answer}" for question, answer in history["turns"])
+    return "\n\n".join(parts) + "\n\n"
+
+
+def build_chat_prompt(user_question, mode="student", history=None):
+    instructions = CHAT_PROMPTS["student" if mode == "student" else "pro"]
+    return f"{instructions}\n{format_history(history)}The user asked: \"{user_question}\"\n"
+
+
+def _chat_history(session_id):
+    return conversations.context(session_id) if session_id else None
+
+
+def _remember(session_id, question, answer):
+    if session_id and answer:
+        conversations.record(session_id, question, answer)
+
+
+def chat_generation_config(mode="student"):
     # Token limits: ~1.3 tokens per word, so 200 tokens ≈ 150 words, 250 tokens ≈ 190 words
+    return {
+        "max_output_tokens": 250 if mode == "student" else 180,
+        "temperature": 0.7,
+    }
+
+
+def answer_question(user_question, mode="student", session_id=None):
+    """
+    Answer general programming questions.
+    mode: "student" (clear, educational) or "pro" (concise, technical)
+    With a session_id, earlier turns of that conversation go with the question.
+    """
+    prompt = build_chat_prompt(user_question, mode, _chat_history(session_id))
+
+    # Add generation config to help control response length
     try:
-        generation_config = {
-            "max_output_tokens": 250 if mode == "student" else 180,
-            "temperature": 0.7,
-        }
+        generation_config = chat_generation_config(mode)
         print(f"📤 Sending request to Gemini API (mode: {mode})...")
-        response = model.generate_content(prompt, generation_config=generation_config)
+        response = llm_gateway.generate(prompt, generation_config=generation_config)
         print(f"✅ Received response from Gemini API")
     except Exception as e:
+        if isinstance(e, (ModelsUnavailable, GatewayBusy)) or is_rate_limit(e):
+            raise  # retrying without the config won't help; the router has already failed over
         # Fallback if generation_config causes issues
         print(f"⚠️  Warning: generation_config failed, using default: {e}")
         try:
-            response = model.generate_content(prompt)
+            response = llm_gateway.generate(prompt)
             print(f"✅ Received response from Gemini API (without config)")
         except Exception as e2:
             print(f"❌ Error generating content: {e2}")
@@ -176,33 +129,42 @@ TASKS (Pro mode):
     try:
         text = response.text.strip()
         print(f"✅ Successfully extracted response ({len(text)} characters)")
-        return text
     except AttributeError:
         try:
             text = response.candidates[0].content.parts[0].text.strip()
             print(f"✅ Successfully extracted response from candidates ({len(text)} characters)")
-            return text
         except (AttributeError, IndexError, KeyError) as e:
             print(f"❌ Error extracting response: {e}")
             print(f"Response object: {response}")
             return f"Error generating response. Please try again. (Mode: {mode})"
+    _remember(session_id, user_question, text)
+    return text
 
 
-def explain_error(error_message, classification):
+def answer_question_stream(user_question, mode="student", session_id=None):
     """
-    Explain compiler errors and provide fixes.
-    This is ONLY for compiler output, NOT for chat questions.
+    Streaming variant of answer_question: yields text chunks as Gemini produces them.
+    The turn is remembered once the stream completes.
     """
-    # Get the specified model
-    model_name = get_available_model()
-    try:
-        model = genai.GenerativeModel(model_name)
-    except Exception as e:
-        error_msg = str(e)
-        print(f"❌ Error creating model with {model_name}: {e}")
-        raise Exception(f"Could not initialize Gemini model '{model_name}'. Please check your API key and model availability. Error: {error_msg}")
-
-    prompt = f"""
+    prompt = build_chat_prompt(user_question, mode, _chat_history(session_id))
+    print(f"📤 Streaming request to Gemini API (mode: {mode})...")
+    config = chat_generation_config(mode)
+    parts = []
+    with llm_gateway.use(prompt, generation_config=config) as model:
+        response = model.generate_content(prompt, generation_config=config, stream=True)
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+    _remember(session_id, user_question, "".join(parts).strip())
+
+
+def build_explain_prompt(error_message, classification):
+    per_line = diagnostics_for_prompt(classification.get("diagnostics") or [])
+    per_line_section = f"\nDiagnostics by line:\n{per_line}\n" if per_line else ""
+
+    return f"""
 You are CodeMate, an expert C programming tutor.
 
 Compiler Output:
@@ -211,7 +173,7 @@ Compiler Output:
 Error Type: {classification['error_type']}
 Errors: {classification['error_count']}
 Warnings: {classification['warning_count']}
-
+{per_line_section}
 TASKS:
 1. Give a SIMPLE explanation in 2–3 lines.
 2. List the FIX in bullet points.
@@ -223,7 +185,31 @@ FIX:
 AUTO-FIX CODE:
 """
 
-    response = model.generate_content(prompt)
+
+def local_explanation(classification):
+    """Formatted local explanation when the rules cover every diagnostic, else ''."""
+    local, unhandled = local_explainer.analyze(classification.get("diagnostics") or [], need_fix=False)
+    return format_analysis(local) if local and not unhandled else ""
+
+
+def explain_error(error_message, classification, mode="student", use_cache=True):
+    """
+    Explain compiler errors and provide fixes.
+    This is ONLY for compiler output, NOT for chat questions.
+    Responses are cached on the normalized diagnostics + classification + mode;
+    diagnostics the local rules fully cover never reach Gemini.
+    """
+    local = local_explanation(classification)
+    if local:
+        return local
+    cache_key = make_key("explain_error", error_message, classification, mode)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            print("✅ Explanation served from cache")
+            return cached
+
+    response = llm_gateway.generate(build_explain_prompt(error_message, classification))
 
     # ✅ Safely extract Gemini response
     try:
@@ -231,6 +217,194 @@ AUTO-FIX CODE:
     except:
         text = response.candidates[0].content.parts[0].text.strip()
 
+    llm_cache.put(cache_key, text)
+    return text
+
+
+def explain_error_stream(error_message, classification, mode="student", use_cache=True):
+    """
+    Streaming variant of explain_error. Yields text chunks; the full text is
+    cached once the stream completes, and cache hits are yielded as one chunk.
+    """
+    local = local_explanation(classification)
+    if local:
+        yield local
+        return
+    cache_key = make_key("explain_error", error_message, classification, mode)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            yield cached
+            return
+
+    parts = []
+    prompt = build_explain_prompt(error_message, classification)
+    with llm_gateway.use(prompt) as model:
+        response = model.generate_content(prompt, stream=True)
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+
+    llm_cache.put(cache_key, "".join(parts).strip())
+
+
+# --- Async variants (used by the ASGI server) ---
+def _response_text(response):
+    try:
+        return response.text.strip()
+    except (AttributeError, ValueError):
+        return response.candidates[0].content.parts[0].text.strip()
+
+
+async def answer_question_async(user_question, mode="student", session_id=None):
+    response = await llm_gateway.generate_async(
+        build_chat_prompt(user_question, mode, _chat_history(session_id)), generation_config=chat_generation_config(mode)
+    )
+    text = _response_text(response)
+    _remember(session_id, user_question, text)
+    return text
+
+
+async def answer_question_stream_async(user_question, mode="student", session_id=None):
+    prompt = build_chat_prompt(user_question, mode, _chat_history(session_id))
+    config = chat_generation_config(mode)
+    parts = []
+    async with llm_gateway.use_async(prompt, generation_config=config) as model:
+        response = await model.generate_content_async(prompt, generation_config=config, stream=True)
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+    _remember(session_id, user_question, "".join(parts).strip())
+
+
+async def explain_error_async(error_message, classification, mode="student", use_cache=True):
+    local = local_explanation(classification)
+    if local:
+        return local
+    cache_key = make_key("explain_error", error_message, classification, mode)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            return cached
+    response = await llm_gateway.generate_async(build_explain_prompt(error_message, classification))
+    text = _response_text(response)
+    llm_cache.put(cache_key, text)
+    return text
+
+
+async def explain_error_stream_async(error_message, classification, mode="student", use_cache=True):
+    local = local_explanation(classification)
+    if local:
+        yield local
+        return
+    cache_key = make_key("explain_error", error_message, classification, mode)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            yield cached
+            return
+    parts = []
+    prompt = build_explain_prompt(error_message, classification)
+    async with llm_gateway.use_async(prompt) as model:
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+    llm_cache.put(cache_key, "".join(parts).strip())
+
+
+class AutofixStreamExtractor:
+    """
+    Incrementally pulls the AUTO-FIX CODE section out of a streamed explanation.
+    feed() returns the new auto-fix text contained in each chunk ('' until the
+    header has been seen, which may arrive split across chunks).
+    """
+    HEADER = "AUTO-FIX CODE:"
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = None  # offset in _buffer where unseen auto-fix text starts
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        if self._pos is None:
+            idx = self._buffer.find(self.HEADER)
+            if idx < 0:
+                return ""
+            self._pos = idx + len(self.HEADER)
+        new = self._buffer[self._pos:]
+        self._pos = len(self._buffer)
+        return new
+
+    @property
+    def found(self):
+        return self._pos is not None
+
+
+def build_full_fix_prompt(code, raw_error):
+    return f"""
+Return ONLY the full corrected C program, ready to compile. No explanations, no comments, no markdown.
+
+Original C code:
+{code}
+
+Compiler errors:
+{raw_error}
+
+Rules:
+- Output must be valid C.
+- Do not include backticks or markdown.
+"""
+
+
+def build_retry_fix_prompt(code, candidate, raw_error):
+    return f"""
+Your corrected C program still does not compile. Return ONLY the full corrected program, ready to compile.
+No explanations, no comments, no markdown.
+
+Original C code:
+{code}
+
+Your previous correction:
+{candidate}
+
+Compiler errors for your correction:
+{raw_error}
+
+Rules:
+- Fix every error listed above without changing what the program does.
+- Output must be valid C.
+- Do not include backticks or markdown.
+"""
+
+
+def retry_fix(code, candidate, raw_error, use_cache=True):
+    """Ask again after a candidate fix failed to compile; returns the new candidate program."""
+    cache_key = make_key("retry_fix", raw_error, None, "", source=code + "\0" + candidate)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            return cached
+    response = llm_gateway.generate(build_retry_fix_prompt(code, candidate, raw_error))
+    text = strip_code_fences(_response_text(response))
+    llm_cache.put(cache_key, text)
+    return text
+
+
+def strip_code_fences(text):
+    """Remove ``` fences Gemini sometimes adds despite being told not to."""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        lines = text.split("\n")
+        if lines and lines[0].startswith("```"): lines = lines[1:]
+        if lines and lines[-1].strip() == "```": lines = lines[:-1]
+        text = "\n".join(lines).strip()
     return text
 
 
@@ -242,19 +416,298 @@ def extract_autofix_block(explanation_text):
     return explanation_text.split("AUTO-FIX CODE:")[1].strip()
 
 
+PATCH_MIN_SIMILARITY = 0.6
+
+
 def apply_autofix_patch(original_code, autofix_block):
     """
     Rewrites the entire C file using the AUTO-FIX block Gemini provides.
-    AUTO-FIX block contains ONLY corrected lines, so we replace them inside the code.
+    AUTO-FIX block contains ONLY corrected lines: each one replaces the single most
+    similar original line (keeping its indentation); lines with no close match are skipped.
     """
 
     fixed_code_lines = original_code.split("\n")
     patch_lines = [line.strip("- ").strip() for line in autofix_block.split("\n") if line.strip()]
+    stripped = [line.strip() for line in fixed_code_lines]
+    used = set()
 
-    # Replace matching lines in original file
     for p in patch_lines:
-        for i in range(len(fixed_code_lines)):
-            if p.split("(")[0] in fixed_code_lines[i]:  # loose pattern match
-                fixed_code_lines[i] = p
+        best, best_ratio = None, PATCH_MIN_SIMILARITY
+        matcher = difflib.SequenceMatcher(None, "", p)
+        for i, line in enumerate(stripped):
+            if i in used or not line:
+                continue
+            matcher.set_seq1(line)
+            if matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = i, ratio
+        if best is not None:
+            indent = fixed_code_lines[best][:len(fixed_code_lines[best]) - len(fixed_code_lines[best].lstrip())]
+            fixed_code_lines[best] = indent + p
+            used.add(best)
+
+    return "\n".join(fixed_code_lines)
+
+
+# --- Structured analysis: explanation + fix + corrected program in ONE call ---
+# /explain_error, /autofix and /analyze all read from this (cached per source + mode).
+# Property names sort with "explanation" first, so it streams out before the code.
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "explanation": {"type": "string"},
+        "fix_steps": {"type": "array", "items": {"type": "string"}},
+        "fixed_lines": {"type": "string"},
+        "fixed_program": {"type": "string"},
+    },
+    "required": ["explanation", "fix_steps", "fixed_lines", "fixed_program"],
+}
+ANALYSIS_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": ANALYSIS_SCHEMA}
+
+
+def build_analysis_prompt(code, error_message, classification, focus=None):
+    per_line = diagnostics_for_prompt(classification.get("diagnostics") or [])
+    per_line_section = f"\nDiagnostics by line:\n{per_line}\n" if per_line else ""
+    focus_section = f"\nExplain ONLY these diagnostics (the others were explained before):\n{focus}\n" if focus else ""
+
+    return f"""
+You are CodeMate, an expert C programming tutor.
+
+C program:
+{code}
+
+Compiler Output:
+{error_message}
+
+Error Type: {classification.get('error_type', 'Unknown Error')}
+Errors: {classification.get('error_count', 0)}
+Warnings: {classification.get('warning_count', 0)}
+{per_line_section}{focus_section}
+Answer in JSON:
+- explanation: a SIMPLE explanation in 2–3 lines.
+- fix_steps: the FIX as short bullet points.
+- fixed_lines: ONLY the corrected lines, one per line.
+- fixed_program: the FULL corrected program, ready to compile. Valid C, no markdown, no backticks.
+"""
+
+
+def parse_analysis(text):
+    """Normalize a structured reply; plain EXPLANATION/FIX text (e.g. from an old cache) is accepted too."""
+    try:
+        data = json.loads(strip_code_fences(text))
+        if not isinstance(data, dict):
+            raise ValueError("not an object")
+    except ValueError:
+        return {"explanation": (text or "").strip(), "fix_steps": [], "fixed_lines": extract_autofix_block(text or ""),
+                "fixed_program": ""}
+    steps = data.get("fix_steps") or []
+    return {
+        "explanation": str(data.get("explanation") or "").strip(),
+        "fix_steps": [str(s).strip() for s in (steps if isinstance(steps, list) else [steps]) if str(s).strip()],
+        "fixed_lines": strip_code_fences(str(data.get("fixed_lines") or "")),
+        "fixed_program": strip_code_fences(str(data.get("fixed_program") or "")),
+    }
+
+
+def format_analysis(analysis):
+    """Render an analysis in the EXPLANATION / FIX / AUTO-FIX CODE layout the UI and extractors expect."""
+    if analysis["explanation"].startswith("EXPLANATION:"):
+        return analysis["explanation"]  # already in that layout
+    return (f"EXPLANATION:\n{analysis['explanation']}" + _analysis_tail(analysis)).strip()
+
+
+def _analysis_tail(analysis):
+    fix = "\n".join(f"- {step}" for step in analysis["fix_steps"])
+    return f"\n\nFIX:\n{fix}\n\nAUTO-FIX CODE:\n{analysis['fixed_lines']}"
+
+
+def _analysis_key(code, mode, focus):
+    return make_key("analysis", focus or "", None, mode, source=code)
+
+
+def _local_first(code, classification, records, focus):
+    """
+    Run the local rules over records (default: every diagnostic). Returns (local
+    analysis or None, focus for Gemini or None, whether Gemini is needed at all).
+    """
+    explicit = records is not None
+    if not explicit:
+        records = classification.get("diagnostics") or []
+    local, unhandled = local_explainer.analyze(records, code)
+    if local is not None and not unhandled:
+        return local, None, False
+    if focus is None and (local is not None or explicit):
+        focus = format_diagnostics(unhandled, code)
+    return local, focus, True
+
+
+def merge_analysis(local, remote):
+    """Local rule output first, then Gemini's; Gemini's program fixes everything, so it wins."""
+    if local is None:
+        return remote
+    return {
+        "explanation": "\n".join(part for part in (local["explanation"], remote["explanation"]) if part),
+        "fix_steps": local["fix_steps"] + [s for s in remote["fix_steps"] if s not in local["fix_steps"]],
+        "fixed_lines": "\n".join(part for part in (local["fixed_lines"], remote["fixed_lines"]) if part),
+        "fixed_program": remote["fixed_program"] or local["fixed_program"],
+    }
+
+
+def analyze_errors(code, error_message, classification, mode="student", focus=None, records=None, use_cache=True):
+    """
+    Returns {"explanation", "fix_steps", "fixed_lines", "fixed_program"}.
+    Diagnostics the local rules cover are answered offline; the rest (or only
+    `records`, when given) go to one Gemini call, cached on the exact source +
+    mode (+ focus). Identical concurrent requests share the call (llm_gateway).
+    """
+    local, focus, remote = _local_first(code, classification, records, focus)
+    if not remote:
+        return local
+    return merge_analysis(local, _analyze_remote(code, error_message, classification, mode, focus, use_cache))
+
+
+def _analyze_remote(code, error_message, classification, mode, focus, use_cache):
+    cache_key = _analysis_key(code, mode, focus)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            return parse_analysis(cached)
+
+    response = llm_gateway.generate(build_analysis_prompt(code, error_message, classification, focus),
+                                    generation_config=ANALYSIS_GENERATION_CONFIG)
+    text = _response_text(response)
+    llm_cache.put(cache_key, text)
+    return parse_analysis(text)
+
+
+class AnalysisStream:
+    """
+    Streaming analyze_errors: iterating yields the formatted explanation text as it
+    arrives (the JSON "explanation" field is decoded incrementally); .result holds the
+    parsed analysis once iteration finishes.
+    """
+
+    def __init__(self, code, error_message, classification, mode="student", focus=None, records=None,
+                 use_cache=True):
+        self.args = (code, error_message, classification, focus, records)
+        self.mode = mode
+        self.use_cache = use_cache
+        self.result = None
+
+    def __iter__(self):
+        code, error_message, classification, focus, records = self.args
+        local, focus, remote = _local_first(code, classification, records, focus)
+        if not remote:
+            self.result = local
+            yield format_analysis(local)
+            return
+
+        cache_key = _analysis_key(code, self.mode, focus)
+        cached = llm_cache.get(cache_key) if self.use_cache else None
+        if cached:
+            self.result = merge_analysis(local, parse_analysis(cached))
+            yield format_analysis(self.result)
+            return
+
+        field = JsonStringFieldStream("explanation")
+        parts = []
+        yield "EXPLANATION:\n" + (local["explanation"] + "\n" if local else "")
+        prompt = build_analysis_prompt(code, error_message, classification, focus)
+        with llm_gateway.use(prompt, generation_config=ANALYSIS_GENERATION_CONFIG) as model:
+            response = model.generate_content(prompt, generation_config=ANALYSIS_GENERATION_CONFIG, stream=True)
+            for chunk in response:
+                text = _chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    piece = field.feed(text)
+                    if piece:
+                        yield piece
+        raw = "".join(parts).strip()
+        analysis = parse_analysis(raw)
+        llm_cache.put(cache_key, raw)
+        self.result = merge_analysis(local, analysis)
+        # Everything after the explanation (fix steps, corrected lines) arrives as one chunk
+        if field.value.strip() == analysis["explanation"]:
+            yield _analysis_tail(self.result).rstrip()
+        else:  # the reply wasn't the JSON asked for; send it whole
+            yield format_analysis(analysis).removeprefix("EXPLANATION:").lstrip("\n")
+
+
+async def analyze_errors_async(code, error_message, classification, mode="student", focus=None, records=None,
+                               use_cache=True):
+    local, focus, remote = _local_first(code, classification, records, focus)
+    if not remote:
+        return local
+    cache_key = _analysis_key(code, mode, focus)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            return merge_analysis(local, parse_analysis(cached))
+    response = await llm_gateway.generate_async(build_analysis_prompt(code, error_message, classification, focus),
+                                                 generation_config=ANALYSIS_GENERATION_CONFIG)
+    text = _response_text(response)
+    llm_cache.put(cache_key, text)
+    return merge_analysis(local, parse_analysis(text))
+
+
+class JsonStringFieldStream:
+    """
+    Incrementally decodes one top-level string field from streamed JSON text.
+    feed() returns the newly decoded characters ('' until the field starts or
+    while an escape sequence is split across chunks).
+    """
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self, name):
+        self.marker = f'"{name}"'
+        self._buffer = ""
+        self._pos = None   # offset in _buffer of the next undecoded character
+        self.done = False
+        self.value = ""
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        if self.done:
+            return ""
+        if self._pos is None:
+            idx = self._buffer.find(self.marker)
+            if idx < 0:
+                return ""
+            rest = self._buffer[idx + len(self.marker):].lstrip()
+            if not rest.startswith(":"):
+                return ""
+            rest = rest[1:].lstrip()
+            if not rest.startswith('"'):
+                return ""
+            self._pos = len(self._buffer) - len(rest) + 1
+
+        out = []
+        buf, i = self._buffer, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            if i + 1 >= len(buf):
+                break  # escape split across chunks
+            esc = buf[i + 1]
+            if esc == "u":
+                if i + 6 > len(buf):
+                    break
+                out.append(chr(int(buf[i + 2:i + 6], 16)))
+                i += 6
+            else:
+                out.append(self._ESCAPES.get(esc, esc))
+                i += 2
+        self._pos = i
+        text = "".join(out)
+        self.value += text
+        return text
 
-    return "\n".join(fixed_code_lines)
\ No newline at end of file
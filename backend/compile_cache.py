@@ -0,0 +1,127 @@
+# compile_cache.py
+"""
+Content-addressed cache for gcc results.
+
+Entries are keyed on a hash of the source text, the gcc flags and the gcc
+version, so editing the code, changing flags or upgrading the compiler all
+produce a new key. Each entry holds the gcc diagnostics, the classification
+result and (for successful builds) the compiled binary.
+"""
+import hashlib
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+# Default limits (override with COMPILE_CACHE_MAX_ENTRIES / COMPILE_CACHE_MAX_MB)
+DEFAULT_MAX_ENTRIES = int(os.getenv("COMPILE_CACHE_MAX_ENTRIES", "512"))
+DEFAULT_MAX_BYTES = int(os.getenv("COMPILE_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+_gcc_version = None
+_gcc_version_lock = threading.Lock()
+
+
+def get_gcc_version():
+    """Return the gcc version string (looked up once per process)."""
+    global _gcc_version
+    if _gcc_version is not None:
+        return _gcc_version
+    with _gcc_version_lock:
+        if _gcc_version is None:
+            try:
+                out = subprocess.run(
+                    ["gcc", "--version"],
+                    capture_output=True, text=True, encoding="utf-8", errors="replace"
+                )
+                _gcc_version = (out.stdout.splitlines() or ["unknown"])[0].strip()
+            except Exception:
+                _gcc_version = "unknown"
+    return _gcc_version
+
+
+def make_cache_key(source_text, flags, gcc_version=None):
+    """Hash source + flags + gcc version into a hex cache key."""
+    h = hashlib.sha256()
+    h.update((gcc_version or get_gcc_version()).encode("utf-8"))
+    h.update(b"\0")
+    h.update(" ".join(flags).encode("utf-8"))
+    h.update(b"\0")
+    h.update(source_text.encode("utf-8", errors="replace"))
+    return h.hexdigest()
+
+
+class CompileCache:
+    """Thread-safe LRU cache with an entry-count and a total-size limit."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(entry):
+        return len(entry.get("binary") or b"") + len(entry.get("raw_error") or "")
+
+    def get(self, key):
+        """Return the cached entry for key (and mark it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, status, raw_error, classification, binary=None, source_path=""):
+        """Store a compile result. Entries larger than max_bytes are not cached."""
+        entry = {
+            "status": status,
+            "raw_error": raw_error,
+            "classification": dict(classification),
+            "binary": binary,
+            "source_path": source_path,
+            "created_at": time.time(),
+        }
+        size = self._entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= self._entry_size(old)
+            self._entries[key] = entry
+            self._size += size
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._entry_size(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared process-wide cache used by compiler.compile_c_program
+compile_cache = CompileCache()
@@ -0,0 +1,204 @@
+# compile_scheduler.py
+"""
+Bounded worker pool for gcc jobs.
+
+A fixed number of worker threads pull jobs from a FIFO queue. When the queue
+is full, submit() raises SchedulerBusy instead of forking yet another
+compiler, and app.py turns that into a 429 with a Retry-After header.
+
+run()'s timeout (COMPILE_JOB_TIMEOUT) bounds the wait for a worker only. A job
+that has started can't be stopped from here, and its caller's workspace must
+outlive it, so it is left to gcc's and the sandbox's own timeouts. The default
+is at least GCC_TIMEOUT plus the run timeout.
+"""
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from compiler import GCC_TIMEOUT, RUN_TIMEOUT
+from metrics import COMPILE_QUEUE_SECONDS
+
+DEFAULT_WORKERS = int(os.getenv("COMPILE_WORKERS", "0")) or (os.cpu_count() or 2)
+DEFAULT_QUEUE_SIZE = int(os.getenv("COMPILE_QUEUE_SIZE", "0")) or DEFAULT_WORKERS * 4
+DEFAULT_JOB_TIMEOUT = max(float(os.getenv("COMPILE_JOB_TIMEOUT", "30")), GCC_TIMEOUT + RUN_TIMEOUT)
+
+
+class SchedulerBusy(Exception):
+    """Raised when the job queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Compile queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a job did not get a worker within its timeout."""
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "enqueued_at", "context", "started")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.context = contextvars.copy_context()  # the submitter's request trace and LLM user
+        self.started = Future()  # resolved when a worker picks the job up
+
+
+class CompileScheduler:
+    """Fixed-size thread pool with a bounded FIFO queue and wait-time stats."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 job_timeout=DEFAULT_JOB_TIMEOUT):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.job_timeout = job_timeout
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        # Sliding windows of recent wait / service times (seconds)
+        self._waits = deque(maxlen=256)
+        self._service = deque(maxlen=256)
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"compile-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                # Skip jobs whose caller already gave up
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                job.started.set_result(None)
+                started = time.monotonic()
+                with self._lock:
+                    self._running += 1
+                    self._waits.append(started - job.enqueued_at)
+                try:
+                    job.future.set_result(job.context.run(self._run_job, job, started))
+                except BaseException as e:
+                    job.future.set_exception(e)
+                finally:
+                    with self._lock:
+                        self._running -= 1
+                        self._completed += 1
+                        self._service.append(time.monotonic() - started)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _run_job(job, started):
+        COMPILE_QUEUE_SECONDS.observe(started - job.enqueued_at)
+        return job.fn(*job.args, **job.kwargs)
+
+    def retry_after(self):
+        """Rough seconds until a queue slot frees up (at least 1)."""
+        with self._lock:
+            avg = (sum(self._service) / len(self._service)) if self._service else 1.0
+        depth = self._queue.qsize()
+        return max(1, int(round(avg * (depth + 1) / self.workers)))
+
+    def check_capacity(self):
+        """Raise SchedulerBusy now if the queue is full (for requests that queue jobs later)."""
+        if self._queue.full():
+            with self._lock:
+                self._rejected += 1
+            raise SchedulerBusy(self.retry_after())
+
+    def _enqueue(self, fn, args, kwargs):
+        self._ensure_started()
+        job = _Job(fn, args, kwargs)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise SchedulerBusy(self.retry_after())
+        return job
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); returns a Future or raises SchedulerBusy."""
+        return self._enqueue(fn, args, kwargs).future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Submit and wait for the result. The timeout applies to the wait for a worker;
+        once the job runs it is waited for to the end.
+        """
+        timeout = timeout or self.job_timeout
+        job = self._enqueue(fn, args, kwargs)
+        try:
+            job.started.result(timeout)
+        except FutureTimeout:
+            self._give_up(job, timeout)
+        return job.future.result()
+
+    async def run_async(self, fn, *args, timeout=None, workspace=None, **kwargs):
+        """
+        run() for the ASGI server: the job still runs on a worker thread, the loop just awaits it.
+
+        If the awaiting task is cancelled (client gone, route timeout) a queued job is
+        dropped; one that is already running can't be stopped, so the workspace it
+        uses, if given, is kept until it finishes.
+        """
+        timeout = timeout or self.job_timeout
+        job = self._enqueue(fn, args, kwargs)
+        if workspace is not None:
+            workspace.keep_until(job.future)
+        try:
+            # asyncio.wait, not wait_for: on 3.11 wait_for drops a cancel that races the job starting
+            started, _ = await asyncio.wait([asyncio.wrap_future(job.started)], timeout=timeout)
+            if not started:
+                self._give_up(job, timeout)
+            return await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+
+    def _give_up(self, job, timeout):
+        """Withdraw a job that is still queued; one that just started is waited for as usual."""
+        if job.future.cancel():
+            with self._lock:
+                self._timed_out += 1
+            raise SchedulerTimeout(f"Compile job waited more than {timeout}s for a worker")
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queue_depth": self._queue.qsize(),
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "max_wait_ms": round(waits[-1] * 1000, 2) if waits else 0.0,
+                "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+            }
+
+
+# Shared scheduler used by the Flask routes
+compile_scheduler = CompileScheduler()
@@ -4,6 +4,13 @@ import time
 import os
 from colorama import Fore, Style, init
 
+from compile_cache import compile_cache, make_cache_key
+from metrics import GCC_SECONDS
+from diagnostics import diagnostic_flags, parse_gcc_output, summarize_diagnostics, format_diagnostics
+from sandbox import sandbox
+from pch import pch_manager
+from severity import default_model
+
 init(autoreset=True)
 
 # --- Input Detection ---
@@ -24,177 +31,297 @@ def program_needs_input(code):
     return any(re.search(pattern, code_lower) for pattern in input_patterns)
 
 # --- Error Classifier ---
-def classify_error(gcc_output):
-    output = gcc_output.lower()
-    classification = {
-        "error_type": "Unknown Error",
-        "error_count": len(re.findall(r"\berror:", output)),
-        "warning_count": len(re.findall(r"\bwarning:", output))
-    }
+def classify_diagnostics(records):
+    """
+    Build the classification dict from parsed diagnostics.
+    Each record is scored individually through calculate_severity_engine.
+    """
+    classification = summarize_diagnostics(records)
+    for r in records:
+        if not r["error_type"]:
+            continue
+        r.update(calculate_severity_engine(
+            1 if r["severity"] in ("error", "fatal error") else 0,
+            1 if r["severity"] == "warning" else 0,
+            r["error_type"]
+        ))
+    classification["diagnostics"] = records
+    return classification
 
-    if "expected" in output or "syntax error" in output:
-        classification["error_type"] = "Syntax Error"
-    elif "undeclared" in output:
-        classification["error_type"] = "Undeclared Variable"
-    elif "uninitialized" in output:
-        classification["error_type"] = "Uninitialized Variable"
-    elif "format" in output and "printf" in output:
-        classification["error_type"] = "Type Error"
-    elif classification["warning_count"] > 0 and classification["error_count"] == 0:
-        classification["error_type"] = "Warning"
-    elif classification["error_count"] == 0 and classification["warning_count"] == 0:
-        classification["error_type"] = "No Error"
 
-    return classification
+def classify_error(gcc_output):
+    """Classify raw gcc output (JSON or plain text)."""
+    records, _ = parse_gcc_output(gcc_output)
+    return classify_diagnostics(records)
 
 
 # --- Severity Model ---
 def calculate_severity_engine(error_count, warning_count, error_type, mode="pro"):
-    error_type_levels = {
-        "Syntax Error": 4,
-        "Type Error": 3,
-        "Semantic Error": 3,
-        "Runtime Error": 3,
-        "Undeclared Variable": 3,
-        "Uninitialized Variable": 2,
-        "Warning": 1,
-        "No Error": 0,
-        "Unknown Error": 2
+    """Score one submission with the default severity model (see severity.py for batch scoring)."""
+    return default_model.score(error_count, warning_count, error_type, mode)
+
+
+# --- Execution Helpers ---
+GCC_FLAGS = ["-Wall"]
+# Compile profiles: "run" links an executable; "diagnostics" stops after parsing and
+# type checking (no assembler or linker), for callers that only need the errors.
+# Without a link step a misspelled call (prinf) would pass, so implicit declarations
+# are promoted to errors there.
+COMPILE_PROFILES = {
+    "run": [],
+    "diagnostics": ["-fsyntax-only", "-Werror=implicit-function-declaration"],
+}
+GCC_TIMEOUT = float(os.getenv("GCC_TIMEOUT", "20"))  # kill runaway compiles
+RUN_TIMEOUT = 3  # automatic run after a compile (the program shouldn't need input)
+
+
+def resolve_exe_path(output_file):
+    """gcc appends .exe on Windows; return the path the binary actually lands at."""
+    if os.name == 'nt' and not output_file.endswith('.exe'):
+        return output_file + '.exe'
+    return output_file
+
+
+INPUT_REQUIRED_MSG = "(Program requires input. Please provide input and run the program.)"
+
+
+def format_program_output(stdout, stderr):
+    """Combine a program's stdout/stderr the way the UI expects."""
+    program_output = (stdout or "").strip()
+    if stderr:
+        stderr_msg = stderr.strip()
+        if stderr_msg:
+            program_output += f"\n{stderr_msg}" if program_output else stderr_msg
+    if not program_output:
+        program_output = "(Program executed successfully with no output)"
+    return program_output
+
+
+def run_program(exe_path):
+    """Run a compiled program in the sandbox with empty stdin and return its combined output."""
+    try:
+        # Short timeout, since we know it shouldn't need input
+        result = sandbox.run(exe_path, "", timeout=RUN_TIMEOUT)
+    except Exception as run_e:
+        return f"Error running program: {str(run_e)}"
+    if result["timed_out"]:
+        # Program took too long (unexpected for programs without input)
+        return "(Program execution timed out. It may require input.)"
+    return format_program_output(result["stdout"], result["stderr"])
+
+
+def observe_compile_time(compile_time_ms, cached, status):
+    GCC_SECONDS.observe(compile_time_ms / 1000, cached="true" if cached else "false", status=status)
+
+
+def _success_result(program_output, compile_time_ms, cached=False, build_id=None):
+    observe_compile_time(compile_time_ms, cached, "success")
+    return {
+        "status": "success",
+        "message": "Compilation successful",
+        "program_output": program_output,
+        "raw_error": "",
+        "cached": cached,
+        "build_id": build_id,
+        "classification": {
+            "error_type": "No Error",
+            "error_count": 0,
+            "warning_count": 0,
+            "severity_percent": 0,
+            "severity_label": "No Error",
+            "severity_level": 0,
+            "compile_time_ms": compile_time_ms
+        }
     }
-    S_to_score = {0: 0, 1: 25, 2: 50, 3: 75, 4: 100}
-
-    A_level = error_type_levels.get(error_type, 2)
-    A_score = S_to_score[A_level]
-
-    if A_level >= 4: B_level = 4
-    elif A_level == 3: B_level = 3
-    elif A_level == 2: B_level = 2
-    elif A_level == 1: B_level = 1
-    else: B_level = 0
-    B_score = S_to_score[B_level]
-
-    total = error_count + warning_count
-    C_level = 3 if total >= 5 else 2 if total >= 3 else 1 if total >= 1 else 0
-    C_score = S_to_score[C_level]
-
-    D_level = max(0, A_level - 1) if mode == "student" else A_level
-    D_score = S_to_score[D_level]
-
-    final_score = (A_score * 0.4 + B_score * 0.3 + C_score * 0.2 + D_score * 0.1)
-    severity_percent = min(int(final_score), 100)
-
-    if severity_percent == 0:
-        label, level = "No Error", 0
-    elif severity_percent <= 30:
-        label, level = "Low", 1
-    elif severity_percent <= 60:
-        label, level = "Medium", 2
-    elif severity_percent <= 85:
-        label, level = "High", 3
-    else:
-        label, level = "Critical", 4
 
+
+def _read_source(file_path):
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _write_binary(exe_path, binary):
+    with open(exe_path, "wb") as f:
+        f.write(binary)
+    os.chmod(exe_path, 0o755)
+
+
+_BUILD_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def lookup_build(build_id):
+    """Return the cached successful build for a build handle, or None (unknown/evicted)."""
+    if not build_id or not _BUILD_ID_RE.match(str(build_id)):
+        return None
+    entry = compile_cache.get(build_id)
+    if entry is None or entry["status"] != "success" or not entry.get("binary"):
+        return None
+    return entry
+
+
+def restore_cached_binary(entry, output_file):
+    """Write a cached binary to output_file; returns the executable path."""
+    exe_path = resolve_exe_path(output_file)
+    _write_binary(exe_path, entry["binary"])
+    return exe_path
+
+
+def cached_failure_result(entry, file_path, start_time):
+    """Rebuild a failed compile result from a cache entry."""
+    classification = dict(entry["classification"])
+    classification["compile_time_ms"] = round((time.time() - start_time) * 1000, 2)
+    observe_compile_time(classification["compile_time_ms"], True, "failed")
+    # Diagnostics mention the temp file they were produced from; point them at this one
+    raw_error = entry["raw_error"]
+    if entry["source_path"]:
+        raw_error = raw_error.replace(entry["source_path"], file_path)
+        classification["diagnostics"] = [
+            dict(d, file=file_path) if d["file"] == entry["source_path"] else d
+            for d in classification.get("diagnostics", [])
+        ]
+    return {
+        "status": "failed",
+        "message": "",
+        "raw_error": raw_error,
+        "cached": True,
+        "classification": classification
+    }
+
+
+def _from_cache(entry, cache_key, file_path, output_file, skip_execution, start_time):
+    """Rebuild a compile_c_program result from a cache entry."""
+    if entry["status"] != "success":
+        return cached_failure_result(entry, file_path, start_time)
+    if entry["binary"] is None:  # "diagnostics" profile: nothing to restore or run
+        return _success_result("", round((time.time() - start_time) * 1000, 2), cached=True)
+    exe_path = restore_cached_binary(entry, output_file)
+    compile_time_ms = round((time.time() - start_time) * 1000, 2)
+    program_output = INPUT_REQUIRED_MSG if skip_execution else run_program(exe_path)
+    return _success_result(program_output, compile_time_ms, cached=True, build_id=cache_key)
+
+
+def prepare_compile(file_path, use_cache=True, profile="run"):
+    """
+    Read the source and look up the cache. Returns (flags, source_text, cache_key, entry).
+    flags include the profile and, when a bundle is ready, a precompiled-header -include;
+    the cache key leaves the latter out since it never changes the result.
+    """
+    if profile not in COMPILE_PROFILES:
+        raise ValueError(f"Unknown compile profile: {profile}")
+    flags = GCC_FLAGS + diagnostic_flags() + COMPILE_PROFILES[profile]
+    source_text = _read_source(file_path)
+    cache_key = make_cache_key(source_text, flags) if use_cache else None
+    entry = compile_cache.get(cache_key) if cache_key else None
+    if entry is None and use_cache and profile == "diagnostics":
+        # A full build of the same source (e.g. /compile before /autofix) has every diagnostic
+        run_entry = compile_cache.get(make_cache_key(source_text, GCC_FLAGS + diagnostic_flags()))
+        if run_entry is not None and run_entry["status"] != "success":
+            entry = run_entry
+    if entry is None:
+        flags = flags + pch_manager.flags_for(source_text, GCC_FLAGS)
+    return flags, source_text, cache_key, entry
+
+
+def gcc_command(flags, file_path, output_file):
+    """gcc argv for these flags; syntax-only builds write no output file."""
+    if "-fsyntax-only" in flags:
+        return ["gcc", *flags, file_path]
+    return ["gcc", *flags, file_path, "-o", output_file]
+
+
+def store_success(cache_key, exe_path, file_path):
+    """Cache a successful build (exe_path None for builds without a binary)."""
+    if not cache_key:
+        return
+    try:
+        binary = None
+        if exe_path is not None:
+            with open(exe_path, "rb") as f:
+                binary = f.read()
+        compile_cache.put(cache_key, "success", "", {}, binary=binary, source_path=file_path)
+    except OSError:
+        pass
+
+
+def failure_result(gcc_stderr, source_text, file_path, cache_key, compile_time_ms):
+    """Parse, classify and score gcc output for a failed build (and cache it)."""
+    records, extra = parse_gcc_output(gcc_stderr)
+    gcc_output = format_diagnostics(records, source_text, extra)
+    classification = classify_diagnostics(records)
+    sev = calculate_severity_engine(
+        classification["error_count"],
+        classification["warning_count"],
+        classification["error_type"]
+    )
+    classification.update(sev)
+    if cache_key:
+        compile_cache.put(cache_key, "failed", gcc_output, classification, source_path=file_path)
+    classification["compile_time_ms"] = compile_time_ms
+    observe_compile_time(compile_time_ms, False, "failed")
+
+    return {
+        "status": "failed",
+        "message": "",
+        "raw_error": gcc_output,
+        "cached": False,
+        "classification": classification
+    }
+
+
+def compiler_error_result(e):
     return {
-        "severity_percent": severity_percent,
-        "severity_label": label,
-        "severity_level": level
+        "status": "failed",
+        "message": f"Compiler error: {e}",
+        "raw_error": str(e),
+        "classification": {
+            "error_type": "Unknown Error",
+            "error_count": 0,
+            "warning_count": 0,
+            "severity_percent": 0,
+            "severity_label": "Unknown",
+            "severity_level": 0,
+            "compile_time_ms": 0
+        }
     }
 
 
 # --- MAIN COMPILER FUNCTION ---
-def compile_c_program(file_path, output_file="output.exe", skip_execution=False):
+def compile_c_program(file_path, output_file="output.exe", skip_execution=False, use_cache=True,
+                      profile="run"):
     try:
         start_time = time.time()
+
+        flags, source_text, cache_key, entry = prepare_compile(file_path, use_cache, profile)
+        if entry is not None:
+            return _from_cache(entry, cache_key, file_path, output_file, skip_execution, start_time)
+
         result = subprocess.run(
-            ["gcc", "-Wall", file_path, "-o", output_file],
-            capture_output=True, text=True, encoding="utf-8", errors="replace"
+            gcc_command(flags, file_path, output_file),
+            capture_output=True, text=True, encoding="utf-8", errors="replace",
+            timeout=GCC_TIMEOUT
         )
         compile_time_ms = round((time.time() - start_time) * 1000, 2)
 
         # ✅ Compilation successful
         if result.returncode == 0:
+            if profile == "diagnostics":
+                store_success(cache_key, None, file_path)
+                return _success_result("", compile_time_ms)
+
+            exe_path = resolve_exe_path(output_file)
+            store_success(cache_key, exe_path, file_path)
+
             # If skip_execution is True (program needs input), don't run automatically
             if skip_execution:
-                program_output = "(Program requires input. Please provide input and run the program.)"
+                program_output = INPUT_REQUIRED_MSG
             else:
                 # Try to run program (only for programs that don't need input)
-                try:
-                    # Run program with timeout and empty stdin
-                    # Use output_file directly (it's already a full path on Windows)
-                    exe_path = output_file
-                    # On Windows, ensure .exe extension if not present
-                    if os.name == 'nt' and not exe_path.endswith('.exe'):
-                        exe_path = exe_path + '.exe'
-                    
-                    run_result = subprocess.run(
-                        [exe_path], 
-                        input="",  # Provide empty stdin
-                        capture_output=True,
-                        text=True, 
-                        encoding="utf-8", 
-                        errors="replace",
-                        timeout=3,  # 3 second timeout (shorter since we know it shouldn't need input)
-                        cwd=os.path.dirname(exe_path) or os.getcwd()  # Run from the directory containing the exe
-                    )
-                    program_output = run_result.stdout.strip()
-                    if run_result.stderr:
-                        stderr_msg = run_result.stderr.strip()
-                        if stderr_msg:
-                            program_output += f"\n{stderr_msg}"
-                    if not program_output:
-                        program_output = "(Program executed successfully with no output)"
-                except subprocess.TimeoutExpired:
-                    # Program took too long (unexpected for programs without input)
-                    program_output = "(Program execution timed out. It may require input.)"
-                except Exception as run_e:
-                    program_output = f"Error running program: {str(run_e)}"
-
-            return {
-                "status": "success",
-                "message": "Compilation successful",
-                "program_output": program_output,
-                "raw_error": "",
-                "classification": {
-                    "error_type": "No Error",
-                    "error_count": 0,
-                    "warning_count": 0,
-                    "severity_percent": 0,
-                    "severity_label": "No Error",
-                    "severity_level": 0,
-                    "compile_time_ms": compile_time_ms
-                }
-            }
+                program_output = run_program(exe_path)
+
+            return _success_result(program_output, compile_time_ms, build_id=cache_key)
 
         # ❌ Compilation failed
-        gcc_output = result.stderr or result.stdout
-        classification = classify_error(gcc_output)
-        sev = calculate_severity_engine(
-            classification["error_count"],
-            classification["warning_count"],
-            classification["error_type"]
-        )
-        classification.update(sev)
-        classification["compile_time_ms"] = compile_time_ms
-
-        return {
-            "status": "failed",
-            "message": "",
-            "raw_error": gcc_output,
-            "classification": classification
-        }
+        return failure_result(result.stderr or result.stdout, source_text, file_path, cache_key, compile_time_ms)
 
     except Exception as e:
-        return {
-            "status": "failed",
-            "message": f"Compiler error: {e}",
-            "raw_error": str(e),
-            "classification": {
-                "error_type": "Unknown Error",
-                "error_count": 0,
-                "warning_count": 0,
-                "severity_percent": 0,
-                "severity_label": "Unknown",
-                "severity_level": 0,
-                "compile_time_ms": 0
-            }
-        }
+        return compiler_error_result(e)
@@ -0,0 +1,162 @@
+# conversation.py
+"""
+Per-session chat memory for /chat.
+
+Each session keeps its last CHAT_RECENT_TURNS question/answer pairs verbatim.
+Older turns are folded into a rolling summary (the question plus the first
+sentence of the answer, oldest dropped first once the summary exceeds
+CHAT_SUMMARY_TOKENS). The summary is extractive, so remembering costs no
+extra Gemini calls. The history sent with a question is trimmed to
+CHAT_CONTEXT_TOKENS, newest turns first:
+
+    history = conversations.context(session_id)     # {"summary", "turns"}
+    reply = ...                                     # prompt built with the history
+    conversations.record(session_id, question, reply)
+
+Sessions live in an LRU store with an idle TTL, so memory stays bounded
+however many students are chatting.
+
+Environment:
+    CHAT_SESSIONS_MAX     sessions kept, least recently used dropped first (5000)
+    CHAT_SESSION_TTL      seconds before an idle conversation is forgotten (3600)
+    CHAT_RECENT_TURNS     turns kept verbatim (6)
+    CHAT_CONTEXT_TOKENS   history budget per prompt, summary included (1500)
+    CHAT_SUMMARY_TOKENS   size of the rolling summary (300)
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+SESSIONS_MAX = int(os.getenv("CHAT_SESSIONS_MAX", "5000"))
+SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "3600"))
+RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "6"))
+CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+_CODE_RE = re.compile(r"```.*?```", re.S)
+
+
+def count_tokens(text):
+    """Rough token count (~4 characters per token), as the LLM gateway estimates."""
+    return len(text) // 4 + 1
+
+
+def gist(answer, limit=160):
+    """First sentence of an answer, without code blocks."""
+    text = " ".join(_CODE_RE.sub(" ", answer).split())
+    first = _SENTENCE_RE.split(text, maxsplit=1)[0]
+    return first if len(first) <= limit else first[:limit - 1].rstrip() + "…"
+
+
+def summary_line(question, answer):
+    return f"- Asked: {' '.join(question.split())[:200]} → {gist(answer)}"
+
+
+class _Conversation:
+    def __init__(self):
+        self.summary = deque()          # one line per folded turn, oldest first
+        self.summary_tokens = 0
+        self.turns = deque()            # (question, answer), oldest first
+        self.touched = time.time()
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """Rolling summary + recent turns per session, in an LRU store with an idle TTL."""
+
+    def __init__(self, max_sessions=SESSIONS_MAX, ttl=SESSION_TTL, recent_turns=RECENT_TURNS,
+                 context_tokens=CONTEXT_TOKENS, summary_tokens=SUMMARY_TOKENS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.recent_turns = recent_turns
+        self.context_tokens = context_tokens
+        self.summary_tokens = summary_tokens
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.turns_recorded = 0
+        self.turns_summarized = 0
+        self.turns_trimmed = 0   # recent turns left out of a prompt to stay within the budget
+        self.evicted = 0
+        self.expired = 0
+
+    def _session(self, session_id, create=True):
+        now = time.time()
+        with self._lock:
+            conv = self._sessions.get(session_id)
+            if conv is not None and now - conv.touched > self.ttl:
+                del self._sessions[session_id]
+                self.expired += 1
+                conv = None
+            if conv is None:
+                if not create:
+                    return None
+                conv = self._sessions[session_id] = _Conversation()
+            self._sessions.move_to_end(session_id)
+            conv.touched = now
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        return conv
+
+    def context(self, session_id):
+        """{"summary": str, "turns": [(question, answer), ...]} within the token budget."""
+        conv = self._session(session_id, create=False)
+        if conv is None:
+            return {"summary": "", "turns": []}
+        with conv.lock:
+            summary = "\n".join(conv.summary)
+            budget = self.context_tokens - (conv.summary_tokens if summary else 0)
+            turns = []
+            for question, answer in reversed(conv.turns):
+                cost = count_tokens(question) + count_tokens(answer)
+                if cost > budget:
+                    break
+                turns.append((question, answer))
+                budget -= cost
+            skipped = len(conv.turns) - len(turns)
+        if skipped:
+            with self._lock:
+                self.turns_trimmed += skipped
+        return {"summary": summary, "turns": turns[::-1]}
+
+    def record(self, session_id, question, answer):
+        """Append a finished turn; turns beyond the recent window fold into the summary."""
+        conv = self._session(session_id)
+        folded = 0
+        with conv.lock:
+            conv.turns.append((question, answer))
+            while len(conv.turns) > self.recent_turns:
+                line = summary_line(*conv.turns.popleft())
+                conv.summary.append(line)
+                conv.summary_tokens += count_tokens(line)
+                folded += 1
+                while conv.summary_tokens > self.summary_tokens and len(conv.summary) > 1:
+                    conv.summary_tokens -= count_tokens(conv.summary.popleft())
+        with self._lock:
+            self.turns_recorded += 1
+            self.turns_summarized += folded
+
+    def drop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_s": self.ttl,
+                "recent_turns": self.recent_turns,
+                "context_tokens": self.context_tokens,
+                "turns_recorded": self.turns_recorded,
+                "turns_summarized": self.turns_summarized,
+                "turns_trimmed": self.turns_trimmed,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+conversations = ConversationStore()
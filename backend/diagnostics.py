@@ -0,0 +1,242 @@
+# diagnostics.py
+"""
+Structured gcc diagnostics.
+
+gcc is run with -fdiagnostics-format=json (when the installed gcc supports it)
+and its output is parsed once into a list of records:
+
+    {"file", "line", "column", "display_column", "severity", "option", "message",
+     "fixits", "notes", "error_type"}
+
+"column" (and a fix-it's "column"/"end_column") is gcc's 1-based byte column,
+which indexes the source line; use char_index() to slice a str with it.
+"display_column" is what gcc prints, with tabs expanded to 8.
+
+Anything gcc prints outside the JSON array (linker errors from collect2/ld)
+is parsed with a single line regex into the same record shape. Compilers
+without JSON support fall back to the same text parser.
+"""
+import json
+import re
+import subprocess
+import threading
+
+JSON_DIAG_FLAG = "-fdiagnostics-format=json"
+
+# file:line:col: severity: message [-Woption]   (line/col optional, e.g. "collect2: error: ...")
+_TEXT_DIAG_RE = re.compile(
+    r"^(?P<file>[^\n]*?):(?:(?P<line>\d+):(?:(?P<column>\d+):)?)? "
+    r"(?P<severity>fatal error|error|warning|note): "
+    r"(?P<message>.*?)(?: \[(?P<option>-W[^\]]+)\])?$"
+)
+
+# Priority used when collapsing per-diagnostic types into one error_type
+ERROR_TYPE_PRIORITY = [
+    "Syntax Error",
+    "Undeclared Variable",
+    "Uninitialized Variable",
+    "Type Error",
+    "Unknown Error",
+    "Warning",
+]
+
+_json_supported = None
+_json_lock = threading.Lock()
+
+
+def gcc_supports_json_diagnostics():
+    """Check once whether the installed gcc accepts -fdiagnostics-format=json."""
+    global _json_supported
+    if _json_supported is not None:
+        return _json_supported
+    with _json_lock:
+        if _json_supported is None:
+            try:
+                probe = subprocess.run(
+                    ["gcc", JSON_DIAG_FLAG, "-fsyntax-only", "-x", "c", "-"],
+                    input="int x;\n", capture_output=True, text=True, timeout=10
+                )
+                _json_supported = probe.returncode == 0
+            except Exception:
+                _json_supported = False
+    return _json_supported
+
+
+def diagnostic_flags():
+    return [JSON_DIAG_FLAG] if gcc_supports_json_diagnostics() else []
+
+
+# --- Per-diagnostic classification ---
+def classify_diagnostic(severity, message, option=""):
+    """Map a single diagnostic to one of the severity engine's error types."""
+    if severity == "note":
+        return None
+    msg = message.lower()
+    if "expected" in msg or "syntax error" in msg:
+        return "Syntax Error"
+    if "undeclared" in msg:
+        return "Undeclared Variable"
+    if option in ("-Wuninitialized", "-Wmaybe-uninitialized") or "uninitialized" in msg:
+        return "Uninitialized Variable"
+    if option.startswith("-Wformat"):
+        return "Type Error"
+    if severity in ("error", "fatal error"):
+        return "Unknown Error"
+    return "Warning"
+
+
+def char_index(line_text, column):
+    """0-based str index of a 1-based byte column on a UTF-8 source line."""
+    prefix = line_text.encode("utf-8")[:max((column or 1) - 1, 0)]
+    return len(prefix.decode("utf-8", "ignore"))
+
+
+def _make_record(file, line, column, severity, message, option="", fixits=None, notes=None,
+                 display_column=None):
+    return {
+        "file": file,
+        "line": line,
+        "column": column,
+        "display_column": display_column or column,
+        "severity": severity,
+        "option": option or "",
+        "message": message,
+        "fixits": fixits or [],
+        "notes": notes or [],
+        "error_type": classify_diagnostic(severity, message, option or ""),
+    }
+
+
+def _caret(diag):
+    for loc in diag.get("locations") or []:
+        caret = loc.get("caret")
+        if caret:
+            return caret
+    return {}
+
+
+def _byte_column(loc):
+    # gcc's "column" is the display column (a tab counts up to 8); older gccs only have "column"
+    return loc.get("byte-column", loc.get("column"))
+
+
+def _from_json(diag):
+    caret = _caret(diag)
+    fixits = [
+        {
+            "line": fx.get("start", {}).get("line"),
+            "column": _byte_column(fx.get("start", {})),
+            "end_line": fx.get("next", {}).get("line"),
+            "end_column": _byte_column(fx.get("next", {})),
+            "insert": fx.get("string", ""),
+        }
+        for fx in diag.get("fixits") or []
+    ]
+    notes = [child.get("message", "") for child in diag.get("children") or []]
+    return _make_record(
+        caret.get("file", ""), caret.get("line"), _byte_column(caret),
+        diag.get("kind", "error"), diag.get("message", ""),
+        diag.get("option", ""), fixits, notes,
+        display_column=caret.get("display-column", caret.get("column")),
+    )
+
+
+def _from_text(line):
+    m = _TEXT_DIAG_RE.match(line)
+    if not m:
+        return None
+    return _make_record(
+        m.group("file"),
+        int(m.group("line")) if m.group("line") else None,
+        int(m.group("column")) if m.group("column") else None,
+        m.group("severity"), m.group("message"), m.group("option") or "",
+    )
+
+
+def parse_gcc_output(output):
+    """
+    Parse gcc stderr (JSON and/or plain text) in one pass.
+    Returns (records, extra_text) where extra_text holds the non-diagnostic
+    lines gcc/ld printed (e.g. "in function `main':"), kept for display.
+    """
+    records = []
+    extra = []
+    for line in (output or "").splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and stripped.endswith("]"):
+            try:
+                records.extend(_from_json(d) for d in json.loads(stripped))
+                continue
+            except ValueError:
+                pass
+        rec = _from_text(line)
+        if rec is None:
+            if stripped:
+                extra.append(line)
+            continue
+        if rec["severity"] == "note" and records:
+            records[-1]["notes"].append(rec["message"])
+        else:
+            records.append(rec)
+    return records, extra
+
+
+# --- Aggregation ---
+def summarize_diagnostics(records):
+    """Collapse a record list into the classification shape used everywhere else."""
+    error_count = sum(1 for r in records if r["severity"] in ("error", "fatal error"))
+    warning_count = sum(1 for r in records if r["severity"] == "warning")
+    types = {r["error_type"] for r in records if r["error_type"]}
+
+    error_type = "No Error"
+    for candidate in ERROR_TYPE_PRIORITY:
+        if candidate in types:
+            error_type = candidate
+            break
+
+    return {
+        "error_type": error_type,
+        "error_count": error_count,
+        "warning_count": warning_count,
+    }
+
+
+# --- Rendering (gcc-style text for the UI / LLM prompt) ---
+def format_diagnostics(records, source_text="", extra=None):
+    """Render records as gcc-like text, with the source line and caret when known."""
+    src_lines = source_text.splitlines() if source_text else []
+    out = []
+    for r in records:
+        loc = r["file"]
+        if r["line"]:
+            loc += f":{r['line']}"
+            if r["column"]:
+                loc += f":{r.get('display_column') or r['column']}"
+        opt = f" [{r['option']}]" if r["option"] else ""
+        out.append(f"{loc}: {r['severity']}: {r['message']}{opt}")
+        if r["line"] and 0 < r["line"] <= len(src_lines):
+            gutter = f"{r['line']:>5}"
+            out.append(f"{gutter} | {src_lines[r['line'] - 1]}")
+            if r["column"]:
+                # Keep the line's tabs so the caret lines up however tabs are rendered
+                prefix = src_lines[r["line"] - 1][:char_index(src_lines[r["line"] - 1], r["column"])]
+                pad = "".join(c if c == "\t" else " " for c in prefix)
+                out.append(f"{' ' * len(gutter)} | {pad}^")
+        for fx in r["fixits"]:
+            out.append(f"{' ' * 5} | fix-it: insert '{fx['insert']}' at {fx['line']}:{fx['column']}")
+        for note in r["notes"]:
+            out.append(f"{loc}: note: {note}")
+    out.extend(extra or [])
+    return "\n".join(out)
+
+
+def diagnostics_for_prompt(records, limit=20):
+    """Short per-line listing for LLM prompts."""
+    lines = []
+    for r in records[:limit]:
+        where = f"line {r['line']}" if r["line"] else "link"
+        hint = ""
+        if r["fixits"]:
+            hint = " (gcc suggests: " + ", ".join(repr(fx["insert"]) for fx in r["fixits"]) + ")"
+        lines.append(f"- {where}: [{r['error_type'] or r['severity']}] {r['message']}{hint}")
+    return "\n".join(lines)
@@ -1,9 +1,26 @@
-import pyttsx3
+import os
 import time
 import threading
 
 import re
 
+from startup import subsystems  # pyttsx3 is imported on first use; headless servers may not have it
+
+# Map error types to emotions
+EMOTION_SETTINGS = {
+    "Syntax Error": {"rate": 150, "volume": 1.0},
+    "Undeclared Variable": {"rate": 175, "volume": 1.0},
+    "Uninitialized Variable": {"rate": 150, "volume": 1.0},
+    "Type Error": {"rate": 160, "volume": 1.0},
+    "No Error": {"rate": 185, "volume": 1.0},
+    "chat": {"rate": 185, "volume": 1.0},
+    "happy": {"rate": 185, "volume": 1.0},
+}
+DEFAULT_EMOTION = {"rate": 170, "volume": 1.0}
+
+# SAPI5 on Windows, platform default (espeak/nsss) elsewhere
+TTS_DRIVER_NAME = "sapi5" if os.name == "nt" else None
+
 # Global engine for stopping TTS
 _current_engine = None
 _engine_lock = threading.Lock()
@@ -22,6 +39,24 @@ def summarize(text):
         return text
     return ". ".join(sentences[:2]) + "."
 
+def select_voice(voices, voice_choice):
+    """Pick the voice id for 'male'/'female' (David/Zira on Windows), else the first voice."""
+    wanted = "david" if voice_choice.lower() == "male" else "zira"
+    for v in voices:
+        if wanted in v.name.lower():
+            print(f"[TTS] Selected: {v.name}")
+            return v.id
+    if voices:
+        print(f"[TTS] Using fallback: {voices[0].name}")
+        return voices[0].id
+    return None
+
+
+def prepare_text(text):
+    """Clean and shorten text for speech."""
+    return summarize(clean_voice_text(text)) or "I have nothing to say."
+
+
 def stop_tts():
     """Stop any currently playing TTS"""
     global _current_engine
@@ -51,48 +86,17 @@ def speak_emotional(error_type, text, voice_choice="female"):
         stop_tts()
         
         # Create fresh engine
-        engine = pyttsx3.init(driverName="sapi5")
+        engine = subsystems.load("tts").init(driverName=TTS_DRIVER_NAME)
         with _engine_lock:
             _current_engine = engine
         
-        # Get available voices
-        voices = engine.getProperty('voices')
-        
         # Select voice based on choice
-        selected_voice = None
-        if voice_choice.lower() == "male":
-            for v in voices:
-                if "david" in v.name.lower():
-                    selected_voice = v.id
-                    print(f"[TTS] Selected: {v.name}")
-                    break
-        else:  # female
-            for v in voices:
-                if "zira" in v.name.lower():
-                    selected_voice = v.id
-                    print(f"[TTS] Selected: {v.name}")
-                    break
-        
-        # Fallback to default voice if not found
-        if not selected_voice:
-            selected_voice = voices[0].id
-            print(f"[TTS] Using fallback: {voices[0].name}")
-        
-        engine.setProperty('voice', selected_voice)
-        
-        # Map error types to emotions
-        emotion_settings = {
-            "Syntax Error": {"rate": 150, "volume": 1.0},
-            "Undeclared Variable": {"rate": 175, "volume": 1.0},
-            "Uninitialized Variable": {"rate": 150, "volume": 1.0},
-            "Type Error": {"rate": 160, "volume": 1.0},
-            "No Error": {"rate": 185, "volume": 1.0},
-            "chat": {"rate": 185, "volume": 1.0},
-            "happy": {"rate": 185, "volume": 1.0},
-        }
+        selected_voice = select_voice(engine.getProperty('voices'), voice_choice)
+        if selected_voice:
+            engine.setProperty('voice', selected_voice)
         
         # Get settings or use defaults
-        settings = emotion_settings.get(error_type, {"rate": 170, "volume": 1.0})
+        settings = EMOTION_SETTINGS.get(error_type, DEFAULT_EMOTION)
         
         engine.setProperty('rate', settings["rate"])
         engine.setProperty('volume', settings["volume"])
@@ -100,10 +104,7 @@ def speak_emotional(error_type, text, voice_choice="female"):
         print(f"[TTS] Rate: {settings['rate']}, Volume: {settings['volume']}")
         
         # Prepare text
-        text = summarize(clean_voice_text(text))
-
-        if not text:
-            text = "I have nothing to say."
+        text = prepare_text(text)
         
         print(f"[TTS] Ready to speak...")
         
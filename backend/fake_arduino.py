@@ -0,0 +1,76 @@
+# fake_arduino.py
+"""
+Pseudo-terminal stand-in for the severity Arduino (POSIX only).
+
+Run it and point the backend at the printed port:
+
+    python fake_arduino.py            # prints e.g. /dev/pts/7
+    SERIAL_PORT=/dev/pts/7 python app.py
+
+or use FakeArduino directly in scripts to check what the backend wrote.
+"""
+import os
+import threading
+import time
+import tty
+
+
+class FakeArduino:
+    """Opens a pty pair; the slave path acts as the serial port."""
+
+    def __init__(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        self.port = os.ttyname(self._slave)
+        self.values = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._read_loop, name="fake-arduino", daemon=True)
+        self._thread.start()
+
+    def _read_loop(self):
+        buf = b""
+        while not self._closed:
+            try:
+                chunk = os.read(self._master, 64)
+            except OSError:
+                break
+            if not chunk:
+                break
+            buf += chunk
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                line = line.strip()
+                if line:
+                    try:
+                        self.values.append(int(line))
+                    except ValueError:
+                        pass
+
+    def wait_for(self, count, timeout=5.0):
+        """Block until at least `count` values were received (or timeout)."""
+        deadline = time.time() + timeout
+        while len(self.values) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return list(self.values)
+
+    def close(self):
+        self._closed = True
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    dev = FakeArduino()
+    print(dev.port, flush=True)
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.1)
+            while seen < len(dev.values):
+                print(f"severity {dev.values[seen]}%", flush=True)
+                seen += 1
+    except KeyboardInterrupt:
+        dev.close()
@@ -1,36 +1,187 @@
-import serial
+import os
+import threading
 import time
 
-# Adjust your COM port (check Arduino IDE -> Tools -> Port)
-ARDUINO_PORT = "COM3"   # Change this to your actual port (e.g., COM3, COM5)
-BAUD_RATE = 9600
+from arduino_comm import auto_detect_port
+from metrics import SERIAL_WRITE_SECONDS
+from startup import subsystems
+
+# Port comes from SERIAL_PORT (see README); if unset the Arduino is auto-detected,
+# "none" / "off" disables the serial port (no worker thread, sends are dropped)
+ARDUINO_PORT = os.getenv("SERIAL_PORT") or None
+BAUD_RATE = int(os.getenv("BAUD_RATE", "9600"))
+RESET_DELAY = float(os.getenv("SERIAL_RESET_DELAY", "2"))  # Arduino reboots when the port opens
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+
+class HardwareManager:
+    """
+    Owns the serial port on a background thread.
+
+    send() only records the latest severity and returns immediately; the
+    worker thread writes it when connected, so bursts collapse to the most
+    recent value. While disconnected the worker re-detects and reopens the
+    port with exponential backoff (1s doubling up to 30s). A manager for the
+    port "none" or "off" never starts its thread and drops every send.
+    """
+
+    def __init__(self, port=ARDUINO_PORT, baud_rate=BAUD_RATE, reset_delay=RESET_DELAY,
+                 serial_factory=None):
+        self.configured_port = port
+        self.disabled = (port or "").lower() in ("none", "off")
+        self.baud_rate = baud_rate
+        self.reset_delay = reset_delay
+        self._serial_factory = serial_factory  # None: pyserial's Serial, imported on the worker thread
+        self._conn = None
+        self._port = None
+        self._pending = None
+        self._last_sent = None
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._backoff = MIN_BACKOFF
+        self.sent = 0
+        self.coalesced = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    # --- public API ---
+    def start(self):
+        if self.disabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopping = False
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._run, name="hardware-manager", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+        self._close()
+
+    def send(self, severity_percent):
+        """Queue a severity value (0–100); never blocks on USB."""
+        if self.disabled:
+            return
+        self.start()
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = int(severity_percent)
+        self._wake.set()
+
+    @property
+    def connected(self):
+        return self._conn is not None
+
+    def status(self):
+        return {
+            "connected": self.connected,
+            "disabled": self.disabled,
+            "port": self._port or self.configured_port,
+            "baud_rate": self.baud_rate,
+            "pending": self._pending,
+            "last_sent": self._last_sent,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "reconnects": self.reconnects,
+            "retry_in_s": None if self.connected else self._backoff,
+            "last_error": self.last_error,
+        }
+
+    # --- worker ---
+    def _connect(self):
+        serial_factory = self._serial_factory or subsystems.load("serial").Serial
+        port = self.configured_port or auto_detect_port()
+        if not port:
+            raise ConnectionError("Arduino not detected")
+        conn = serial_factory(port, self.baud_rate, timeout=1, write_timeout=1)
+        time.sleep(self.reset_delay)  # Wait for Arduino to initialize (worker thread only)
+        self._conn, self._port = conn, port
+        self._backoff = MIN_BACKOFF
+        self.reconnects += 1
+        self.last_error = None
+        print(f"✅ Connected to Arduino on {port}")
+        # Re-show the latest value after a reconnect
+        with self._lock:
+            if self._pending is None and self._last_sent is not None:
+                self._pending = self._last_sent
+
+    def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        while not self._stopping:
+            if self._conn is None:
+                try:
+                    self._connect()
+                except Exception as e:
+                    self.last_error = str(e)
+                    # Sleep out the backoff (new sends don't cut it short), but wake on stop()
+                    self._stop_event.wait(self._backoff)
+                    self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+                    continue
+
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
+            with self._lock:
+                value, self._pending = self._pending, None
+            if value is None:
+                continue
+            started = time.perf_counter()
+            try:
+                self._conn.write(f"{value}\n".encode())
+                SERIAL_WRITE_SECONDS.observe(time.perf_counter() - started, outcome="ok")
+                self._last_sent = value
+                self.sent += 1
+                print(f"📤 Sent severity {value}% to Arduino")
+            except Exception as e:
+                SERIAL_WRITE_SECONDS.observe(time.perf_counter() - started, outcome="error")
+                print(f"❌ Error sending to Arduino: {e}")
+                self.last_error = str(e)
+                with self._lock:
+                    if self._pending is None:
+                        self._pending = value  # retry after reconnect
+                self._close()
+
+
+manager = HardwareManager()
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(port=None):
+    """Shared manager for the default port, or one long-lived manager per explicit port."""
+    if port is None or port == manager.configured_port:
+        return manager
+    with _managers_lock:
+        if port not in _managers:
+            _managers[port] = HardwareManager(port=port)
+        return _managers[port]
 
-arduino = None
 
 def init_arduino():
-    global arduino
-    try:
-        arduino = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=2)
-        time.sleep(2)  # Wait for Arduino to initialize
-        print(f"✅ Connected to Arduino on {ARDUINO_PORT}")
-    except Exception as e:
-        print(f"⚠️ Could not connect to Arduino: {e}")
-        arduino = None
+    """Start the background connection manager."""
+    manager.start()
 
 
 def send_to_arduino(severity_percent):
     """Send severity value (0–100) to Arduino."""
-    global arduino
-    if arduino is None:
-        print("⚠️ Arduino not connected. Trying to reconnect...")
-        init_arduino()
-
-    if arduino:
-        try:
-            arduino.write(f"{severity_percent}\n".encode())
-            print(f"📤 Sent severity {severity_percent}% to Arduino")
-        except Exception as e:
-            print(f"❌ Error sending to Arduino: {e}")
+    manager.send(severity_percent)
 
 
 def update_hardware_from_classification(classification):
@@ -42,4 +193,4 @@ def update_hardware_from_classification(classification):
 
 def get_hardware_status():
     """Return hardware connection status."""
-    return {"connected": arduino is not None, "port": ARDUINO_PORT}
+    return manager.status()
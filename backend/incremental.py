@@ -0,0 +1,234 @@
+# incremental.py
+"""
+Session-aware re-analysis for edit-compile loops.
+
+Students usually change a line or two and analyze again. Each session keeps
+the previous source, its diagnostics and the explanations already generated
+for them. A new submission is diffed line by line against the previous one
+and its diagnostics are split into:
+
+    new         not present before; together with any diagnostic that still
+                has no explanation these are the "pending" ones, the only
+                ones sent to the LLM
+    unchanged   same severity/option/message/column on the same line, which
+                may have moved or been edited in place; keeps its id and
+                explanation
+    resolved    present before, gone now
+
+gcc still compiles the whole translation unit (C has nothing smaller to
+compile), but an unchanged source is served by the compile cache.
+
+    delta = analysis_sessions.update(session_id, code, compile_result)
+    if delta["pending"]:
+        raw_error, classification = explain_input(delta["pending"], code)
+        text = explain(raw_error, classification)
+        analysis_sessions.attach_explanation(session_id, delta["pending"], text)
+
+Environment:
+    ANALYSIS_SESSIONS_MAX   sessions kept, least recently used dropped first (1000)
+    ANALYSIS_SESSION_TTL    seconds before an idle session expires (1800)
+"""
+import difflib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from diagnostics import format_diagnostics
+from compiler import classify_diagnostics, calculate_severity_engine
+
+SESSIONS_MAX = int(os.getenv("ANALYSIS_SESSIONS_MAX", "1000"))
+SESSION_TTL = float(os.getenv("ANALYSIS_SESSION_TTL", "1800"))
+
+
+def map_lines(old_lines, new_lines):
+    """
+    {old line number: new line number} (1-based) for lines the edit kept, plus lines
+    rewritten in place (a replaced block of the same length maps line by line).
+    """
+    mapping = {}
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal" or (tag == "replace" and i2 - i1 == j2 - j1):
+            for k in range(i2 - i1):
+                mapping[i1 + k + 1] = j1 + k + 1
+    return mapping
+
+
+def _identity(record):
+    return record["severity"], record.get("option", ""), record["message"], record.get("column")
+
+
+def diff_diagnostics(old_records, new_records, line_map):
+    """
+    Match diagnostics across an edit. Returns (new, unchanged, resolved), where
+    unchanged is a list of (old_record, new_record) pairs.
+    """
+    candidates = {}
+    for old in old_records:
+        if old["line"] is None:
+            where = None  # link errors have no line; match on the message alone
+        else:
+            where = line_map.get(old["line"])
+            if where is None:
+                continue  # its line was deleted or rewritten beyond recognition
+        candidates.setdefault((_identity(old), where), []).append(old)
+
+    new, unchanged, matched = [], [], set()
+    for rec in new_records:
+        bucket = candidates.get((_identity(rec), rec["line"]))
+        if bucket:
+            old = bucket.pop(0)
+            matched.add(id(old))
+            unchanged.append((old, rec))
+        else:
+            new.append(rec)
+    resolved = [old for old in old_records if id(old) not in matched]
+    return new, unchanged, resolved
+
+
+def explain_input(records, source_text):
+    """(raw_error, classification) covering only these diagnostics, for the explain prompt."""
+    records = [dict(r) for r in records]
+    raw_error = format_diagnostics(records, source_text)
+    classification = classify_diagnostics(records)
+    classification.update(calculate_severity_engine(
+        classification["error_count"], classification["warning_count"], classification["error_type"]
+    ))
+    return raw_error, classification
+
+
+def describe_delta(delta):
+    """Short spoken summary of what changed ('' when nothing did)."""
+    parts = []
+    if delta["resolved"]:
+        parts.append(f"Fixed {len(delta['resolved'])} issue{'s' if len(delta['resolved']) != 1 else ''}.")
+    if delta["new"]:
+        parts.append(f"{len(delta['new'])} new issue{'s' if len(delta['new']) != 1 else ''}.")
+    return " ".join(parts)
+
+
+class _Session:
+    def __init__(self):
+        self.lines = None          # previous source, split into lines
+        self.diagnostics = []      # records carrying "id" and "explanation_id"
+        self.explanations = {}     # explanation_id -> {"explanation", "autofix"}
+        self.touched = time.time()
+        self.lock = threading.Lock()
+
+
+class AnalysisSessions:
+    """Per-session previous analysis, in an LRU store with an idle TTL."""
+
+    def __init__(self, max_sessions=SESSIONS_MAX, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.analyses = 0
+        self.reused = 0        # diagnostics served with an earlier explanation
+        self.explained = 0     # diagnostics sent to the LLM
+        self.evicted = 0
+
+    def _session(self, session_id):
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.touched > self.ttl:
+                session = None
+            if session is None:
+                session = self._sessions[session_id] = _Session()
+            self._sessions.move_to_end(session_id)
+            session.touched = now
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        return session
+
+    def _next_id(self, prefix):
+        with self._lock:
+            return f"{prefix}{next(self._ids)}"
+
+    def update(self, session_id, code, compile_result):
+        """
+        Diff a fresh compile result against the session's previous one and store it.
+        Returns {"first", "new", "unchanged", "resolved", "pending"}: records carry a
+        stable "id" and an "explanation_id" (None until explained); unchanged ones
+        also carry "previous_line".
+        """
+        records = [dict(r) for r in compile_result.get("classification", {}).get("diagnostics") or []]
+        lines = code.splitlines()
+        session = self._session(session_id)
+        with session.lock:
+            first = session.lines is None
+            line_map = map_lines(session.lines, lines) if not first else {}
+            new, unchanged, resolved = diff_diagnostics(session.diagnostics, records, line_map)
+
+            for old, rec in unchanged:
+                rec["id"] = old["id"]
+                rec["explanation_id"] = old.get("explanation_id")
+                rec["previous_line"] = old["line"]
+            for rec in new:
+                rec["id"] = self._next_id("d")
+                rec["explanation_id"] = None
+
+            session.lines = lines
+            session.diagnostics = records
+            live = {r["explanation_id"] for r in records if r["explanation_id"]}
+            session.explanations = {k: v for k, v in session.explanations.items() if k in live}
+
+        self.analyses += 1
+        self.reused += sum(1 for _, rec in unchanged if rec["explanation_id"])
+        return {
+            "first": first,
+            "new": new,
+            "unchanged": [rec for _, rec in unchanged],
+            "resolved": resolved,
+            "pending": [r for r in records if not r["explanation_id"]],
+        }
+
+    def attach_explanation(self, session_id, records, explanation, autofix=""):
+        """Store one explanation for these diagnostics; returns its explanation_id."""
+        explanation_id = self._next_id("e")
+        ids = {r["id"] for r in records}
+        session = self._session(session_id)
+        with session.lock:
+            session.explanations[explanation_id] = {"explanation": explanation, "autofix": autofix}
+            for rec in session.diagnostics:
+                if rec["id"] in ids:
+                    rec["explanation_id"] = explanation_id
+        for rec in records:
+            rec["explanation_id"] = explanation_id
+        self.explained += len(records)
+        return explanation_id
+
+    def current_explanations(self, session_id):
+        """Stored explanations covering the session's current diagnostics, in diagnostic order."""
+        session = self._session(session_id)
+        with session.lock:
+            ids = dict.fromkeys(r["explanation_id"] for r in session.diagnostics if r["explanation_id"])
+            return {eid: session.explanations[eid] for eid in ids if eid in session.explanations}
+
+    def drop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            active = len(self._sessions)
+        seen = self.reused + self.explained
+        return {
+            "sessions": active,
+            "max_sessions": self.max_sessions,
+            "ttl_s": self.ttl,
+            "analyses": self.analyses,
+            "diagnostics_reused": self.reused,
+            "diagnostics_explained": self.explained,
+            "reuse_rate": round(self.reused / seen, 3) if seen else 0.0,
+            "evicted": self.evicted,
+        }
+
+
+analysis_sessions = AnalysisSessions()
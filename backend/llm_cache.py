@@ -0,0 +1,152 @@
+# llm_cache.py
+"""
+Persistent cache for Gemini responses (SQLite, TTL + LRU eviction).
+
+Keys are built from *normalized* compiler diagnostics so that the same
+mistake made by different students (different temp file names, slightly
+different line numbers) maps to the same cached explanation.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3"))
+DEFAULT_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # one week
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LINE_BUCKET = 10
+
+_UUID_RE = re.compile(r"[0-9a-f]{32}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.I)
+_PATH_RE = re.compile(r"(?:[A-Za-z]:)?[^\s:'\"`]*[\\/]([^\s\\/:'\"`]+\.(?:c|h|o|exe|out))")
+_LOC_RE = re.compile(r"\.(c|h):(\d+):(\d+):")
+_GUTTER_RE = re.compile(r"^\s*\d+\s*\|", re.M)
+_TMP_OBJ_RE = re.compile(r"/tmp/cc\w+\.o")
+
+
+def _bucket(match):
+    line = int(match.group(2))
+    return f".{match.group(1)}:L{line // LINE_BUCKET * LINE_BUCKET}:"
+
+
+def normalize_diagnostics(text):
+    """Strip temp paths/UUIDs and bucket line numbers so equivalent errors match."""
+    text = _TMP_OBJ_RE.sub("<obj>", text or "")
+    text = _PATH_RE.sub(r"\1", text)
+    text = _UUID_RE.sub("<id>", text)
+    text = _LOC_RE.sub(_bucket, text)
+    text = _GUTTER_RE.sub(" |", text)
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+
+def make_key(kind, error_text, classification=None, mode="", source=""):
+    """
+    Cache key for an LLM response. source (the program itself, hashed verbatim)
+    is for prompts whose answer depends on the exact code, e.g. a corrected program.
+    """
+    classification = classification or {}
+    h = hashlib.sha256()
+    parts = (
+        kind,
+        mode or "",
+        classification.get("error_type", ""),
+        str(classification.get("error_count", "")),
+        str(classification.get("warning_count", "")),
+        normalize_diagnostics(error_text),
+    )
+    if source:
+        parts += (source,)  # only when given, so existing keys stay valid
+    for part in parts:
+        h.update(part.encode("utf-8", errors="replace"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class LLMCache:
+    """Small SQLite-backed key/value store with TTL and LRU eviction."""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                row = db.execute(
+                    "SELECT value FROM llm_cache WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+                db.commit()
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as e:
+            print(f"⚠️  LLM cache read failed: {e}")
+            return None
+
+    def put(self, key, value):
+        if not value:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                db.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl,))
+                (count,) = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+                if count > self.max_entries:
+                    db.execute(
+                        "DELETE FROM llm_cache WHERE key IN ("
+                        " SELECT key FROM llm_cache ORDER BY last_used ASC LIMIT ?)",
+                        (count - self.max_entries,)
+                    )
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  LLM cache write failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            with self._lock:
+                (count,) = self._db().execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        except sqlite3.Error:
+            count = None
+        return {
+            "entries": count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "ttl_s": self.ttl,
+            "max_entries": self.max_entries,
+        }
+
+
+# Shared cache used by chatbot.explain_error
+llm_cache = LLMCache()
@@ -0,0 +1,344 @@
+# llm_gateway.py
+"""
+Shared gateway in front of every Gemini call: rate limits, single-flight, fair queue.
+
+When a whole lab fails the same assignment, dozens of identical prompts used
+to reach Gemini at once and most came back as 429s. Every call in chatbot.py
+now goes through llm_gateway, which
+
+- keeps the process inside LLM_RPM requests and LLM_TPM tokens per minute
+  with two token buckets. Tokens are estimated up front (prompt length / 4
+  plus the output limit) and corrected from the response's usage metadata;
+- coalesces identical in-flight prompts into one upstream call (single
+  flight); the followers get the leader's response;
+- makes requests over budget wait in a fair queue: one FIFO per user (the
+  X-User-Id header, else the analysis session_id, else the client address),
+  served round-robin, so one student's burst doesn't starve the others. A
+  request that can't be served within LLM_QUEUE_TIMEOUT_S, or arrives
+  when LLM_QUEUE_MAX requests are already waiting, gets GatewayBusy
+  (a 429 with Retry-After).
+
+Upstream throughput therefore holds at the budget instead of bursting into
+429s. The gateway mirrors model_router's calls:
+
+    response = llm_gateway.generate(prompt, generation_config=...)
+    with llm_gateway.use(prompt) as model:     # streaming: rate-limited, not coalesced
+        for chunk in model.generate_content(prompt, stream=True): ...
+
+Environment:
+    LLM_RPM              requests per minute (15)
+    LLM_TPM              tokens per minute (1000000)
+    LLM_QUEUE_MAX        requests allowed to wait (200)
+    LLM_QUEUE_TIMEOUT_S  longest wait for a slot (30)
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from metrics import LLM_QUEUE_SECONDS, LLM_TOKENS
+from model_router import model_router
+
+LLM_RPM = float(os.getenv("LLM_RPM", "15"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "200"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "30"))
+DEFAULT_OUTPUT_TOKENS = 1024  # estimate when the call sets no max_output_tokens
+
+# Who the current request is for; set per request by app.py / asgi_app.py
+current_user = ContextVar("llm_user", default="anonymous")
+
+
+class GatewayBusy(Exception):
+    """The LLM queue is full, or a request waited longer than the queue timeout."""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(f"Too many AI requests right now; retry in {self.retry_after}s")
+
+
+def estimate_tokens(args, kwargs):
+    """Prompt tokens (~4 characters each) plus the output limit."""
+    prompt = args[0] if args else kwargs.get("contents", "")
+    config = kwargs.get("generation_config") or {}
+    output = config.get("max_output_tokens") if isinstance(config, dict) else None
+    return len(str(prompt)) // 4 + (output or DEFAULT_OUTPUT_TOKENS)
+
+
+def usage_tokens(response):
+    """Total tokens billed for a response, or None when it doesn't say."""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or None
+
+
+def flight_key(args, kwargs):
+    h = hashlib.sha256()
+    h.update(repr(args).encode("utf-8", errors="replace"))
+    h.update(repr(sorted(kwargs.items(), key=lambda kv: kv[0])).encode("utf-8", errors="replace"))
+    return h.hexdigest()
+
+
+class TokenBucket:
+    """Holds up to one minute's budget and refills continuously."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._stamp = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait_for(self, amount):
+        """Seconds until amount is available (0 when it already is)."""
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class _Ticket:
+    __slots__ = ("user", "tokens", "notify", "granted", "queued_at")
+
+    def __init__(self, user, tokens, notify):
+        self.user = user
+        self.tokens = tokens
+        self.notify = notify
+        self.granted = False
+        self.queued_at = time.monotonic()
+
+
+class LLMGateway:
+    """Token buckets + per-user round-robin queue + single-flight, in front of model_router."""
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_queue=LLM_QUEUE_MAX, queue_timeout=LLM_QUEUE_TIMEOUT_S,
+                 router=model_router):
+        self.router = router
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiting = OrderedDict()   # user -> deque of tickets; order is the round-robin turn
+        self._queued = 0
+        self._dispatcher = None
+        self._inflight = {}             # flight key -> Future
+        self._inflight_lock = threading.Lock()
+        self.granted = 0
+        self.queued_total = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.waits = 0
+        self.wait_ms_total = 0.0
+        self.max_wait_ms = 0.0
+        self.tokens_estimated = 0
+        self.tokens_used = 0
+
+    # --- admission ---
+    def _affordable(self, tokens):
+        return self._requests.level >= 1 and self._tokens.level >= tokens
+
+    def _consume(self, tokens):
+        self._requests.level -= 1
+        self._tokens.level -= tokens
+        self.granted += 1
+        self.tokens_estimated += tokens
+
+    def _retry_after(self):
+        return (self._queued + 1) / self._requests.rate
+
+    def _admit(self, tokens, notify):
+        """Grant at once (returns None) or queue a ticket for the dispatcher (returns it)."""
+        tokens = min(tokens, self._tokens.capacity)  # one oversized prompt must still fit eventually
+        user = current_user.get()
+        with self._cond:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            if not self._waiting and self._affordable(tokens):
+                self._consume(tokens)
+                LLM_QUEUE_SECONDS.observe(0.0)
+                return None
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise GatewayBusy(self._retry_after())
+            ticket = _Ticket(user, tokens, notify)
+            self._waiting.setdefault(user, deque()).append(ticket)
+            self._queued += 1
+            self.queued_total += 1
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="llm-gateway", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify()
+            return ticket
+
+    def _settle(self, ticket):
+        """After the wait: record it if granted, else withdraw the ticket and raise GatewayBusy."""
+        with self._cond:
+            if not ticket.granted:
+                queue = self._waiting.get(ticket.user)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    self._queued -= 1
+                    if not queue:
+                        del self._waiting[ticket.user]
+                self.rejected += 1
+                raise GatewayBusy(self._retry_after())
+            waited = (time.monotonic() - ticket.queued_at) * 1000
+            self.waits += 1
+            self.wait_ms_total += waited
+            self.max_wait_ms = max(self.max_wait_ms, waited)
+        LLM_QUEUE_SECONDS.observe(waited / 1000)
+
+    def _dispatch(self):
+        """Grant queued tickets round-robin across users as the buckets refill."""
+        while True:
+            with self._cond:
+                while not self._waiting:
+                    self._cond.wait()
+                user, queue = next(iter(self._waiting.items()))
+                ticket = queue[0]
+                now = time.monotonic()
+                self._requests.refill(now)
+                self._tokens.refill(now)
+                wait = max(self._requests.wait_for(1), self._tokens.wait_for(ticket.tokens))
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                queue.popleft()
+                self._queued -= 1
+                del self._waiting[user]
+                if queue:
+                    self._waiting[user] = queue  # back of the line: the next user goes first
+                self._consume(ticket.tokens)
+                ticket.granted = True
+            ticket.notify()
+
+    def acquire(self, tokens):
+        """Block until the buckets allow one request of about `tokens` tokens."""
+        event = threading.Event()
+        ticket = self._admit(tokens, event.set)
+        if ticket is not None:
+            event.wait(self.queue_timeout)
+            self._settle(ticket)
+
+    async def acquire_async(self, tokens):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket = self._admit(tokens, notify)
+        if ticket is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._settle(ticket)
+
+    def _settle_usage(self, estimated, response):
+        """Charge (or refund) the difference between the estimate and the real token count."""
+        used = usage_tokens(response)
+        if used is None:
+            return
+        usage = response.usage_metadata
+        LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, kind="prompt")
+        LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, kind="output")
+        with self._cond:
+            self._tokens.level -= used - min(estimated, self._tokens.capacity)
+            self.tokens_used += used
+
+    # --- calls ---
+    def generate(self, *args, **kwargs):
+        """Rate-limited, single-flight model_router.generate."""
+        key = flight_key(args, kwargs)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            tokens = estimate_tokens(args, kwargs)
+            self.acquire(tokens)
+            response = self.router.generate(*args, **kwargs)
+            self._settle_usage(tokens, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    async def generate_async(self, *args, **kwargs):
+        key = flight_key(args, kwargs)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            tokens = estimate_tokens(args, kwargs)
+            await self.acquire_async(tokens)
+            response = await self.router.generate_async(*args, **kwargs)
+            self._settle_usage(tokens, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    @contextmanager
+    def use(self, *args, **kwargs):
+        """A routed client for one streaming call, after waiting for its slot."""
+        self.acquire(estimate_tokens(args, kwargs))
+        with self.router.use() as client:
+            yield client
+
+    @asynccontextmanager
+    async def use_async(self, *args, **kwargs):
+        await self.acquire_async(estimate_tokens(args, kwargs))
+        async with self.router.use_async() as client:
+            yield client
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            return {
+                "rpm": self._requests.capacity,
+                "tpm": self._tokens.capacity,
+                "requests_available": round(self._requests.level, 2),
+                "tokens_available": round(self._tokens.level),
+                "granted": self.granted,
+                "queued_now": self._queued,
+                "queued_users": len(self._waiting),
+                "queued_total": self.queued_total,
+                "avg_wait_ms": round(self.wait_ms_total / self.waits, 2) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 2),
+                "rejected": self.rejected,
+                "coalesced": self.coalesced,
+                "tokens_estimated": self.tokens_estimated,
+                "tokens_used": self.tokens_used,
+            }
+
+
+llm_gateway = LLMGateway()
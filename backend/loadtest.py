@@ -0,0 +1,104 @@
+# loadtest.py
+"""
+Minimal HTTP load generator for comparing the Flask and ASGI servers.
+
+    python app.py                                              # Flask on :5000
+    hypercorn asgi_app:application --bind 127.0.0.1:5001       # ASGI on :5001
+    python loadtest.py --url http://127.0.0.1:5000 --url http://127.0.0.1:5001 \
+        --endpoint /compile --concurrency 50 --requests 500
+
+Sources are taken round-robin from --corpus (default temp_submissions) so the
+compile cache sees a realistic mix of hits and misses. Only the standard
+library is used.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100.0 * len(ordered))) - 1]
+
+
+def _load_corpus(corpus, limit):
+    files = sorted(glob.glob(os.path.join(corpus, "*.c")))[:limit]
+    sources = []
+    for p in files:
+        with open(p, "r", encoding="utf-8", errors="replace") as f:
+            code = f.read()
+        if code.strip():
+            sources.append(code)
+    return sources or ['#include <stdio.h>\nint main(){printf("hi\\n");return 0;}\n']
+
+
+def _one_request(url, body, timeout):
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, (time.perf_counter() - start) * 1000
+
+
+def run_load(base_url, endpoint, sources, concurrency, total, timeout=60):
+    url = base_url.rstrip("/") + endpoint
+    bodies = [json.dumps({"code": s}).encode() for s in sources]
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def task(i):
+        status, ms = _one_request(url, bodies[i % len(bodies)], timeout)
+        with lock:
+            latencies.append(ms)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(task, range(total)))
+    wall = time.perf_counter() - start
+
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": total,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total / wall, 2) if wall else 0.0,
+        "latency_ms_p50": round(_percentile(latencies, 50), 2),
+        "latency_ms_p95": round(_percentile(latencies, 95), 2),
+        "latency_ms_p99": round(_percentile(latencies, 99), 2),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test one or more CodeMate backends.")
+    parser.add_argument("--url", action="append", required=True, help="base URL (repeat to compare)")
+    parser.add_argument("--endpoint", default="/compile")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--corpus", default="temp_submissions")
+    parser.add_argument("--corpus-limit", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    sources = _load_corpus(args.corpus, args.corpus_limit)
+    results = [run_load(u, args.endpoint, sources, args.concurrency, args.requests) for u in args.url]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
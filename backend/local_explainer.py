@@ -0,0 +1,418 @@
+# local_explainer.py
+"""
+Offline explanations for the diagnostics students hit most.
+
+A table of gcc message patterns, each with a templated explanation, fix steps
+and (where possible) a corrected line. gcc's own fix-it hints are applied when
+present; otherwise a rule may build the correction itself (e.g. the missing ';'
+at the end of the previous statement). It runs in well under a millisecond.
+
+A diagnostic counts as handled when a rule matches it and, for errors, a
+correction could be produced (explain-only callers don't need the fix). Only
+the unhandled ones go to Gemini; when there are none, there is no API call.
+
+    local, unhandled = local_explainer.analyze(records, source_text)
+    # local: {"explanation", "fix_steps", "fixed_lines", "fixed_program"} or None
+
+Set LOCAL_EXPLAINER=0 to send everything to Gemini.
+"""
+import difflib
+import os
+import re
+import threading
+import time
+
+from diagnostics import char_index
+
+LOCAL_EXPLAINER_ENABLED = os.getenv("LOCAL_EXPLAINER", "1") != "0"
+
+_Q = "[‘'`\"]"   # gcc quotes with ‘’ in UTF-8 locales and '' otherwise
+_E = "[’'`\"]"
+
+# Header for functions students most often call without including it
+FUNCTION_HEADERS = {
+    "printf": "stdio.h", "scanf": "stdio.h", "puts": "stdio.h", "gets": "stdio.h", "fgets": "stdio.h",
+    "getchar": "stdio.h", "putchar": "stdio.h", "fopen": "stdio.h", "fclose": "stdio.h", "fprintf": "stdio.h",
+    "sprintf": "stdio.h", "snprintf": "stdio.h", "fscanf": "stdio.h",
+    "malloc": "stdlib.h", "calloc": "stdlib.h", "realloc": "stdlib.h", "free": "stdlib.h", "exit": "stdlib.h",
+    "atoi": "stdlib.h", "atof": "stdlib.h", "rand": "stdlib.h", "srand": "stdlib.h", "abs": "stdlib.h",
+    "qsort": "stdlib.h",
+    "strlen": "string.h", "strcpy": "string.h", "strncpy": "string.h", "strcmp": "string.h",
+    "strncmp": "string.h", "strcat": "string.h", "memset": "string.h", "memcpy": "string.h", "strchr": "string.h",
+    "strstr": "string.h",
+    "sqrt": "math.h", "pow": "math.h", "fabs": "math.h", "sin": "math.h", "cos": "math.h", "floor": "math.h",
+    "ceil": "math.h", "round": "math.h", "log": "math.h", "exp": "math.h",
+    "isdigit": "ctype.h", "isalpha": "ctype.h", "isspace": "ctype.h", "toupper": "ctype.h", "tolower": "ctype.h",
+    "time": "time.h", "clock": "time.h",
+}
+TYPE_HEADERS = {
+    "bool": "stdbool.h", "size_t": "stddef.h", "FILE": "stdio.h", "uint8_t": "stdint.h", "uint32_t": "stdint.h",
+    "int32_t": "stdint.h", "int64_t": "stdint.h", "uint64_t": "stdint.h", "time_t": "time.h",
+}
+# printf conversion for a given argument type
+FORMAT_FOR_TYPE = {
+    "int": "%d", "unsigned int": "%u", "long int": "%ld", "long unsigned int": "%lu", "long long int": "%lld",
+    "double": "%f", "float": "%f", "long double": "%Lf", "char": "%c", "char *": "%s", "const char *": "%s",
+    "short int": "%hd", "void *": "%p",
+}
+_IDENT_RE = re.compile(r"\b[A-Za-z_]\w*\b")
+_C_KEYWORDS = {
+    "auto", "break", "case", "char", "const", "continue", "default", "do", "double", "else", "enum", "extern",
+    "float", "for", "goto", "if", "int", "long", "register", "return", "short", "signed", "sizeof", "static",
+    "struct", "switch", "typedef", "union", "unsigned", "void", "volatile", "while", "include", "define",
+}
+
+
+# --- Line helpers -------------------------------------------------------------
+def _line(lines, n):
+    return lines[n - 1] if n and 0 < n <= len(lines) else None
+
+
+def _previous_code_line(lines, n):
+    """Line number of the last non-blank, non-comment line before line n (or None)."""
+    for k in range(n - 1, 0, -1):
+        text = lines[k - 1].strip()
+        if text and not text.startswith(("//", "/*", "*", "#")):
+            return k
+    return None
+
+
+def fixit_edits(record, lines):
+    """{line number: corrected text} from a diagnostic's gcc fix-it hints (single-line hints only)."""
+    out = {}
+    for n in sorted({fx["line"] for fx in record["fixits"] if fx.get("line")}):
+        text = _line(lines, n)
+        fixed = apply_fixits(text, record["fixits"], n) if text is not None else None
+        if fixed is not None and fixed != text:
+            out[n] = fixed
+    return out
+
+
+def apply_fixits(line_text, fixits, line_no):
+    """Apply gcc fix-it hints that fall on one line (columns are gcc's 1-based byte columns)."""
+    edits = [fx for fx in fixits if fx.get("line") == line_no and (fx.get("end_line") in (None, line_no))]
+    if not edits:
+        return None
+    text = line_text
+    for fx in sorted(edits, key=lambda fx: fx["column"] or 0, reverse=True):
+        start = char_index(line_text, fx["column"])
+        end = char_index(line_text, fx.get("end_column") or fx["column"])
+        text = text[:start] + fx.get("insert", "") + text[max(start, end):]
+    return text
+
+
+# --- Rules -------------------------------------------------------------------
+# Each rule gets (match, record, lines) and returns a dict with "explanation",
+# "steps" and optionally "fix" = {line_no: new_text} / "include" = header.
+def _missing_semicolon(m, rec, lines):
+    before = m.group("before")
+    steps = [f"Add ';' at the end of the statement just before ‘{before}’."]
+    fix = fixit_edits(rec, lines)
+    if not fix:
+        prev = _previous_code_line(lines, rec["line"] or 0)
+        if prev and not lines[prev - 1].rstrip().endswith((";", "{", "}", ",")):
+            fix[prev] = lines[prev - 1].rstrip() + ";"
+    return {
+        "explanation": f"A statement is missing its semicolon: the compiler reached ‘{before}’ while the "
+                       "previous statement was still open. In C every statement ends with ';'.",
+        "steps": steps,
+        "fix": fix,
+    }
+
+
+def _undeclared(m, rec, lines):
+    name = m.group("name")
+    idents = {w for line in lines for w in _IDENT_RE.findall(line)} - _C_KEYWORDS - {name}
+    close = difflib.get_close_matches(name, sorted(idents), n=1, cutoff=0.75)
+    fix = {}
+    if close:
+        text = _line(lines, rec["line"])
+        if text is not None:
+            fix[rec["line"]] = re.sub(rf"\b{re.escape(name)}\b", close[0], text)
+        steps = [f"‘{name}’ looks like a typo of ‘{close[0]}’; use the declared name."]
+    else:
+        steps = [f"Declare ‘{name}’ (e.g. int {name};) before its first use, inside the function or at the top of the file."]
+    return {
+        "explanation": f"‘{name}’ is used but was never declared, so the compiler doesn't know what it is. "
+                       "Variables must be declared before they are used, and names are case-sensitive.",
+        "steps": steps,
+        "fix": fix,
+    }
+
+
+def _implicit_declaration(m, rec, lines):
+    name, suggestion = m.group("name"), m.group("suggestion")
+    if suggestion:
+        fix = fixit_edits(rec, lines)
+        if not fix and _line(lines, rec["line"]) is not None:
+            fix = {rec["line"]: re.sub(rf"\b{re.escape(name)}\b", suggestion, _line(lines, rec["line"]))}
+        return {
+            "explanation": f"‘{name}’ is not a known function; it is most likely a misspelling of ‘{suggestion}’.",
+            "steps": [f"Rename ‘{name}’ to ‘{suggestion}’."],
+            "fix": fix,
+        }
+    header = FUNCTION_HEADERS.get(name)
+    if header:
+        return {
+            "explanation": f"‘{name}’ is used without its declaration. It is declared in <{header}>, "
+                           "which this file doesn't include.",
+            "steps": [f"Add #include <{header}> at the top of the file."],
+            "include": header,
+        }
+    return {
+        "explanation": f"‘{name}’ is called before it is declared. Either it is misspelled, or it is defined "
+                       "further down the file without a prototype above its first use.",
+        "steps": [f"Check the spelling of ‘{name}’, or add a prototype for it above main()."],
+    }
+
+
+def _builtin_mismatch(m, rec, lines):
+    name = m.group("name")
+    header = FUNCTION_HEADERS.get(name)
+    if not header:
+        return None
+    return {
+        "explanation": f"‘{name}’ is a standard library function, but <{header}> isn't included, so the "
+                       "compiler had to guess its declaration.",
+        "steps": [f"Add #include <{header}> at the top of the file."],
+        "include": header,
+    }
+
+
+def _format_mismatch(m, rec, lines):
+    spec, expected, actual, arg = m.group("spec"), m.group("expected"), m.group("actual"), m.group("arg")
+    right = FORMAT_FOR_TYPE.get(actual)
+    steps = [f"Use {right} for a {actual} argument, or cast argument {arg} to {expected}." if right else
+             f"Make argument {arg} a {expected}, or change ‘{spec}’ to match a {actual}."]
+    fix = {}
+    text = _line(lines, rec["line"])
+    if right and text is not None and text.count(spec) == 1:
+        fix[rec["line"]] = text.replace(spec, right)
+    return {
+        "explanation": f"The format ‘{spec}’ expects a {expected}, but argument {arg} is a {actual}. "
+                       "printf/scanf trust the format string, so a mismatch prints garbage or crashes.",
+        "steps": steps,
+        "fix": fix,
+    }
+
+
+def _uninitialized(m, rec, lines):
+    name = m.group("name")
+    return {
+        "explanation": f"‘{name}’ is read before it has been given a value, so it holds whatever happened "
+                       "to be in memory.",
+        "steps": [f"Initialize ‘{name}’ where it is declared (e.g. = 0) or assign it before the first read."],
+    }
+
+
+def _unused(m, rec, lines):
+    name = m.group("name")
+    return {
+        "explanation": f"‘{name}’ is declared but never used. This is only a warning, but it often means a "
+                       "typo or unfinished code.",
+        "steps": [f"Use ‘{name}’ where you meant to, or remove its declaration."],
+    }
+
+
+def _unknown_type(m, rec, lines):
+    name = m.group("name")
+    header = TYPE_HEADERS.get(name)
+    if header:
+        return {
+            "explanation": f"‘{name}’ is defined in <{header}>, which isn't included.",
+            "steps": [f"Add #include <{header}> at the top of the file."],
+            "include": header,
+        }
+    return {
+        "explanation": f"‘{name}’ is not a type the compiler knows. It is probably misspelled (C is "
+                       "case-sensitive) or its struct/typedef is declared later.",
+        "steps": [f"Check the spelling of ‘{name}’ and declare the type before it is used."],
+    }
+
+
+def _stray(m, rec, lines):
+    return {
+        "explanation": "The line contains a character C doesn't allow, usually a curly quote or an "
+                       "invisible character copied from a document or web page.",
+        "steps": ["Retype the quotes and symbols on that line by hand using plain ASCII characters."],
+    }
+
+
+def _unterminated_string(m, rec, lines):
+    return {
+        "explanation": "A string literal is missing its closing double quote, so the rest of the line is "
+                       "treated as part of the string.",
+        "steps": ["Add the closing \" (and check that \\n is written with a backslash)."],
+    }
+
+
+def _redefinition(m, rec, lines):
+    name = m.group("name")
+    return {
+        "explanation": f"‘{name}’ is defined twice in the same scope.",
+        "steps": [f"Remove one of the definitions of ‘{name}’, or give one of them a different name."],
+    }
+
+
+def _int_conversion(m, rec, lines):
+    return {
+        "explanation": "A pointer and an integer are being mixed without a cast. This usually means a "
+                       "missing & or *, or a string (\"a\") used where a character ('a') was meant.",
+        "steps": ["Check the types on both sides: use 'x' for a char, \"x\" for a string, &var for an address."],
+    }
+
+
+def _no_return(m, rec, lines):
+    return {
+        "explanation": "The function is declared to return a value, but execution can reach its end "
+                       "without a return statement.",
+        "steps": ["Add a return statement with a value on every path through the function."],
+    }
+
+
+def _expected_identifier(m, rec, lines):
+    return {
+        "explanation": "The compiler found a statement where only declarations are allowed. This is "
+                       "usually an extra '}' that closed main() too early, or code placed outside any function.",
+        "steps": ["Check that every '{' has exactly one matching '}' and that all statements are inside a function."],
+    }
+
+
+def _expected_generic(m, rec, lines):
+    what, before = m.group("what"), m.group("before")
+    return {
+        "explanation": f"The syntax is incomplete: the compiler expected {what} before ‘{before}’. "
+                       "The mistake is usually right before that point or at the end of the previous line.",
+        "steps": [f"Look just before ‘{before}’ for a missing {what} or an extra symbol."],
+    }
+
+
+RULES = [
+    ("missing_semicolon", re.compile(rf"^expected (?:{_Q},{_E} or )?{_Q};{_E} before {_Q}(?P<before>.+?){_E}(?: token)?$"),
+     _missing_semicolon),
+    ("undeclared", re.compile(rf"^{_Q}(?P<name>\w+){_E} undeclared"), _undeclared),
+    ("implicit_declaration",
+     re.compile(rf"^implicit declaration of function {_Q}(?P<name>\w+){_E}(?:; did you mean {_Q}(?P<suggestion>\w+){_E}\?)?"),
+     _implicit_declaration),
+    ("builtin_mismatch", re.compile(rf"^incompatible implicit declaration of built-in function {_Q}(?P<name>\w+){_E}"),
+     _builtin_mismatch),
+    ("format_mismatch",
+     re.compile(rf"^format {_Q}(?P<spec>%[^’'`\"]+){_E} expects (?:argument of type|a matching) {_Q}(?P<expected>[^’'`\"]+){_E}"
+                rf"(?: argument)?, but argument (?P<arg>\d+) has type {_Q}(?P<actual>[^’'`\"]+){_E}"),
+     _format_mismatch),
+    ("uninitialized", re.compile(rf"^{_Q}(?P<name>\w+){_E} (?:is|may be) used uninitialized"), _uninitialized),
+    ("unused", re.compile(rf"^(?:unused variable|variable) {_Q}(?P<name>\w+){_E}(?: set but not used)?$"), _unused),
+    ("unknown_type", re.compile(rf"^unknown type name {_Q}(?P<name>\w+){_E}"), _unknown_type),
+    ("stray_character", re.compile(rf"^stray {_Q}"), _stray),
+    ("unterminated_string", re.compile(r"^missing terminating \" character"), _unterminated_string),
+    ("redefinition", re.compile(rf"^redefinition of {_Q}(?P<name>\w+){_E}"), _redefinition),
+    ("int_conversion", re.compile(r"makes (?:pointer from integer|integer from pointer) without a cast"),
+     _int_conversion),
+    ("missing_return", re.compile(r"^control reaches end of non-void function"), _no_return),
+    ("expected_identifier", re.compile(rf"^expected identifier or {_Q}\({_E} before"), _expected_identifier),
+    ("expected", re.compile(rf"^expected (?P<what>.+?) before {_Q}?(?P<before>.+?){_E}?(?: token)?$"), _expected_generic),
+]
+
+
+class LocalExplainer:
+    """Pattern table + hit-rate counters."""
+
+    def __init__(self, rules=RULES, enabled=LOCAL_EXPLAINER_ENABLED):
+        self.rules = rules
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.local_only = 0      # answered without any API call
+        self.partial = 0         # some diagnostics still went to the LLM
+        self.diagnostics = 0
+        self.handled = 0
+        self.rule_hits = {name: 0 for name, _, _ in rules}
+        self.total_ms = 0.0
+
+    def explain_record(self, record, lines):
+        """Rule output for one diagnostic ({"rule", "explanation", "steps", ...}) or None."""
+        message = record["message"]
+        for name, pattern, build in self.rules:
+            m = pattern.search(message)
+            if m:
+                out = build(m, record, lines)
+                if out is not None:
+                    out["rule"] = name
+                    return out
+        return None
+
+    def analyze(self, records, source_text="", need_fix=True):
+        """
+        Explain what the rules cover. Returns (analysis or None, unhandled records).
+        With need_fix, an error only counts as handled when a correction was produced.
+        """
+        records = [r for r in records if r.get("severity") != "note"]
+        if not self.enabled or not records:
+            return None, records
+        start = time.perf_counter()
+        lines = (source_text or "").split("\n")
+        explanations, steps, fixes, includes, unhandled, hits = [], [], {}, [], [], []
+
+        for rec in records:
+            out = self.explain_record(rec, lines)
+            is_error = rec["severity"] in ("error", "fatal error")
+            if out is None or (need_fix and is_error and not out.get("fix") and not out.get("include")):
+                unhandled.append(rec)
+                continue
+            hits.append(out["rule"])
+            where = f"Line {rec['line']}: " if rec["line"] else ""
+            explanations.append(where + out["explanation"])
+            steps.extend(s for s in out["steps"] if s not in steps)
+            for line_no, text in (out.get("fix") or {}).items():
+                fixes.setdefault(line_no, text)
+            if out.get("include") and out["include"] not in includes:
+                includes.append(out["include"])
+
+        ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.requests += 1
+            self.diagnostics += len(records)
+            self.handled += len(hits)
+            self.total_ms += ms
+            for name in hits:
+                self.rule_hits[name] += 1
+            if hits and not unhandled:
+                self.local_only += 1
+            elif hits:
+                self.partial += 1
+        if not hits:
+            return None, unhandled
+
+        include_lines = [f"#include <{h}>" for h in includes if f"<{h}>" not in source_text]
+        fixed_lines = include_lines + [fixes[n] for n in sorted(fixes)]
+        fixed_program = ""
+        if fixes or include_lines:
+            program = list(lines)
+            for n, text in fixes.items():
+                if 0 < n <= len(program):
+                    program[n - 1] = text
+            fixed_program = "\n".join(include_lines + program).strip() + "\n"
+        return {
+            "explanation": "\n".join(explanations),
+            "fix_steps": steps,
+            "fixed_lines": "\n".join(fixed_lines),
+            "fixed_program": fixed_program,
+        }, unhandled
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requests": self.requests,
+                "answered_locally": self.local_only,
+                "partially_local": self.partial,
+                "local_rate": round(self.local_only / self.requests, 3) if self.requests else 0.0,
+                "diagnostics": self.diagnostics,
+                "diagnostics_handled": self.handled,
+                "diagnostic_hit_rate": round(self.handled / self.diagnostics, 3) if self.diagnostics else 0.0,
+                "avg_ms": round(self.total_ms / self.requests, 4) if self.requests else 0.0,
+                "rule_hits": dict(self.rule_hits),
+            }
+
+
+local_explainer = LocalExplainer()
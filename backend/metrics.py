@@ -0,0 +1,229 @@
+# metrics.py
+"""
+Prometheus metrics and per-request stage tracing.
+
+Each slow stage of the pipeline reports its duration to a histogram:
+
+    GCC_SECONDS.observe(compile_time_ms / 1000, cached="false")
+
+The histograms are served in the Prometheus text format at GET /metrics.
+Every HTTP request also gets a trace: app.py starts it in before_request
+(taking the id from an X-Request-Id header, or making one up), returns the id
+in the response's X-Request-Id header, and when the response is closed writes
+one JSON log line with the per-stage totals:
+
+    {"trace_id": "9f2c...", "method": "POST", "path": "/compile", "status": 200,
+     "duration_ms": 812.4, "stages": {"compile_queue": {"ms": 0.3, "count": 1},
+                                      "gcc": {"ms": 640.1, "count": 1}, ...}}
+
+A stage is added to the trace of whichever request is current (a ContextVar,
+like llm_gateway.current_user). The compile workers and the analysis pipeline
+run their jobs in the submitter's context, so their stages land in the right
+trace. Work done after the response (TTS, serial writes) only goes to /metrics.
+
+No client library is needed. Metrics are per process, so compiles done in
+batch_grader's worker processes are not counted.
+
+Environment:
+    TRACE_LOG   where the JSON trace lines go: "stderr" (default), a file path, or "off"
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+
+TRACE_LOG = os.getenv("TRACE_LOG", "stderr")
+
+# Seconds; from a warm cache hit up to a gcc or Gemini call near its timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+current_trace = ContextVar("trace", default=None)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(line for key, value in series for line in self._render_series(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, key, value):
+        yield f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; with a stage name, observations are also added to the current trace."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS, stage=None):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.stage = stage
+
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, seconds)] += 1
+            series[1] += seconds
+        if self.stage is not None:
+            trace = current_trace.get()
+            if trace is not None:
+                trace.add(self.stage, seconds)
+
+    def _render_series(self, key, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_label_text(self.labels, key, [('le', _format_value(bound))])} {cumulative}"
+        yield f"{self.name}_sum{_label_text(self.labels, key)} {round(total, 6)}"
+        yield f"{self.name}_count{_label_text(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS, stage=None):
+        return self.register(Histogram(name, help_text, labels, buckets, stage))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+HTTP_SECONDS = registry.histogram(
+    "codemate_http_request_seconds", "HTTP request duration until the response is closed",
+    ("method", "route", "status"))
+COMPILE_QUEUE_SECONDS = registry.histogram(
+    "codemate_compile_queue_wait_seconds", "Time a compile job waited for a worker", stage="compile_queue")
+GCC_SECONDS = registry.histogram(
+    "codemate_gcc_seconds", "Compile time (compile_time_ms) per compile, cache hits included",
+    ("cached", "status"), stage="gcc")
+RUN_SECONDS = registry.histogram(
+    "codemate_program_run_seconds", "Sandboxed program run time", ("outcome",), stage="run")
+LLM_QUEUE_SECONDS = registry.histogram(
+    "codemate_llm_queue_wait_seconds", "Time a Gemini call waited for the rate limiter", stage="llm_queue")
+LLM_SECONDS = registry.histogram(
+    "codemate_llm_request_seconds", "Gemini call latency (whole stream for streaming calls)",
+    ("model", "outcome"), buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0), stage="llm")
+LLM_TOKENS = registry.counter(
+    "codemate_llm_tokens_total", "Tokens billed by Gemini, from the response usage metadata", ("kind",))
+TTS_QUEUE_SECONDS = registry.histogram(
+    "codemate_tts_queue_wait_seconds", "Time an utterance waited in the speech queue")
+TTS_SECONDS = registry.histogram(
+    "codemate_tts_seconds", "Time spent speaking one utterance", ("outcome",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0))
+SERIAL_WRITE_SECONDS = registry.histogram(
+    "codemate_serial_write_seconds", "Severity write to the Arduino serial port", ("outcome",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+
+
+class Trace:
+    """Stage totals for one request."""
+
+    def __init__(self, trace_id=None):
+        self.id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"ms": 0.0, "count": 0})
+            entry["ms"] = round(entry["ms"] + seconds * 1000, 2)
+            entry["count"] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def record(self, **fields):
+        """The JSON log line for this trace."""
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in self.stages.items()}
+        return {"trace_id": self.id, **fields, "duration_ms": round(self.elapsed() * 1000, 2), "stages": stages}
+
+
+def start_trace(trace_id=None):
+    """Begin a trace for the current request; returns it."""
+    trace = Trace(trace_id)
+    current_trace.set(trace)
+    return trace
+
+
+def _make_trace_logger():
+    logger = logging.getLogger("codemate.trace")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    if TRACE_LOG.lower() in ("off", "0", "none", ""):
+        logger.disabled = True
+    elif not logger.handlers:
+        handler = logging.StreamHandler() if TRACE_LOG == "stderr" else logging.FileHandler(TRACE_LOG, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+trace_logger = _make_trace_logger()
+
+
+def finish_trace(trace, method, path, route, status, **fields):
+    """Observe the request duration and write the trace's JSON log line."""
+    HTTP_SECONDS.observe(trace.elapsed(), method=method, route=route, status=status)
+    trace_logger.info(json.dumps(trace.record(method=method, path=path, status=status, **fields)))
@@ -0,0 +1,412 @@
+# model_router.py
+"""
+Health-scored routing across the available Gemini models.
+
+Before this, every quota error reset the model cache, so the next request
+listed the models again, and every call built a new GenerativeModel. Now:
+
+- the discovered model list is kept in the LLM cache's SQLite file and
+  refreshed after MODEL_LIST_TTL seconds (or when a model turns out not to
+  exist), so restarts and quota errors don't list the models again;
+- one client per model is created once and reused;
+- each model has a sliding window of latency, errors and 429s, and a circuit
+  breaker: MODEL_BREAKER_FAILURES failures in a row, or any 429, open it for a
+  cooldown that doubles each time it reopens. After the cooldown, one trial
+  request is let through (half-open);
+- each request goes to the best-scoring model among the first
+  MODEL_ROUTER_CANDIDATES. The score is the typical latency, scaled up by
+  the error and 429 rates and by the model's position in the preference
+  order (flash models first). A failed non-streaming call is retried once
+  on the next model.
+
+    response = model_router.generate(prompt, generation_config=...)
+    with model_router.use() as model:          # streaming: outcome recorded on exit
+        for chunk in model.generate_content(prompt, stream=True): ...
+
+When every breaker is open, ModelsUnavailable (with retry_after) is raised at
+once instead of another call being sent into the quota storm.
+
+Environment:
+    MODEL_LIST_TTL            seconds a discovered model list stays valid (86400)
+    MODEL_HEALTH_WINDOW_S     sliding window for latency / error rates (300)
+    MODEL_BREAKER_FAILURES    consecutive failures that open a breaker (3)
+    MODEL_BREAKER_COOLDOWN_S  first open period; doubles up to 10x (30)
+    MODEL_ROUTER_CANDIDATES   models considered for routing (3)
+    MODEL_ROUTER_ATTEMPTS     models tried per non-streaming request (2)
+"""
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from llm_cache import llm_cache
+from metrics import LLM_SECONDS
+from startup import subsystems
+
+MODEL_LIST_TTL = float(os.getenv("MODEL_LIST_TTL", str(24 * 3600)))
+HEALTH_WINDOW_S = float(os.getenv("MODEL_HEALTH_WINDOW_S", "300"))
+BREAKER_FAILURES = int(os.getenv("MODEL_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_S = float(os.getenv("MODEL_BREAKER_COOLDOWN_S", "30"))
+ROUTER_CANDIDATES = int(os.getenv("MODEL_ROUTER_CANDIDATES", "3"))
+ROUTER_ATTEMPTS = int(os.getenv("MODEL_ROUTER_ATTEMPTS", "2"))
+
+MODEL_LIST_KEY = "model_router:models"
+FALLBACK_MODELS = ["models/gemini-1.5-flash", "models/gemini-pro", "models/gemini-1.0-pro"]
+LISTING_RETRY_S = 60         # after a failed listing, use the fallback names this long
+DEFAULT_LATENCY_MS = 1500.0  # assumed for models with no successful calls in the window
+POSITION_WEIGHT = 0.5        # score penalty per step down the preference order
+WINDOW_MAX = 200
+
+
+class ModelsUnavailable(Exception):
+    """Every model's circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(f"All Gemini models are temporarily unavailable after repeated errors or quota "
+                         f"limits; retry in {self.retry_after}s")
+
+
+def is_rate_limit(error):
+    text = str(error).lower()
+    return "429" in text or "quota" in text or "resource exhausted" in text or "resourceexhausted" in text
+
+
+def is_key_error(error):
+    """Bad or missing API key: every model would fail the same way, so no breaker opens."""
+    text = str(error).lower()
+    return "api key" in text or "api_key" in text
+
+
+def is_not_found(error):
+    text = str(error).lower()
+    return "404" in text or "not found" in text
+
+
+def rank_models(models):
+    """generateContent models in preference order: flash first, experimental ones skipped."""
+    names = []
+    for model in models:
+        if "generateContent" not in model.supported_generation_methods:
+            continue
+        name = model.name
+        if "exp" in name.lower() or "experimental" in name.lower():
+            continue
+        if "flash" in name.lower():
+            names.insert(0, name)
+        else:
+            names.append(name)
+    return names
+
+
+class ModelHealth:
+    """Sliding-window outcomes and circuit breaker for one model."""
+
+    def __init__(self):
+        self.window = deque(maxlen=WINDOW_MAX)   # (time, latency_ms, outcome)
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.opens = 0
+        self.trial_inflight = False
+        self.requests = 0
+
+    def _prune(self, now):
+        while self.window and now - self.window[0][0] > HEALTH_WINDOW_S:
+            self.window.popleft()
+
+    def allows(self, now):
+        if self.state == "open" and now >= self.open_until:
+            self.state = "half_open"
+        return self.state == "closed" or (self.state == "half_open" and not self.trial_inflight)
+
+    def record(self, now, latency_ms, outcome):
+        self.window.append((now, latency_ms, outcome))
+        self.trial_inflight = False
+        if outcome == "ok":
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.opens = 0
+            return
+        self.consecutive_failures += 1
+        if outcome == "rate_limited" or self.state == "half_open" or self.consecutive_failures >= BREAKER_FAILURES:
+            self.opens += 1
+            cooldown = min(BREAKER_COOLDOWN_S * 2 ** (self.opens - 1), BREAKER_COOLDOWN_S * 10)
+            self.state = "open"
+            self.open_until = now + cooldown
+
+    def rates(self, now):
+        self._prune(now)
+        n = len(self.window)
+        if not n:
+            return DEFAULT_LATENCY_MS, 0.0, 0.0
+        ok = [ms for _, ms, outcome in self.window if outcome == "ok"]
+        errors = sum(1 for _, _, outcome in self.window if outcome == "error")
+        throttled = sum(1 for _, _, outcome in self.window if outcome == "rate_limited")
+        return (statistics.median(ok) if ok else DEFAULT_LATENCY_MS), errors / n, throttled / n
+
+    def score(self, now, position):
+        latency, error_rate, throttle_rate = self.rates(now)
+        return latency * (1 + 2 * error_rate + 4 * throttle_rate) * (1 + POSITION_WEIGHT * position)
+
+
+class ModelRouter:
+    """Discovers the models once, keeps a client per model and routes on health."""
+
+    def __init__(self, cache=llm_cache, list_ttl=MODEL_LIST_TTL, candidates=ROUTER_CANDIDATES,
+                 attempts=ROUTER_ATTEMPTS):
+        self.cache = cache
+        self.list_ttl = list_ttl
+        self.candidates = candidates
+        self.attempts = attempts
+        self._lock = threading.Lock()
+        self._list_lock = threading.Lock()
+        self._models = None
+        self._listed_at = 0.0
+        self._list_ttl_now = list_ttl
+        self._clients = {}
+        self._health = {}
+        self.listings = 0
+        self.failovers = 0
+        self.rejected = 0
+
+    # --- discovery ---
+    def _list_models(self):
+        return rank_models(subsystems.load("gemini").list_models())
+
+    def _make_client(self, name):
+        genai = subsystems.load("gemini")
+        return genai.GenerativeModel() if name == "default" else genai.GenerativeModel(name)
+
+    def models(self):
+        """Model names in preference order, from memory, the persisted list or a fresh listing."""
+        if self._models is not None and time.time() - self._listed_at < self._list_ttl_now:
+            return self._models
+        with self._list_lock:
+            if self._models is not None and time.time() - self._listed_at < self._list_ttl_now:
+                return self._models
+            persisted = self.cache.get(MODEL_LIST_KEY)
+            if persisted:
+                data = json.loads(persisted)
+                if data["models"] and time.time() - data["listed_at"] < self.list_ttl:
+                    self._set_models(data["models"], data["listed_at"], self.list_ttl)
+                    return self._models
+
+            print("🔍 Listing available models from API...")
+            self.listings += 1
+            try:
+                names = self._list_models()
+            except Exception as e:
+                print(f"⚠️  Error listing models: {e}")
+                names = []
+            if names:
+                print(f"✅ Found {len(names)} available model(s); preferring {names[0]}")
+                listed_at = time.time()
+                self.cache.put(MODEL_LIST_KEY, json.dumps({"models": names, "listed_at": listed_at}))
+                self._set_models(names, listed_at, self.list_ttl)
+            else:
+                print("🔄 Using fallback model names")
+                self._set_models(FALLBACK_MODELS, time.time(), LISTING_RETRY_S)
+            return self._models
+
+    def _set_models(self, names, listed_at, ttl):
+        self._models = list(names)
+        self._listed_at = listed_at
+        self._list_ttl_now = ttl
+
+    def invalidate(self):
+        """Forget the model list so the next request lists the models again."""
+        with self._list_lock:
+            self._models = None
+            self.cache.put(MODEL_LIST_KEY, json.dumps({"models": [], "listed_at": 0}))
+
+    def client(self, name):
+        with self._lock:
+            client = self._clients.get(name)
+        if client is None:
+            client = self._make_client(name)
+            print(f"✅ Model initialized: {name}")
+            with self._lock:
+                client = self._clients.setdefault(name, client)
+        return client
+
+    # --- routing ---
+    def _health_of(self, name):
+        health = self._health.get(name)
+        if health is None:
+            health = self._health[name] = ModelHealth()
+        return health
+
+    def pick(self, exclude=()):
+        """Name of the healthiest model whose breaker lets a request through."""
+        names = [n for n in self.models()[:self.candidates] if n not in exclude]
+        now = time.monotonic()
+        with self._lock:
+            best = None
+            for position, name in enumerate(names):
+                health = self._health_of(name)
+                if not health.allows(now):
+                    continue
+                score = health.score(now, position)
+                if best is None or score < best[0]:
+                    best = (score, name, health)
+            if best is None:
+                self.rejected += 1
+                waits = [self._health_of(n).open_until - now for n in names]
+                raise ModelsUnavailable(min(waits) if waits else BREAKER_COOLDOWN_S)
+            _, name, health = best
+            if health.state == "half_open":
+                health.trial_inflight = True
+            health.requests += 1
+            return name
+
+    def acquire(self, exclude=()):
+        name = self.pick(exclude)
+        try:
+            return name, self.client(name)
+        except Exception:
+            self._release(name)
+            raise
+
+    def _release(self, name):
+        """Give back a half-open trial slot without recording an outcome."""
+        with self._lock:
+            self._health_of(name).trial_inflight = False
+
+    def record(self, name, started, error=None):
+        """Record one call's outcome (started is its time.monotonic())."""
+        now = time.monotonic()
+        if error is None:
+            outcome = "ok"
+        elif is_key_error(error):
+            outcome = "key_error"
+        elif is_rate_limit(error):
+            outcome = "rate_limited"
+        else:
+            outcome = "error"
+        LLM_SECONDS.observe(now - started, model=name, outcome=outcome)
+        if outcome == "key_error":
+            self._release(name)
+            return
+        with self._lock:
+            self._health_of(name).record(now, round((now - started) * 1000, 2), outcome)
+        if error is not None and is_not_found(error) and not is_rate_limit(error):
+            self.invalidate()  # the list named a model that no longer exists
+
+    @contextmanager
+    def use(self):
+        """A routed client for one (e.g. streaming) call; the outcome is recorded on exit."""
+        name, client = self.acquire()
+        started = time.monotonic()
+        try:
+            yield client
+        except Exception as e:
+            self.record(name, started, e)
+            raise
+        except BaseException:
+            self._release(name)  # stream abandoned by its consumer
+            raise
+        self.record(name, started)
+
+    @asynccontextmanager
+    async def use_async(self):
+        # Discovery may hit the network the first time; keep it off the loop
+        name, client = await asyncio.to_thread(self.acquire)
+        started = time.monotonic()
+        try:
+            yield client
+        except Exception as e:
+            self.record(name, started, e)
+            raise
+        except BaseException:
+            self._release(name)  # stream abandoned by its consumer
+            raise
+        self.record(name, started)
+
+    def generate(self, *args, **kwargs):
+        """generate_content on the healthiest model, failing over to the next one on error."""
+        tried, last_error = [], None
+        while len(tried) < self.attempts:
+            try:
+                name, client = self.acquire(exclude=tried)
+            except ModelsUnavailable:
+                if last_error is None:
+                    raise
+                break
+            self._count_failover(tried)
+            started = time.monotonic()
+            try:
+                response = client.generate_content(*args, **kwargs)
+            except Exception as e:
+                self.record(name, started, e)
+                if is_key_error(e):
+                    raise
+                tried.append(name)
+                last_error = e
+                continue
+            self.record(name, started)
+            return response
+        raise last_error
+
+    async def generate_async(self, *args, **kwargs):
+        tried, last_error = [], None
+        while len(tried) < self.attempts:
+            try:
+                name, client = await asyncio.to_thread(self.acquire, tried)
+            except ModelsUnavailable:
+                if last_error is None:
+                    raise
+                break
+            self._count_failover(tried)
+            started = time.monotonic()
+            try:
+                response = await client.generate_content_async(*args, **kwargs)
+            except Exception as e:
+                self.record(name, started, e)
+                if is_key_error(e):
+                    raise
+                tried.append(name)
+                last_error = e
+                continue
+            self.record(name, started)
+            return response
+        raise last_error
+
+    def _count_failover(self, tried):
+        if tried:
+            with self._lock:
+                self.failovers += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            models = {}
+            for name, health in self._health.items():
+                latency, error_rate, throttle_rate = health.rates(now)
+                health.allows(now)  # move an expired open breaker to half_open
+                models[name] = {
+                    "state": health.state,
+                    "requests": health.requests,
+                    "window_calls": len(health.window),
+                    "median_ms": round(latency, 2),
+                    "error_rate": round(error_rate, 3),
+                    "rate_limited_rate": round(throttle_rate, 3),
+                    "open_for_s": round(max(0.0, health.open_until - now), 1) if health.state == "open" else 0.0,
+                }
+            return {
+                "models": list(self._models or []),
+                "list_age_s": round(time.time() - self._listed_at, 1) if self._models is not None else None,
+                "list_ttl_s": self.list_ttl,
+                "listings": self.listings,
+                "clients": len(self._clients),
+                "failovers": self.failovers,
+                "rejected": self.rejected,
+                "health": models,
+            }
+
+
+model_router = ModelRouter()
@@ -0,0 +1,209 @@
+# pch.py
+"""
+Managed precompiled-header bundles for the standard C headers.
+
+A submission that starts with e.g.
+
+    #include <stdio.h>
+    #include <stdlib.h>
+
+is compiled with `-include <bundle>.h`, where the bundle holds exactly those
+includes in the same order and has a prebuilt `.gch` next to it. Because the
+bundle matches the file's own leading includes, the program means the same
+thing and gcc reports the same diagnostics (line numbers are untouched, since
+the source file is not modified); the file's own includes become no-ops behind
+the header guards.
+
+Bundles are built in the background the first time a prefix is seen and are
+stored per gcc version, so a compiler upgrade starts a fresh set and the old
+one is removed. gcc silently ignores a stale or mismatched .gch and parses the
+headers normally, so a bad bundle can only cost speed, never correctness.
+
+Environment:
+    COMPILE_PCH=0        disable precompiled headers
+    PCH_DIR              bundle directory (default ./pch_cache)
+    PCH_MAX_BUNDLES      distinct include prefixes kept (32)
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from compile_cache import get_gcc_version
+
+PCH_ENABLED = os.getenv("COMPILE_PCH", "1") != "0"
+PCH_DIR = os.getenv("PCH_DIR", "pch_cache")
+PCH_MAX_BUNDLES = int(os.getenv("PCH_MAX_BUNDLES", "32"))
+PCH_BUILD_TIMEOUT = 60
+
+# Only standard headers are bundled; anything else ends the prefix
+STANDARD_HEADERS = {
+    "assert.h", "complex.h", "ctype.h", "errno.h", "fenv.h", "float.h", "inttypes.h",
+    "iso646.h", "limits.h", "locale.h", "math.h", "setjmp.h", "signal.h", "stdarg.h",
+    "stdbool.h", "stddef.h", "stdint.h", "stdio.h", "stdlib.h", "string.h", "tgmath.h",
+    "time.h", "wchar.h", "wctype.h",
+}
+# Prefixes built at startup so the first students don't wait for them
+COMMON_PREFIXES = [
+    ("stdio.h",),
+    ("stdio.h", "stdlib.h"),
+    ("stdio.h", "string.h"),
+    ("stdio.h", "math.h"),
+    ("stdio.h", "stdlib.h", "string.h"),
+]
+
+_INCLUDE_RE = re.compile(r'^\s*#\s*include\s*<([A-Za-z0-9_./]+)>\s*(//.*|/\*.*\*/\s*)?$')
+_SKIP_RE = re.compile(r'^\s*(//.*)?$')
+
+
+def include_prefix(source_text):
+    """Leading standard #include <...> lines (blank/comment lines allowed between)."""
+    headers = []
+    for line in source_text.splitlines():
+        line = line.rstrip("\r")
+        if _SKIP_RE.match(line):
+            continue
+        m = _INCLUDE_RE.match(line)
+        if not m or m.group(1) not in STANDARD_HEADERS:
+            break
+        if m.group(1) not in headers:
+            headers.append(m.group(1))
+    return tuple(headers)
+
+
+class PCHManager:
+    """Builds and hands out -include flags for precompiled include prefixes."""
+
+    def __init__(self, root=PCH_DIR, enabled=PCH_ENABLED, max_bundles=PCH_MAX_BUNDLES):
+        self.enabled = enabled
+        self.base = root
+        self.max_bundles = max_bundles
+        self._dir = None
+        self._ready = {}       # prefix -> header path
+        self._building = set()
+        self._failed = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.build_failures = 0
+
+    @property
+    def directory(self):
+        """Bundle directory for the current gcc; other versions' bundles are removed."""
+        if self._dir is None:
+            tag = hashlib.sha256(get_gcc_version().encode()).hexdigest()[:12]
+            path = os.path.join(self.base, f"gcc-{tag}")
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(self.base):
+                stale = os.path.join(self.base, name)
+                if name != f"gcc-{tag}" and os.path.isdir(stale):
+                    shutil.rmtree(stale, ignore_errors=True)
+            self._remove_orphans(path)
+            self._dir = path
+        return self._dir
+
+    @staticmethod
+    def _remove_orphans(path):
+        """Delete .gch temp files left by a process that died mid-build (anything older than a build)."""
+        cutoff = time.time() - PCH_BUILD_TIMEOUT
+        for name in os.listdir(path):
+            if name.endswith(".tmp"):
+                tmp = os.path.join(path, name)
+                try:
+                    if os.path.getmtime(tmp) < cutoff:
+                        os.unlink(tmp)
+                except OSError:
+                    pass
+
+    def _paths(self, prefix):
+        name = "pch_" + hashlib.sha1("\n".join(prefix).encode()).hexdigest()[:12] + ".h"
+        header = os.path.join(self.directory, name)
+        return header, header + ".gch"
+
+    def flags_for(self, source_text, base_flags):
+        """Extra gcc flags for this source ([] until a bundle for its prefix is ready)."""
+        if not self.enabled:
+            return []
+        prefix = include_prefix(source_text)
+        if not prefix:
+            return []
+        with self._lock:
+            header = self._ready.get(prefix)
+        if header is not None:
+            self.hits += 1
+            return ["-include", os.path.abspath(header)]
+        self.misses += 1
+        self.build_async(prefix, base_flags)
+        return []
+
+    def build_async(self, prefix, base_flags):
+        with self._lock:
+            if (prefix in self._building or prefix in self._ready or prefix in self._failed
+                    or len(self._ready) + len(self._building) >= self.max_bundles):
+                return
+            self._building.add(prefix)
+        threading.Thread(target=self._build, args=(prefix, list(base_flags)),
+                         name="pch-build", daemon=True).start()
+
+    def _build(self, prefix, base_flags):
+        try:
+            header, gch = self._paths(prefix)
+            if not os.path.exists(gch):
+                with open(header, "w", encoding="utf-8") as f:
+                    f.write("".join(f"#include <{h}>\n" for h in prefix))
+                tmp = f"{gch}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    # Same language/warning flags as the real compiles; output-format flags don't matter
+                    flags = [f for f in base_flags if f.startswith(("-W", "-std", "-D", "-U", "-O"))]
+                    proc = subprocess.run(["gcc", *flags, "-x", "c-header", header, "-o", tmp],
+                                          capture_output=True, timeout=PCH_BUILD_TIMEOUT)
+                    if proc.returncode != 0:
+                        raise RuntimeError(proc.stderr.decode("utf-8", "replace").strip()[:200])
+                    os.replace(tmp, gch)
+                finally:
+                    # gcc failed or timed out before the rename: don't leave a partial .gch behind
+                    try:
+                        os.unlink(tmp)
+                    except FileNotFoundError:
+                        pass
+            with self._lock:
+                self._ready[prefix] = header
+            self.builds += 1
+        except Exception as e:
+            print(f"⚠️ Precompiled header for {', '.join(prefix)} failed: {e}")
+            self.build_failures += 1
+            with self._lock:
+                self._failed.add(prefix)
+        finally:
+            with self._lock:
+                self._building.discard(prefix)
+
+    def warm(self, base_flags, prefixes=COMMON_PREFIXES):
+        """Start background builds for the usual include prefixes."""
+        if self.enabled:
+            for prefix in prefixes:
+                self.build_async(tuple(prefix), base_flags)
+
+    def stats(self):
+        with self._lock:
+            ready = [list(p) for p in self._ready]
+            building = len(self._building)
+        looked_up = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "directory": os.path.abspath(self._dir) if self._dir else None,
+            "bundles": ready,
+            "building": building,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / looked_up, 3) if looked_up else 0.0,
+            "builds": self.builds,
+            "build_failures": self.build_failures,
+        }
+
+
+pch_manager = PCHManager()
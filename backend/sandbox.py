@@ -0,0 +1,550 @@
+# sandbox.py
+"""
+Resource-limited execution of student programs.
+
+Every run gets rlimits on CPU time, address space, file size, open files and
+process count, a wall-clock timeout, and capped stdout/stderr capture, so one
+`while(1) malloc` or printf flood cannot starve the host.
+
+Starting a child from the (multi-threaded) server with a Python preexec hook
+is slow and unsafe, so runs are started by a small pool of fork servers
+instead: single-threaded helper processes that are launched once, import
+everything up front and then just fork + setrlimit + exec on request. The
+server hands them the three pipe ends over a Unix socket and gets back the
+pid and, later, the exit status.
+
+Where that is not available the engine falls back to a plain subprocess with
+the same timeout and output caps (rlimits via preexec_fn on POSIX, none on
+Windows). On Windows, where pipes can't be polled with select, the output is
+read by threads and the program gets the server's environment (MinGW builds
+need SYSTEMROOT and the toolchain's DLLs on PATH).
+
+Environment:
+    SANDBOX_CPU_SECONDS   CPU time limit (2)
+    SANDBOX_MEMORY_MB     address space limit (256)
+    SANDBOX_FSIZE_MB      largest file the program may write (8)
+    SANDBOX_MAX_FILES     open file descriptors (32)
+    SANDBOX_MAX_PROCS     processes for the server's user id; RLIMIT_NPROC is per-user (64)
+    SANDBOX_OUTPUT_KB     stdout/stderr kept per stream (64)
+    SANDBOX_FORKSERVERS   pre-started fork servers, 0 disables them (2)
+"""
+import itertools
+import json
+import os
+import select
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_LIMITS = {
+    "cpu_seconds": int(os.getenv("SANDBOX_CPU_SECONDS", "2")),
+    "memory_mb": int(os.getenv("SANDBOX_MEMORY_MB", "256")),
+    "fsize_mb": int(os.getenv("SANDBOX_FSIZE_MB", "8")),
+    "max_files": int(os.getenv("SANDBOX_MAX_FILES", "32")),
+    "max_procs": int(os.getenv("SANDBOX_MAX_PROCS", "64")),
+}
+OUTPUT_LIMIT = int(os.getenv("SANDBOX_OUTPUT_KB", "64")) * 1024
+FORKSERVERS = int(os.getenv("SANDBOX_FORKSERVERS", "2"))
+PROGRAM_ENV = {"PATH": "/usr/bin:/bin", "LANG": "C.UTF-8"}
+TRUNCATED_NOTE = "\n... (output truncated)"
+SPAWN_TIMEOUT = 5
+
+_SIGNAL_MESSAGES = {
+    getattr(signal, "SIGXCPU", None): "CPU time limit exceeded",
+    getattr(signal, "SIGXFSZ", None): "File size limit exceeded",
+    getattr(signal, "SIGSEGV", None): "Segmentation fault",
+    getattr(signal, "SIGABRT", None): "Aborted",
+    getattr(signal, "SIGFPE", None): "Floating point exception",
+}
+
+
+def program_env():
+    """Environment for student programs: minimal on POSIX, the server's own on Windows."""
+    return dict(os.environ) if os.name == "nt" else dict(PROGRAM_ENV)
+
+
+def forkserver_supported():
+    return (resource is not None and hasattr(socket, "send_fds")
+            and hasattr(socket, "SOCK_SEQPACKET") and hasattr(os, "fork"))
+
+
+def apply_limits(limits):
+    """setrlimit() for the current process (child side, before exec)."""
+    mb = 1024 * 1024
+    cpu = limits["cpu_seconds"]
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))  # SIGXCPU first, SIGKILL a second later
+    resource.setrlimit(resource.RLIMIT_AS, (limits["memory_mb"] * mb,) * 2)
+    resource.setrlimit(resource.RLIMIT_FSIZE, (limits["fsize_mb"] * mb,) * 2)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (limits["max_files"],) * 2)
+    resource.setrlimit(resource.RLIMIT_NPROC, (limits["max_procs"],) * 2)
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def describe_exit(returncode):
+    """Human-readable note for a run killed by a signal, or ''."""
+    if returncode is None or returncode >= 0:
+        return ""
+    return _SIGNAL_MESSAGES.get(-returncode, f"Killed by signal {-returncode}")
+
+
+def run_outcome(result):
+    """Metrics label for a finished run."""
+    if result["timed_out"]:
+        return "timeout"
+    if result["truncated"]:
+        return "truncated"
+    if result["returncode"] is not None and result["returncode"] < 0:
+        return "signaled"
+    return "exited"
+
+
+# --- fork server process side ---
+def _exec_child(job, fds, limits):
+    """In the forked child: wire up pipes, limit, exec. Never returns."""
+    try:
+        os.setsid()  # own process group so the whole tree can be killed
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        # Nothing but stdin/stdout/stderr: not the control socket, not the received pipe ends
+        os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+        # Python ignores these at startup and SIG_IGN survives exec (Popen's restore_signals)
+        for signum in (signal.SIGPIPE, signal.SIGXFSZ):
+            signal.signal(signum, signal.SIG_DFL)
+        apply_limits(limits)
+        os.chdir(job["cwd"])
+        os.execve(job["exe"], [job["exe"]], PROGRAM_ENV)
+    except BaseException as e:
+        try:
+            os.write(2, f"Error running program: {e}\n".encode())
+        finally:
+            os._exit(127)
+
+
+def _forkserver_main(sock_fd, limits):
+    """Loop: receive (job, fds) → fork/exec; report pid and exit status back."""
+    os.set_inheritable(sock_fd, False)  # pass_fds made it inheritable; programs must not see it
+    sock = socket.socket(fileno=sock_fd)
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    jobs = {}  # pid -> job id
+
+    def reply(payload):
+        sock.send(json.dumps(payload).encode())
+
+    while True:
+        ready, _, _ = select.select([sock, wake_r], [], [])
+        if wake_r in ready:
+            try:
+                while os.read(wake_r, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+        while jobs:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            job_id = jobs.pop(pid, None)
+            if job_id is not None:
+                reply({"id": job_id, "status": os.waitstatus_to_exitcode(status)})
+        if sock in ready:
+            msg, fds, _, _ = socket.recv_fds(sock, 4096, 3)
+            if not msg:
+                os._exit(0)  # server went away
+            job = json.loads(msg)
+            try:
+                pid = os.fork()
+            except OSError as e:
+                reply({"id": job["id"], "error": str(e)})
+                pid = None
+            if pid == 0:
+                _exec_child(job, fds, limits)
+            for fd in fds:
+                os.close(fd)
+            if pid:
+                jobs[pid] = job["id"]
+                reply({"id": job["id"], "pid": pid})
+
+
+# --- server side ---
+class _ForkedProcess:
+    """A program started by a fork server; mirrors the bits of Popen we need."""
+
+    def __init__(self, server, job_id, waiter, stdin_fd, stdout_fd, stderr_fd):
+        self._server = server
+        self._job_id = job_id
+        self._waiter = waiter
+        self.pid = waiter["pid"]
+        self.stdin_fd, self.stdout_fd, self.stderr_fd = stdin_fd, stdout_fd, stderr_fd
+
+    def kill(self):
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            try:
+                os.kill(self.pid, signal.SIGKILL)  # killed before it reached setsid()
+            except ProcessLookupError:
+                pass
+
+    def wait(self, timeout):
+        if not self._waiter["done"].wait(timeout):
+            return None
+        self._server.forget(self._job_id)
+        return self._waiter.get("status", -signal.SIGKILL)
+
+    def close(self):
+        for fd in (self.stdout_fd, self.stderr_fd):
+            os.close(fd)
+
+
+class _PopenProcess:
+    """Fallback wrapper around subprocess.Popen with the same interface."""
+
+    def __init__(self, exe_path, cwd, limits):
+        preexec = (lambda: apply_limits(limits)) if resource is not None else None
+        self._proc = subprocess.Popen(
+            [exe_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=cwd, env=program_env(), preexec_fn=preexec, start_new_session=resource is not None,
+        )
+        self.pid = self._proc.pid
+        # Pipe file objects, for the reader threads used on Windows
+        self.stdin, self.stdout, self.stderr = self._proc.stdin, self._proc.stdout, self._proc.stderr
+        if os.name != "nt":
+            self.stdin_fd = os.dup(self._proc.stdin.fileno())
+            self._proc.stdin.close()
+            self.stdout_fd = self._proc.stdout.fileno()
+            self.stderr_fd = self._proc.stderr.fileno()
+
+    def kill(self):
+        try:
+            if resource is not None:
+                os.killpg(self.pid, signal.SIGKILL)
+            else:
+                self._proc.kill()
+        except OSError:
+            pass
+
+    def wait(self, timeout):
+        try:
+            return self._proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def close(self):
+        self._proc.stdout.close()
+        self._proc.stderr.close()
+
+
+class _ForkServer:
+    """Client for one fork server process."""
+
+    def __init__(self, limits):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-I", "-S", os.path.abspath(__file__),
+             "--forkserver", str(child.fileno()), json.dumps(limits)],
+            pass_fds=(child.fileno(),), stdin=subprocess.DEVNULL,
+        )
+        child.close()
+        self.sock = parent
+        self.active = 0
+        self._ids = itertools.count(1)
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read_loop, name="sandbox-forkserver", daemon=True).start()
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def _read_loop(self):
+        while True:
+            try:
+                msg = self.sock.recv(4096)
+            except OSError:
+                msg = b""
+            if not msg:
+                break
+            payload = json.loads(msg)
+            with self._lock:
+                waiter = self._waiters.get(payload["id"])
+            if waiter is None:
+                continue
+            waiter.update(payload)
+            waiter["started"].set()
+            if "status" in payload or "error" in payload:
+                waiter["done"].set()
+        # Fork server died: release every run still waiting on it
+        with self._lock:
+            waiters = list(self._waiters.values())
+        for waiter in waiters:
+            waiter.setdefault("error", "sandbox fork server exited")
+            waiter["started"].set()
+            waiter["done"].set()
+
+    def forget(self, job_id):
+        with self._lock:
+            if self._waiters.pop(job_id, None) is not None:
+                self.active -= 1
+
+    def spawn(self, exe_path, cwd):
+        in_r, in_w = os.pipe()
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        job_id = next(self._ids)
+        waiter = {"started": threading.Event(), "done": threading.Event()}
+        with self._lock:
+            self._waiters[job_id] = waiter
+            self.active += 1
+        try:
+            with self._send_lock:
+                job = {"id": job_id, "exe": exe_path, "cwd": cwd}
+                socket.send_fds(self.sock, [json.dumps(job).encode()], [in_r, out_w, err_w])
+            ok = waiter["started"].wait(SPAWN_TIMEOUT) and "pid" in waiter
+        except OSError:
+            ok = False
+        finally:
+            for fd in (in_r, out_w, err_w):
+                os.close(fd)
+        if not ok:
+            self.forget(job_id)
+            for fd in (in_w, out_r, err_r):
+                os.close(fd)
+            raise OSError(waiter.get("error", "sandbox fork server did not respond"))
+        return _ForkedProcess(self, job_id, waiter, in_w, out_r, err_r)
+
+    def close(self):
+        try:
+            self.sock.close()  # EOF: the fork server exits
+            self.proc.wait(timeout=1)
+        except Exception:
+            self.proc.kill()
+
+
+class Sandbox:
+    """Runs binaries under rlimits with capped output, via pre-started fork servers."""
+
+    def __init__(self, limits=None, forkservers=FORKSERVERS, output_limit=OUTPUT_LIMIT):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.forkservers = forkservers if forkserver_supported() else 0
+        self.output_limit = output_limit
+        self._servers = []
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.fallback_runs = 0
+        self.restarts = 0
+        self.timeouts = 0
+        self.truncated = 0
+        self.signaled = 0
+
+    # --- fork servers ---
+    def start(self):
+        """Launch the fork servers (idempotent; dead ones are replaced)."""
+        with self._lock:
+            if len(self._servers) < self.forkservers or not all(s.alive for s in self._servers):
+                live = [s for s in self._servers if s.alive]
+                if self._servers:
+                    self.restarts += self.forkservers - len(live)
+                while len(live) < self.forkservers:
+                    live.append(_ForkServer(self.limits))
+                self._servers = live
+            return list(self._servers)
+
+    def shutdown(self):
+        with self._lock:
+            servers, self._servers = self._servers, []
+        for s in servers:
+            s.close()
+
+    def _spawn(self, exe_path, cwd):
+        if self.forkservers:
+            try:
+                server = min(self.start(), key=lambda s: s.active)
+                return server.spawn(exe_path, cwd)
+            except OSError as e:
+                print(f"⚠️ Sandbox fork server unavailable, running directly: {e}")
+        self.fallback_runs += 1
+        return _PopenProcess(exe_path, cwd, self.limits)
+
+    # --- running ---
+    def run(self, exe_path, stdin_text="", timeout=10, cwd=None):
+        """
+        Run exe_path with stdin_text. Returns a dict with stdout, stderr,
+        returncode, timed_out, truncated, signal_message and duration_ms.
+        """
+        exe_path = os.path.abspath(exe_path)
+        cwd = os.path.abspath(cwd or os.path.dirname(exe_path))
+        start = time.perf_counter()
+        self.runs += 1
+
+        proc = self._spawn(exe_path, cwd)
+        result = self._communicate(proc, (stdin_text or "").encode("utf-8", "replace"), timeout)
+        result["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        killed_by_us = result["timed_out"] or result["truncated"]
+        result["signal_message"] = "" if killed_by_us else describe_exit(result["returncode"])
+        if result["signal_message"]:
+            # Surface crashes / limit kills to the student alongside the program's own stderr
+            stderr = result["stderr"].rstrip()
+            result["stderr"] = (stderr + "\n" if stderr else "") + f"({result['signal_message']})"
+        from metrics import RUN_SECONDS  # not at the top: fork servers run this file with -I -S
+        RUN_SECONDS.observe(result["duration_ms"] / 1000, outcome=run_outcome(result))
+        if result["timed_out"]:
+            self.timeouts += 1
+        if result["truncated"]:
+            self.truncated += 1
+        if result["signal_message"]:
+            self.signaled += 1
+        return result
+
+    def _communicate(self, proc, data, timeout):
+        """Feed stdin and collect output with per-stream caps and a wall deadline."""
+        collect = self._collect_threaded if os.name == "nt" else self._collect_selector
+        stdout, stderr, truncated, timed_out = collect(proc, data, time.monotonic() + timeout)
+
+        returncode = proc.wait(timeout=2)
+        if returncode is None:
+            proc.kill()
+            returncode = proc.wait(timeout=5)
+        proc.close()
+
+        stdout = stdout.decode("utf-8", "replace")
+        stderr = stderr.decode("utf-8", "replace")
+        if truncated:
+            stdout += TRUNCATED_NOTE
+        return {
+            "stdout": stdout,
+            "stderr": stderr,
+            "returncode": returncode,
+            "timed_out": timed_out,
+            "truncated": truncated,
+        }
+
+    def _collect_selector(self, proc, data, deadline):
+        """POSIX: one selector over both output pipes. Returns (stdout, stderr, truncated, timed_out)."""
+        buffers = {proc.stdout_fd: bytearray(), proc.stderr_fd: bytearray()}
+        truncated = timed_out = False
+
+        def feed():
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(proc.stdin_fd, view):]
+            except OSError:
+                pass  # program exited or closed stdin without reading it all
+            finally:
+                os.close(proc.stdin_fd)
+
+        writer = None
+        if len(data) <= select.PIPE_BUF:
+            feed()  # fits in an empty pipe, so this never blocks
+        else:
+            writer = threading.Thread(target=feed, daemon=True)
+            writer.start()
+
+        with selectors.DefaultSelector() as sel:
+            for fd in buffers:
+                sel.register(fd, selectors.EVENT_READ)
+            while sel.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    proc.kill()
+                    break
+                for key, _ in sel.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        sel.unregister(key.fd)
+                        continue
+                    buf = buffers[key.fd]
+                    room = self.output_limit - len(buf)
+                    buf += chunk[:max(room, 0)]
+                    if len(chunk) > room:
+                        # Output flood: stop the program instead of draining it forever
+                        truncated = True
+                        proc.kill()
+                        sel.unregister(key.fd)
+
+        if writer is not None:
+            writer.join(timeout=1)
+        return buffers[proc.stdout_fd], buffers[proc.stderr_fd], truncated, timed_out
+
+    def _collect_threaded(self, proc, data, deadline):
+        """Windows: a writer and two reader threads over the Popen pipes, same caps and deadline."""
+        buffers = (bytearray(), bytearray())
+        flooded = threading.Event()
+
+        def feed():
+            try:
+                proc.stdin.write(data)
+            except OSError:
+                pass  # program exited or closed stdin without reading it all
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+
+        def drain(stream, buf):
+            while True:
+                chunk = stream.read1(65536)
+                if not chunk:
+                    return
+                room = self.output_limit - len(buf)
+                buf += chunk[:max(room, 0)]
+                if len(chunk) > room:
+                    flooded.set()
+                    proc.kill()
+                    return
+
+        threading.Thread(target=feed, daemon=True).start()
+        readers = [threading.Thread(target=drain, args=(stream, buf), daemon=True)
+                   for stream, buf in zip((proc.stdout, proc.stderr), buffers)]
+        for reader in readers:
+            reader.start()
+        timed_out = False
+        for reader in readers:
+            reader.join(max(0.0, deadline - time.monotonic()))
+            if reader.is_alive():
+                timed_out = not flooded.is_set()
+                proc.kill()
+                reader.join(timeout=1)
+        return bytes(buffers[0]), bytes(buffers[1]), flooded.is_set(), timed_out
+
+    def stats(self):
+        with self._lock:
+            servers = [s for s in self._servers if s.alive]
+        return {
+            "limits": self.limits if resource is not None else None,
+            "output_limit_kb": self.output_limit // 1024,
+            "forkservers": self.forkservers,
+            "forkservers_alive": len(servers),
+            "running": sum(s.active for s in servers),
+            "runs": self.runs,
+            "fallback_runs": self.fallback_runs,
+            "restarts": self.restarts,
+            "timeouts": self.timeouts,
+            "truncated": self.truncated,
+            "signaled": self.signaled,
+        }
+
+
+sandbox = Sandbox()
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--forkserver"]:
+    _forkserver_main(int(sys.argv[2]), json.loads(sys.argv[3]))
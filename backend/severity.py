@@ -0,0 +1,190 @@
+# severity.py
+"""
+Severity model: turns (error_count, warning_count, error_type) into
+severity_percent / severity_label / severity_level.
+
+compiler.calculate_severity_engine scores one submission through the default
+model; score_batch() scores whole arrays at once (vectorized with NumPy, which
+is in the requirements; a plain loop if it is missing, see BATCH_BACKEND) and
+gives exactly the same numbers, so
+stored classifications can be re-scored after tuning the weights:
+
+    model = SeverityModel(weights=(0.5, 0.2, 0.2, 0.1))
+    out = model.score_batch(errors, warnings, model.encode_types(types))
+    out["severity_percent"], out["severity_label"], out["severity_level"]
+
+The default model can be replaced with a JSON file of SeverityModel keyword
+arguments via SEVERITY_MODEL=path/to/model.json.
+"""
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:  # optional: batch scoring falls back to a Python loop
+    np = None
+
+BATCH_BACKEND = "numpy" if np is not None else "python"  # what score_batch() runs on
+
+DEFAULT_TYPE_LEVELS = {
+    "Syntax Error": 4,
+    "Type Error": 3,
+    "Semantic Error": 3,
+    "Runtime Error": 3,
+    "Undeclared Variable": 3,
+    "Uninitialized Variable": 2,
+    "Warning": 1,
+    "No Error": 0,
+    "Unknown Error": 2
+}
+DEFAULT_UNKNOWN_LEVEL = 2
+DEFAULT_LEVEL_SCORES = (0, 25, 50, 75, 100)  # level 0..4 -> score
+# Weights of A (error type), B (impact), C (error+warning volume), D (mode-adjusted type)
+DEFAULT_WEIGHTS = (0.4, 0.3, 0.2, 0.1)
+DEFAULT_COUNT_THRESHOLDS = (1, 3, 5)  # total >= 1 / 3 / 5 -> volume level 1 / 2 / 3
+DEFAULT_LABEL_THRESHOLDS = (30, 60, 85)  # upper bounds of Low / Medium / High
+LABELS = ("No Error", "Low", "Medium", "High", "Critical")
+
+
+class SeverityModel:
+    """Weights, levels and thresholds for severity scoring."""
+
+    def __init__(self, type_levels=None, unknown_level=DEFAULT_UNKNOWN_LEVEL,
+                 level_scores=DEFAULT_LEVEL_SCORES, weights=DEFAULT_WEIGHTS,
+                 count_thresholds=DEFAULT_COUNT_THRESHOLDS, label_thresholds=DEFAULT_LABEL_THRESHOLDS):
+        self.type_levels = dict(DEFAULT_TYPE_LEVELS if type_levels is None else type_levels)
+        self.unknown_level = unknown_level
+        self.level_scores = tuple(level_scores)
+        self.weights = tuple(weights)
+        self.count_thresholds = tuple(sorted(count_thresholds))
+        self.label_thresholds = tuple(sorted(label_thresholds))
+        if len(self.weights) != 4:
+            raise ValueError("weights must have 4 entries (A, B, C, D)")
+        if len(self.label_thresholds) != len(LABELS) - 2:
+            raise ValueError(f"label_thresholds must have {len(LABELS) - 2} entries")
+        max_level = len(self.level_scores) - 1
+        if any(not 0 <= lvl <= max_level for lvl in [*self.type_levels.values(), self.unknown_level]):
+            raise ValueError(f"type levels must be between 0 and {max_level}")
+        if len(self.count_thresholds) > max_level:
+            raise ValueError("more count thresholds than levels")
+
+        # Integer codes for the batch API; the extra last code means "unknown type"
+        self.type_names = list(self.type_levels)
+        self.type_codes = {name: i for i, name in enumerate(self.type_names)}
+        self.unknown_code = len(self.type_names)
+        self._code_levels = [self.type_levels[n] for n in self.type_names] + [self.unknown_level]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    # --- scalar ---
+    def _count_level(self, total):
+        level = 0
+        for threshold in self.count_thresholds:
+            if total >= threshold:
+                level += 1
+        return level
+
+    def _label_level(self, severity_percent):
+        if severity_percent == 0:
+            return 0
+        for i, bound in enumerate(self.label_thresholds):
+            if severity_percent <= bound:
+                return i + 1
+        return len(LABELS) - 1
+
+    def score(self, error_count, warning_count, error_type, mode="pro"):
+        """Score one submission (same dict as calculate_severity_engine)."""
+        scores, (wa, wb, wc, wd) = self.level_scores, self.weights
+        a_level = self.type_levels.get(error_type, self.unknown_level)
+        b_level = a_level  # impact follows the error type
+        c_level = self._count_level(error_count + warning_count)
+        d_level = max(0, a_level - 1) if mode == "student" else a_level
+
+        final_score = (scores[a_level] * wa + scores[b_level] * wb + scores[c_level] * wc + scores[d_level] * wd)
+        severity_percent = min(int(final_score), 100)
+        level = self._label_level(severity_percent)
+        return {
+            "severity_percent": severity_percent,
+            "severity_label": LABELS[level],
+            "severity_level": level
+        }
+
+    # --- batch ---
+    def encode_types(self, error_types):
+        """Map error type names to the integer codes score_batch() expects."""
+        codes = [self.type_codes.get(t, self.unknown_code) for t in error_types]
+        return np.asarray(codes, dtype=np.int64) if np is not None else codes
+
+    def score_batch(self, error_counts, warning_counts, type_codes, mode="pro"):
+        """
+        Score many submissions at once. Inputs are equal-length sequences
+        (NumPy arrays preferred); codes outside the table count as unknown.
+        Returns {"severity_percent", "severity_label", "severity_level"} as
+        arrays (lists without NumPy).
+        """
+        if np is None:
+            return self._score_batch_python(error_counts, warning_counts, type_codes, mode)
+
+        errors = np.asarray(error_counts, dtype=np.int64)
+        warnings = np.asarray(warning_counts, dtype=np.int64)
+        codes = np.asarray(type_codes, dtype=np.int64)
+        if not errors.shape == warnings.shape == codes.shape:
+            raise ValueError("error_counts, warning_counts and type_codes must have the same shape")
+
+        codes = np.where((codes < 0) | (codes > self.unknown_code), self.unknown_code, codes)
+        scores = np.asarray(self.level_scores, dtype=np.float64)
+        wa, wb, wc, wd = self.weights
+
+        a_level = np.asarray(self._code_levels, dtype=np.int64)[codes]
+        b_level = a_level
+        c_level = np.searchsorted(np.asarray(self.count_thresholds), errors + warnings, side="right")
+        d_level = np.maximum(a_level - 1, 0) if mode == "student" else a_level
+
+        # Same operation order as score(), so float rounding (and int() truncation) match exactly
+        final_score = scores[a_level] * wa + scores[b_level] * wb + scores[c_level] * wc + scores[d_level] * wd
+        percent = np.minimum(final_score.astype(np.int64), 100)
+        level = np.where(percent == 0, 0,
+                         1 + np.searchsorted(np.asarray(self.label_thresholds), percent, side="left"))
+        return {
+            "severity_percent": percent,
+            "severity_label": np.asarray(LABELS)[level],
+            "severity_level": level,
+        }
+
+    def _score_batch_python(self, error_counts, warning_counts, type_codes, mode):
+        if not len(error_counts) == len(warning_counts) == len(type_codes):
+            raise ValueError("error_counts, warning_counts and type_codes must have the same length")
+        names = self.type_names
+        out = {"severity_percent": [], "severity_label": [], "severity_level": []}
+        for e, w, c in zip(error_counts, warning_counts, type_codes):
+            name = names[c] if 0 <= c < len(names) else None
+            r = self.score(e, w, name, mode)
+            for key in out:
+                out[key].append(r[key])
+        return out
+
+    def score_records(self, records, mode="pro"):
+        """Re-score classification dicts (error_count, warning_count, error_type) in bulk."""
+        records = list(records)
+        out = self.score_batch(
+            [r.get("error_count", 0) for r in records],
+            [r.get("warning_count", 0) for r in records],
+            self.encode_types([r.get("error_type", "Unknown Error") for r in records]),
+            mode,
+        )
+        percents, labels, levels = (list(out[k]) for k in ("severity_percent", "severity_label", "severity_level"))
+        return [
+            {"severity_percent": int(p), "severity_label": str(lb), "severity_level": int(lv)}
+            for p, lb, lv in zip(percents, labels, levels)
+        ]
+
+
+def load_default_model():
+    path = os.getenv("SEVERITY_MODEL")
+    return SeverityModel.from_file(path) if path else SeverityModel()
+
+
+default_model = load_default_model()
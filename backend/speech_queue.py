@@ -0,0 +1,217 @@
+# speech_queue.py
+"""
+Background speech queue.
+
+Routes call speech_queue.say(...) and return immediately; a single
+long-lived worker thread owns the TTS engine and speaks utterances one at a
+time. The queue is bounded and priority-aware:
+
+- a new utterance on the same channel replaces the pending one (only the
+  latest compile result / chat reply is worth saying),
+- utterances older than max_age when they reach the front are dropped,
+- when the queue is full the least important pending utterance is dropped.
+
+Set TTS_DRIVER=none (or run without pyttsx3) for a no-op driver on headless
+servers.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from emotional_module import (
+    EMOTION_SETTINGS, DEFAULT_EMOTION, TTS_DRIVER_NAME,
+    select_voice, prepare_text,
+)
+from metrics import TTS_QUEUE_SECONDS, TTS_SECONDS
+from startup import subsystems
+
+PRIORITY_HIGH = 0    # compile results
+PRIORITY_NORMAL = 1  # chat replies, UI requests
+PRIORITY_LOW = 2
+
+DEFAULT_MAX_PENDING = int(os.getenv("TTS_MAX_PENDING", "8"))
+DEFAULT_MAX_AGE = float(os.getenv("TTS_MAX_AGE", "15"))
+
+
+# --- Drivers ---
+class NullDriver:
+    """Driver that only logs; used headless or when no TTS engine is available."""
+    name = "null"
+
+    def speak(self, error_type, text, voice_choice):
+        print(f"[TTS] (null driver) {error_type}: '{text[:60]}'")
+
+    def stop(self):
+        pass
+
+
+class Pyttsx3Driver:
+    """Long-lived pyttsx3 engine; created lazily inside the worker thread."""
+    name = "pyttsx3"
+
+    def __init__(self):
+        self._engine = None
+        self._voice_ids = {}
+
+    def _get_engine(self):
+        if self._engine is None:
+            if os.name == "nt":
+                # SAPI5 needs COM initialised on the thread that owns the engine
+                try:
+                    import pythoncom
+                    pythoncom.CoInitialize()
+                except ImportError:
+                    pass
+            self._engine = subsystems.load("tts").init(driverName=TTS_DRIVER_NAME)
+            self._voices = self._engine.getProperty('voices')
+        return self._engine
+
+    def speak(self, error_type, text, voice_choice):
+        engine = self._get_engine()
+        if voice_choice not in self._voice_ids:
+            self._voice_ids[voice_choice] = select_voice(self._voices, voice_choice)
+        if self._voice_ids[voice_choice]:
+            engine.setProperty('voice', self._voice_ids[voice_choice])
+        settings = EMOTION_SETTINGS.get(error_type, DEFAULT_EMOTION)
+        engine.setProperty('rate', settings["rate"])
+        engine.setProperty('volume', settings["volume"])
+        engine.say(text)
+        engine.runAndWait()
+
+    def stop(self):
+        if self._engine is not None:
+            try:
+                self._engine.stop()
+            except Exception:
+                pass
+
+
+def make_driver(name=None):
+    name = (name or os.getenv("TTS_DRIVER", "auto")).lower()
+    if name in ("none", "null", "off") or not subsystems.available("tts"):
+        return NullDriver()
+    return Pyttsx3Driver()
+
+
+# --- Queue ---
+class _Utterance:
+    __slots__ = ("priority", "seq", "channel", "error_type", "text", "voice", "created_at")
+
+    def __init__(self, priority, seq, channel, error_type, text, voice):
+        self.priority = priority
+        self.seq = seq
+        self.channel = channel
+        self.error_type = error_type
+        self.text = text
+        self.voice = voice
+        self.created_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SpeechQueue:
+    def __init__(self, driver=None, max_pending=DEFAULT_MAX_PENDING, max_age=DEFAULT_MAX_AGE):
+        self.driver = driver or make_driver()
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self._heap = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._thread = None
+        self._speaking = None
+        self.spoken = 0
+        self.coalesced = 0
+        self.dropped_stale = 0
+        self.dropped_full = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="speech-worker", daemon=True)
+            self._thread.start()
+
+    def say(self, error_type, text, voice="female", priority=PRIORITY_NORMAL, channel="default"):
+        """Queue an utterance. Returns False if it was rejected because the queue is full."""
+        text = prepare_text(text or "")
+        with self._cond:
+            self._ensure_started()
+            # Coalesce: a newer utterance on the same channel supersedes the pending one
+            for i, u in enumerate(self._heap):
+                if u.channel == channel:
+                    self._heap.pop(i)
+                    heapq.heapify(self._heap)
+                    self.coalesced += 1
+                    break
+            new = _Utterance(priority, next(self._seq), channel, error_type, text, voice)
+            if len(self._heap) >= self.max_pending:
+                worst = max(self._heap)
+                if new < worst:
+                    self._heap.remove(worst)
+                    heapq.heapify(self._heap)
+                    self.dropped_full += 1
+                else:
+                    self.dropped_full += 1
+                    return False
+            heapq.heappush(self._heap, new)
+            self._cond.notify()
+        return True
+
+    def stop(self):
+        """Drop everything pending and cut off the current utterance."""
+        with self._cond:
+            self._heap.clear()
+        self.driver.stop()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                u = heapq.heappop(self._heap)
+                if time.monotonic() - u.created_at > self.max_age:
+                    self.dropped_stale += 1
+                    continue
+                self._speaking = u
+                return u
+
+    def _run(self):
+        while True:
+            u = self._next()
+            started = time.monotonic()
+            TTS_QUEUE_SECONDS.observe(started - u.created_at)
+            outcome = "ok"
+            try:
+                self.driver.speak(u.error_type, u.text, u.voice)
+                self.spoken += 1
+            except Exception as e:
+                outcome = "error"
+                self.failed += 1
+                print(f"[TTS] ERROR: {e}")
+                # Rebuild the engine on the next utterance
+                if isinstance(self.driver, Pyttsx3Driver):
+                    self.driver = Pyttsx3Driver()
+            finally:
+                self._speaking = None
+                TTS_SECONDS.observe(time.monotonic() - started, outcome=outcome)
+
+    def status(self):
+        with self._cond:
+            speaking = self._speaking
+            return {
+                "driver": self.driver.name,
+                "pending": len(self._heap),
+                "max_pending": self.max_pending,
+                "speaking": {"channel": speaking.channel, "text": speaking.text[:80]} if speaking else None,
+                "spoken": self.spoken,
+                "coalesced": self.coalesced,
+                "dropped_stale": self.dropped_stale,
+                "dropped_full": self.dropped_full,
+                "failed": self.failed,
+            }
+
+
+# Shared queue used by the Flask routes
+speech_queue = SpeechQueue()
@@ -0,0 +1,164 @@
+# startup.py
+"""
+Lazy optional subsystems and the cold-start report.
+
+The backend used to import Gemini, pyttsx3, speech_recognition and pyserial
+at startup (and refused to start without GEMINI_API_KEY), which is slow and
+fragile in containers with no audio or serial devices. Each of those is now a
+subsystem that is imported and initialized on first use:
+
+    genai = subsystems.load("gemini")      # imports + configures once, timed
+    subsystems.available("tts")            # installed? (nothing is imported)
+
+load() raises SubsystemUnavailable when the package is missing; an init error
+(e.g. no API key) is raised as-is and retried on the next call.
+
+The report breaks startup down into phases (marked by app.py) and per-subsystem
+import/init cost; it is served at GET /startup, and
+
+    python app.py --startup-report
+
+loads every installed subsystem and prints it instead of starting the server.
+"""
+import importlib
+import importlib.util
+import os
+import threading
+import time
+
+PROCESS_START = time.perf_counter()
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+class SubsystemUnavailable(RuntimeError):
+    """The subsystem's package is not installed."""
+
+
+class Subsystem:
+    """One optional dependency: imported, then initialized, on the first load()."""
+
+    def __init__(self, name, module, init=None, env=None):
+        self.name = name
+        self.module = module
+        self.init = init
+        self.env = env            # environment variable it cannot work without
+        self._module = None
+        self._installed = None
+        self._lock = threading.Lock()
+        self.import_ms = None
+        self.init_ms = None
+        self.loaded_at_ms = None  # since process start
+        self.error = None
+
+    def installed(self):
+        if self._installed is None:
+            try:
+                self._installed = importlib.util.find_spec(self.module.split(".")[0]) is not None
+            except (ImportError, ValueError):
+                self._installed = False
+        return self._installed
+
+    def available(self):
+        return self.installed() and (self.env is None or bool(os.getenv(self.env)))
+
+    def load(self):
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is not None:
+                return self._module
+            start = time.perf_counter()
+            try:
+                module = importlib.import_module(self.module)
+            except ImportError as e:
+                self._installed = False
+                self.error = f"not installed: {e}"
+                raise SubsystemUnavailable(f"{self.name} is not available ({self.module} is not installed)") from e
+            self.import_ms = _ms(start)
+            if self.init is not None:
+                start = time.perf_counter()
+                try:
+                    self.init(module)
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                finally:
+                    self.init_ms = _ms(start)
+            self.error = None
+            self.loaded_at_ms = _ms(PROCESS_START)
+            self._module = module
+            return module
+
+    def stats(self):
+        return {
+            "installed": self.installed(),
+            "available": self.available(),
+            "loaded": self._module is not None,
+            "import_ms": self.import_ms,
+            "init_ms": self.init_ms,
+            "loaded_at_ms": self.loaded_at_ms,
+            "error": self.error,
+        }
+
+
+def _init_gemini(genai):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment variables. Please check your .env file.")
+    genai.configure(api_key=api_key)
+    print("✅ Gemini API configured successfully")
+
+
+def _init_serial(serial):
+    importlib.import_module("serial.tools.list_ports")  # port auto-detection
+
+
+class Subsystems:
+    """Registry of lazy subsystems plus the startup phase timings."""
+
+    def __init__(self):
+        self._subsystems = {}
+        self._phases = {}
+        self._last_mark = PROCESS_START
+
+    def register(self, subsystem):
+        self._subsystems[subsystem.name] = subsystem
+        return subsystem
+
+    def load(self, name):
+        return self._subsystems[name].load()
+
+    def available(self, name):
+        return self._subsystems[name].available()
+
+    def mark(self, phase):
+        """Record the time since the previous mark (or process start) under phase."""
+        now = time.perf_counter()
+        self._phases[phase] = round((now - self._last_mark) * 1000, 2)
+        self._last_mark = now
+
+    def load_all(self):
+        """Load every available subsystem (for the report); failures are recorded, not raised."""
+        for subsystem in self._subsystems.values():
+            if subsystem.available():
+                try:
+                    subsystem.load()
+                except Exception:
+                    pass
+
+    def stats(self):
+        return {
+            "since_start_ms": _ms(PROCESS_START),
+            "phases_ms": dict(self._phases),
+            "subsystems": {name: s.stats() for name, s in self._subsystems.items()},
+        }
+
+
+subsystems = Subsystems()
+subsystems.register(Subsystem("gemini", "google.generativeai", init=_init_gemini, env="GEMINI_API_KEY"))
+subsystems.register(Subsystem("tts", "pyttsx3"))
+subsystems.register(Subsystem("speech_recognition", "speech_recognition"))
+subsystems.register(Subsystem("serial", "serial", init=_init_serial))
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing app must not speak, probe for an Arduino, log traces or touch the real LLM cache
+os.environ.setdefault("TTS_DRIVER", "none")
+os.environ.setdefault("SERIAL_PORT", "none")
+os.environ.setdefault("TRACE_LOG", "off")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="codemate-tests-"), "llm.sqlite3"))
@@ -0,0 +1,82 @@
+import shutil
+
+import pytest
+
+from compile_cache import CompileCache, make_cache_key
+
+FLAGS = ["-Wall"]
+
+
+def test_key_changes_with_source_flags_and_gcc_version():
+    key = make_cache_key("int main(void){return 0;}", FLAGS, gcc_version="gcc 12.2.0")
+    assert key == make_cache_key("int main(void){return 0;}", ["-Wall"], gcc_version="gcc 12.2.0")
+    assert key != make_cache_key("int main(void){return 1;}", FLAGS, gcc_version="gcc 12.2.0")
+    assert key != make_cache_key("int main(void){return 0;}", ["-Wall", "-O2"], gcc_version="gcc 12.2.0")
+    assert key != make_cache_key("int main(void){return 0;}", FLAGS, gcc_version="gcc 13.1.0")
+
+
+def test_key_separates_flags_from_source():
+    # The NUL separators keep "flags + source" from colliding with a shifted split
+    assert make_cache_key("b", ["a"], gcc_version="v") != make_cache_key(" b", ["a", ""], gcc_version="v")
+
+
+def test_lru_eviction_by_entry_count():
+    cache = CompileCache(max_entries=2)
+    cache.put("a", "success", "", {})
+    cache.put("b", "success", "", {})
+    assert cache.get("a") is not None  # a is now the most recently used
+    cache.put("c", "success", "", {})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_eviction_by_total_size():
+    cache = CompileCache(max_entries=10, max_bytes=100)
+    cache.put("a", "success", "", {}, binary=b"x" * 60)
+    cache.put("b", "success", "", {}, binary=b"x" * 60)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 60
+
+
+def test_oversized_entry_is_not_cached():
+    cache = CompileCache(max_bytes=10)
+    cache.put("big", "success", "", {}, binary=b"x" * 11)
+    assert cache.get("big") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_replacing_an_entry_keeps_the_size_right():
+    cache = CompileCache()
+    cache.put("a", "failed", "error: x" * 10, {})
+    cache.put("a", "failed", "e", {})
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (1, 1)
+
+
+def test_entry_classification_is_a_copy():
+    cache = CompileCache()
+    classification = {"error_type": "Syntax Error"}
+    cache.put("a", "failed", "", classification)
+    classification["error_type"] = "changed"
+    assert cache.get("a")["classification"] == {"error_type": "Syntax Error"}
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_compile_c_program_hits_the_cache_for_identical_source(tmp_path):
+    from compiler import compile_c_program
+
+    def compile_in(name, code):
+        folder = tmp_path / name
+        folder.mkdir()
+        src = folder / "main.c"
+        src.write_text(code)
+        return compile_c_program(str(src), output_file=str(folder / "main.out"), skip_execution=True)
+
+    code = "int main(void) { return 0; }\n"
+    first = compile_in("first", code)
+    second = compile_in("second", code)
+    edited = compile_in("edited", code + "/* edited */\n")
+    assert first["status"] == second["status"] == "success"
+    assert second["cached"] and second["build_id"] == first["build_id"]
+    assert not edited["cached"]
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from compile_scheduler import CompileScheduler, SchedulerBusy, SchedulerTimeout
+from workspace import WorkspaceManager
+
+
+def blocking_job(release, started, seen):
+    """Stands in for gcc: signals that it runs, waits, then checks its workspace is still there."""
+    def job(path):
+        started.set()
+        release.wait(5)
+        seen.append(os.path.isdir(path))
+        return "done"
+    return job
+
+
+def eventually(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return check()
+
+
+def test_cancelled_request_keeps_workspace_until_compile_finishes(tmp_path):
+    scheduler = CompileScheduler(workers=1, queue_size=4)
+    manager = WorkspaceManager(root=str(tmp_path), sweep_interval=3600)
+    release, started, seen = threading.Event(), threading.Event(), []
+    job = blocking_job(release, started, seen)
+
+    async def request(holder):
+        with manager.job() as ws:
+            holder.append(ws)
+            return await scheduler.run_async(job, ws.path, workspace=ws)
+
+    async def main():
+        holder = []
+        task = asyncio.create_task(request(holder))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()  # client disconnected mid-compile
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return holder[0]
+
+    ws = asyncio.run(main())
+    assert os.path.isdir(ws.path)  # gcc is still running in it
+    assert manager.stats()["active_jobs"] == 1
+    release.set()
+    assert ws.pending[0].result(5) == "done"
+    assert seen == [True]
+    # Done-callbacks run just after result() returns
+    assert eventually(lambda: manager.stats()["active_jobs"] == 0)
+    assert not os.path.exists(ws.path)
+    assert manager.stats()["deferred"] == 1
+
+
+def test_cancelled_request_drops_its_queued_job(tmp_path):
+    scheduler = CompileScheduler(workers=1, queue_size=4)
+    manager = WorkspaceManager(root=str(tmp_path), sweep_interval=3600)
+    release, started, seen = threading.Event(), threading.Event(), []
+    ran = []
+
+    async def main():
+        blocker = asyncio.create_task(scheduler.run_async(blocking_job(release, started, seen), str(tmp_path)))
+        await asyncio.to_thread(started.wait, 5)
+        with manager.job() as ws:
+            queued = asyncio.create_task(scheduler.run_async(ran.append, ws.path, workspace=ws))
+            await asyncio.sleep(0.05)
+            queued.cancel()
+            try:
+                await queued
+            except asyncio.CancelledError:
+                pass
+        release.set()
+        await blocker
+        return ws
+
+    ws = asyncio.run(main())
+    assert ws.pending[0].cancelled()
+    assert not os.path.exists(ws.path)
+    assert ran == []
+
+
+def fill(scheduler, release, count):
+    """Occupy the workers and queue with jobs that block until release is set."""
+    return [scheduler.submit(release.wait, 5) for _ in range(count)]
+
+
+def test_full_queue_raises_busy_with_retry_after():
+    scheduler = CompileScheduler(workers=1, queue_size=1)
+    release = threading.Event()
+    try:
+        running = fill(scheduler, release, 1)
+        assert eventually(lambda: scheduler.stats()["running"] == 1)
+        fill(scheduler, release, 1)  # takes the only queue slot
+        with pytest.raises(SchedulerBusy) as busy:
+            scheduler.submit(len, "x")
+        assert busy.value.retry_after >= 1
+        with pytest.raises(SchedulerBusy):
+            scheduler.check_capacity()
+        assert scheduler.stats()["rejected"] == 2
+    finally:
+        release.set()
+    assert running[0].result(5)
+
+
+def test_queue_wait_timeout_withdraws_the_job():
+    scheduler = CompileScheduler(workers=1, queue_size=4)
+    release, ran = threading.Event(), []
+    try:
+        fill(scheduler, release, 1)
+        with pytest.raises(SchedulerTimeout):
+            scheduler.run(ran.append, "late", timeout=0.1)
+        with pytest.raises(SchedulerTimeout):
+            asyncio.run(scheduler.run_async(ran.append, "late", timeout=0.1))
+    finally:
+        release.set()
+    scheduler.run(ran.append, "after")  # the withdrawn jobs are skipped, not run later
+    assert ran == ["after"]
+    assert scheduler.stats()["timed_out"] == 2
+
+
+def test_timeout_does_not_cut_short_a_running_job():
+    scheduler = CompileScheduler(workers=1, queue_size=4)
+    assert scheduler.run(lambda: time.sleep(0.3) or "slow", timeout=0.1) == "slow"
+    assert asyncio.run(scheduler.run_async(lambda: time.sleep(0.3) or "slow", timeout=0.1)) == "slow"
+
+
+def test_job_exceptions_reach_the_caller():
+    scheduler = CompileScheduler(workers=1, queue_size=4)
+    with pytest.raises(ZeroDivisionError):
+        scheduler.run(lambda: 1 / 0)
+
+
+@pytest.fixture
+def flask_client(monkeypatch):
+    import app as flask_backend
+
+    scheduler = CompileScheduler(workers=1, queue_size=1, job_timeout=0.1)
+    monkeypatch.setattr(flask_backend, "compile_scheduler", scheduler)
+    return flask_backend.app.test_client(), scheduler
+
+
+def test_compile_route_answers_429_when_the_queue_is_full(flask_client):
+    client, scheduler = flask_client
+    release = threading.Event()
+    try:
+        fill(scheduler, release, 1)
+        assert eventually(lambda: scheduler.stats()["running"] == 1)
+        fill(scheduler, release, 1)
+        resp = client.post("/compile", json={"code": "int main(void) { return 0; }"})
+    finally:
+        release.set()
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert resp.get_json()["retry_after"] >= 1
+
+
+def test_compile_route_answers_504_when_no_worker_frees_up(flask_client):
+    client, scheduler = flask_client
+    release = threading.Event()
+    try:
+        fill(scheduler, release, 1)
+        assert eventually(lambda: scheduler.stats()["running"] == 1)
+        resp = client.post("/compile", json={"code": "int main(void) { return 0; }"})
+    finally:
+        release.set()
+    assert resp.status_code == 504
+    assert "waited more than" in resp.get_json()["error"]
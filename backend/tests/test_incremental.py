@@ -0,0 +1,79 @@
+from incremental import AnalysisSessions, diff_diagnostics, map_lines
+
+
+def diag(line, message="expected ';' before '}' token", severity="error", column=5, option=""):
+    return {"severity": severity, "message": message, "line": line, "column": column, "option": option}
+
+
+def compile_result(*records):
+    return {"classification": {"diagnostics": list(records)}}
+
+
+def test_map_lines_follows_inserted_and_deleted_lines():
+    old = ["a", "b", "c", "d"]
+    new = ["a", "inserted", "b", "d"]  # c deleted, a line inserted above b
+    assert map_lines(old, new) == {1: 1, 2: 3, 4: 4}
+
+
+def test_map_lines_maps_same_length_rewrites_line_by_line():
+    assert map_lines(["int x = 1", "y;"], ["int x = 2", "y;"]) == {1: 1, 2: 2}
+
+
+def test_diagnostic_on_a_moved_line_is_unchanged():
+    old = [diag(3)]
+    new, unchanged, resolved = diff_diagnostics(old, [diag(4)], {3: 4})
+    assert (new, resolved) == ([], [])
+    assert unchanged == [(old[0], diag(4))]
+
+
+def test_changed_message_or_column_is_new_and_the_old_one_resolved():
+    old = [diag(3)]
+    for changed in (diag(3, message="'x' undeclared"), diag(3, column=9), diag(3, severity="warning")):
+        new, unchanged, resolved = diff_diagnostics(old, [changed], {3: 3})
+        assert (new, unchanged, resolved) == ([changed], [], old)
+
+
+def test_diagnostic_on_a_deleted_line_is_resolved():
+    old = [diag(2)]
+    new, unchanged, resolved = diff_diagnostics(old, [diag(2)], {1: 1})  # old line 2 is gone
+    assert (new, unchanged, resolved) == ([diag(2)], [], old)
+
+
+def test_duplicate_diagnostics_match_one_to_one():
+    old = [diag(5), diag(5)]
+    new, unchanged, resolved = diff_diagnostics(old, [diag(5), diag(5), diag(5)], {5: 5})
+    assert len(unchanged) == 2 and len(new) == 1 and resolved == []
+
+
+def test_link_errors_without_a_line_match_on_the_message():
+    old = [diag(None, message="undefined reference to `foo'", column=None)]
+    new, unchanged, resolved = diff_diagnostics(old, [dict(old[0])], {})
+    assert (new, resolved) == ([], []) and len(unchanged) == 1
+
+
+def test_session_reuses_explanations_for_unchanged_diagnostics():
+    sessions = AnalysisSessions()
+    code = "int main(void)\n{\n    int x\n    return 0;\n}\n"
+    first = sessions.update("s", code, compile_result(diag(3)))
+    assert first["first"] and len(first["pending"]) == 1
+    explanation_id = sessions.attach_explanation("s", first["pending"], "Add a semicolon.")
+
+    # A comment above moves the error down a line; it keeps its id and explanation
+    moved = sessions.update("s", "/* lab 1 */\n" + code, compile_result(diag(4)))
+    assert moved["pending"] == [] and moved["new"] == [] and moved["resolved"] == []
+    [kept] = moved["unchanged"]
+    assert (kept["id"], kept["explanation_id"], kept["previous_line"]) == (first["pending"][0]["id"], explanation_id, 3)
+    assert sessions.current_explanations("s") == {explanation_id: {"explanation": "Add a semicolon.", "autofix": ""}}
+
+    fixed = sessions.update("s", "/* lab 1 */\n" + code.replace("int x", "int x;"), compile_result())
+    assert len(fixed["resolved"]) == 1 and fixed["pending"] == []
+    assert sessions.current_explanations("s") == {}
+    assert sessions.stats()["diagnostics_reused"] == 1
+
+
+def test_sessions_are_evicted_least_recently_used_first():
+    sessions = AnalysisSessions(max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        sessions.update(session_id, "int main(void) { return 0; }", compile_result())
+    assert sessions.stats()["evicted"] == 1
+    assert sessions.update("a", "int main(void) { return 0; }", compile_result())["first"]
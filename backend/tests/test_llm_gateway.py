@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from llm_gateway import GatewayBusy, LLMGateway, current_user
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeRouter:
+    """Stands in for model_router: counts calls and can hold them until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+
+    def generate(self, prompt, **kwargs):
+        self.calls.append(prompt)
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("upstream failed")
+        return FakeResponse(f"answer to {prompt}")
+
+    async def generate_async(self, prompt, **kwargs):
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+
+
+def as_user(user, fn, *args):
+    context = contextvars.copy_context()
+    context.run(current_user.set, user)
+    return context.run(fn, *args)
+
+
+def run_threads(targets):
+    results = [None] * len(targets)
+
+    def call(i, fn):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, fn)) for i, fn in enumerate(targets)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_identical_prompts_share_one_upstream_call():
+    router = FakeRouter()
+    gateway = LLMGateway(rpm=600, router=router)
+    router.release.clear()
+    threading.Timer(0.2, router.release.set).start()
+    results = run_threads([lambda: gateway.generate("explain: missing ;")] * 5)
+    assert router.calls == ["explain: missing ;"]
+    assert {r.text for r in results} == {"answer to explain: missing ;"}
+    assert gateway.stats()["coalesced"] == 4
+    assert gateway.generate("explain: missing ;").text  # the flight is over: a new call goes upstream
+    assert len(router.calls) == 2
+
+
+def test_different_prompts_are_not_coalesced():
+    router = FakeRouter()
+    gateway = LLMGateway(rpm=600, router=router)
+    run_threads([lambda: gateway.generate("a"), lambda: gateway.generate("b")])
+    assert sorted(router.calls) == ["a", "b"]
+    assert gateway.stats()["coalesced"] == 0
+
+
+def test_followers_get_the_leaders_error():
+    router = FakeRouter()
+    router.fail = True
+    gateway = LLMGateway(rpm=600, router=router)
+    router.release.clear()
+    threading.Timer(0.2, router.release.set).start()
+    results = run_threads([lambda: gateway.generate("same")] * 3)
+    assert len(router.calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_async_single_flight():
+    router = FakeRouter()
+    gateway = LLMGateway(rpm=600, router=router)
+
+    async def main():
+        return await asyncio.gather(*(gateway.generate_async("same") for _ in range(4)))
+
+    assert [r.text for r in asyncio.run(main())] == ["answer to same"] * 4
+    assert router.calls == ["same"]
+
+
+def test_queued_requests_are_served_round_robin_across_users():
+    gateway = LLMGateway(rpm=6000, router=FakeRouter())  # one grant every 10 ms once drained
+    gateway._requests.level = 0
+    order = []
+    with gateway._cond:  # queue everything before the dispatcher grants anything
+        for user, count in (("alice", 6), ("bob", 2), ("carol", 2)):
+            for i in range(count):
+                as_user(user, gateway._admit, 10, lambda label=f"{user}{i + 1}": order.append(label))
+    deadline = time.monotonic() + 5
+    while len(order) < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert order == ["alice1", "bob1", "carol1", "alice2", "bob2", "carol2",
+                     "alice3", "alice4", "alice5", "alice6"]
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    gateway = LLMGateway(rpm=60, max_queue=2, router=FakeRouter())
+    gateway._requests.level = 0
+    with gateway._cond:
+        gateway._admit(10, lambda: None)
+        gateway._admit(10, lambda: None)
+        with pytest.raises(GatewayBusy) as busy:
+            gateway._admit(10, lambda: None)
+    assert busy.value.retry_after >= 1
+    assert gateway.stats()["rejected"] == 1
+
+
+def test_queue_timeout_withdraws_the_request():
+    gateway = LLMGateway(rpm=1, queue_timeout=0.1, router=FakeRouter())
+    gateway._requests.level = 0
+    with pytest.raises(GatewayBusy):
+        gateway.acquire(10)
+    stats = gateway.stats()
+    assert (stats["queued_now"], stats["queued_users"], stats["rejected"]) == (0, 0, 1)
+
+
+def test_token_estimate_is_corrected_from_usage():
+    router = FakeRouter()
+    gateway = LLMGateway(rpm=600, tpm=100_000, router=router)
+    response = FakeResponse("ok")
+    response.usage_metadata = type("Usage", (), {"total_token_count": 50, "prompt_token_count": 30,
+                                                 "candidates_token_count": 20})()
+    router.generate = lambda prompt, **kwargs: response
+    gateway.generate("x" * 400, generation_config={"max_output_tokens": 100})  # estimated 200
+    stats = gateway.stats()
+    assert (stats["tokens_estimated"], stats["tokens_used"]) == (200, 50)
+    assert stats["tokens_available"] >= 100_000 - 60  # refunded down to the real 50, plus refill
@@ -0,0 +1,33 @@
+import json
+
+from diagnostics import parse_gcc_output
+from local_explainer import apply_fixits, fixit_edits
+
+TAB_SOURCE = '#include <stdio.h>\nint main(void)\n{\n\tint count = 1;\n\tprintf("%d\\n", cont);\n\treturn 0;\n}\n'
+
+# What gcc 12 -fdiagnostics-format=json reports for TAB_SOURCE: the tab makes the
+# display column (24) differ from the byte column (17)
+TAB_DIAGNOSTICS = json.dumps([{
+    "kind": "error",
+    "message": "'cont' undeclared (first use in this function); did you mean 'count'?",
+    "locations": [{"caret": {"file": "tab.c", "line": 5, "column": 24, "display-column": 24, "byte-column": 17},
+                   "finish": {"file": "tab.c", "line": 5, "column": 27, "display-column": 27, "byte-column": 20}}],
+    "fixits": [{"start": {"file": "tab.c", "line": 5, "column": 24, "display-column": 24, "byte-column": 17},
+                "next": {"file": "tab.c", "line": 5, "column": 28, "display-column": 28, "byte-column": 21},
+                "string": "count"}],
+    "children": [],
+}])
+
+
+def test_fixit_on_tab_indented_line():
+    records, _ = parse_gcc_output(TAB_DIAGNOSTICS)
+    assert records[0]["column"] == 17
+    assert records[0]["display_column"] == 24
+    lines = TAB_SOURCE.splitlines()
+    assert fixit_edits(records[0], lines) == {5: '\tprintf("%d\\n", count);'}
+
+
+def test_fixit_columns_are_utf8_bytes():
+    line = '\tprintf("é%d\\n", cont);'  # é is two bytes, so cont starts at byte column 19
+    fixit = {"line": 1, "column": 19, "end_line": 1, "end_column": 23, "insert": "count"}
+    assert apply_fixits(line, [fixit], 1) == '\tprintf("é%d\\n", count);'
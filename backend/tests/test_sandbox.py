@@ -0,0 +1,96 @@
+import shutil
+import subprocess
+
+import pytest
+
+from sandbox import Sandbox, forkserver_supported
+
+pytestmark = pytest.mark.skipif(shutil.which("gcc") is None or not forkserver_supported(),
+                                reason="needs gcc and a POSIX host")
+
+# Prints every descriptor >= 3 the program was started with
+LIST_FDS = r"""
+#include <stdio.h>
+#include <fcntl.h>
+int main(void) {
+    for (int fd = 3; fd < 1024; fd++)
+        if (fcntl(fd, F_GETFD) != -1) printf("%d\n", fd);
+    return 0;
+}
+"""
+FLOOD = '#include <stdio.h>\nint main(void) { for (;;) puts("spam"); }\n'
+SPIN = "int main(void) { for (;;); }\n"
+BIG_MALLOC = '#include <stdio.h>\n#include <stdlib.h>\nint main(void) { puts(malloc(512u << 20) ? "got it" : "refused"); return 0; }\n'
+BIG_FILE = ('#include <stdio.h>\nint main(void) { FILE *f = fopen("out.bin", "w"); static char block[65536];\n'
+            '    for (int i = 0; i < 64; i++) fwrite(block, 1, sizeof block, f); fclose(f); return 0; }\n')
+ECHO = '#include <stdio.h>\nint main(void) { int n; scanf("%d", &n); printf("%d\\n", n * 2); return 3; }\n'
+
+
+def build(tmp_path, source, name="prog"):
+    src = tmp_path / f"{name}.c"
+    src.write_text(source)
+    exe = tmp_path / name
+    subprocess.run(["gcc", str(src), "-o", str(exe)], check=True)
+    return str(exe)
+
+
+@pytest.fixture(params=[2, 0], ids=["forkserver", "popen"])
+def sandbox(request):
+    box = Sandbox(forkservers=request.param, output_limit=1024)
+    yield box
+    box.shutdown()
+
+
+def test_program_sees_only_stdio(tmp_path, sandbox):
+    exe = build(tmp_path, LIST_FDS)
+    for _ in range(3):  # later jobs too: received pipe ends must not pile up
+        result = sandbox.run(exe, timeout=5)
+        assert result["returncode"] == 0
+        assert result["stdout"] == ""
+
+
+def test_stdin_stdout_and_exit_code(tmp_path, sandbox):
+    result = sandbox.run(build(tmp_path, ECHO), "21\n", timeout=5)
+    assert (result["stdout"], result["returncode"], result["timed_out"]) == ("42\n", 3, False)
+
+
+def test_output_flood_is_truncated(tmp_path, sandbox):
+    result = sandbox.run(build(tmp_path, FLOOD), timeout=5)
+    assert result["truncated"]
+    assert result["stdout"].endswith("(output truncated)")
+    assert len(result["stdout"].encode()) < 1024 + 100
+
+
+def test_wall_clock_timeout(tmp_path):
+    box = Sandbox(limits={"cpu_seconds": 30}, forkservers=1)
+    try:
+        result = box.run(build(tmp_path, SPIN), timeout=0.5)
+    finally:
+        box.shutdown()
+    assert result["timed_out"]
+    assert result["duration_ms"] < 5000
+
+
+def test_cpu_limit_kills_the_program(tmp_path):
+    box = Sandbox(limits={"cpu_seconds": 1}, forkservers=1)
+    try:
+        result = box.run(build(tmp_path, SPIN), timeout=10)
+    finally:
+        box.shutdown()
+    assert not result["timed_out"]
+    assert result["signal_message"] == "CPU time limit exceeded"
+
+
+def test_memory_limit(tmp_path, sandbox):
+    result = sandbox.run(build(tmp_path, BIG_MALLOC), timeout=5)
+    assert result["stdout"] == "refused\n"
+
+
+def test_file_size_limit(tmp_path):
+    box = Sandbox(limits={"fsize_mb": 1}, forkservers=1)
+    try:
+        result = box.run(build(tmp_path, BIG_FILE), timeout=5)
+    finally:
+        box.shutdown()
+    assert result["signal_message"] == "File size limit exceeded"
+    assert (tmp_path / "out.bin").stat().st_size <= 1024 * 1024
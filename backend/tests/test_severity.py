@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+import severity
+from compiler import calculate_severity_engine
+from severity import DEFAULT_TYPE_LEVELS, SeverityModel
+
+TYPES = [*DEFAULT_TYPE_LEVELS, "Linker Error", ""]  # two types the table doesn't know
+
+
+def reference_severity(error_count, warning_count, error_type, mode="pro"):
+    """calculate_severity_engine as it was before severity.py existed."""
+    level_scores = {0: 0, 1: 25, 2: 50, 3: 75, 4: 100}
+    a_level = DEFAULT_TYPE_LEVELS.get(error_type, 2)
+    total = error_count + warning_count
+    c_level = 3 if total >= 5 else 2 if total >= 3 else 1 if total >= 1 else 0
+    d_level = max(0, a_level - 1) if mode == "student" else a_level
+    final_score = (level_scores[a_level] * 0.4 + level_scores[a_level] * 0.3
+                   + level_scores[c_level] * 0.2 + level_scores[d_level] * 0.1)
+    percent = min(int(final_score), 100)
+    if percent == 0:
+        label, level = "No Error", 0
+    elif percent <= 30:
+        label, level = "Low", 1
+    elif percent <= 60:
+        label, level = "Medium", 2
+    elif percent <= 85:
+        label, level = "High", 3
+    else:
+        label, level = "Critical", 4
+    return {"severity_percent": percent, "severity_label": label, "severity_level": level}
+
+
+def random_records(n, seed=7):
+    rng = random.Random(seed)
+    return [{"error_count": rng.choice([0, 1, 2, 3, 4, 5, 6, rng.randint(0, 10_000)]),
+             "warning_count": rng.choice([0, 1, 2, rng.randint(0, 10_000)]),
+             "error_type": rng.choice(TYPES)} for _ in range(n)]
+
+
+def batch(model, records, mode):
+    return model.score_batch([r["error_count"] for r in records], [r["warning_count"] for r in records],
+                             model.encode_types([r["error_type"] for r in records]), mode)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(severity, "np", None)
+    return request.param
+
+
+@pytest.mark.parametrize("mode", ["pro", "student"])
+def test_scalar_matches_the_original_engine(mode):
+    for error_type in TYPES:
+        for errors in range(8):
+            for warnings in range(8):
+                assert calculate_severity_engine(errors, warnings, error_type, mode) == \
+                    reference_severity(errors, warnings, error_type, mode)
+
+
+@pytest.mark.parametrize("mode", ["pro", "student"])
+def test_score_batch_matches_the_original_engine(backend, mode):
+    records = random_records(20_000)
+    assert SeverityModel().score_records(records, mode) == \
+        [reference_severity(r["error_count"], r["warning_count"], r["error_type"], mode) for r in records]
+    out = batch(SeverityModel(), records, mode)
+    assert [int(p) for p in out["severity_percent"]] == \
+        [reference_severity(r["error_count"], r["warning_count"], r["error_type"], mode)["severity_percent"]
+         for r in records]
+
+
+def test_score_batch_matches_score_for_custom_weights(backend):
+    rng = random.Random(11)
+    records = random_records(5_000, seed=3)
+    for _ in range(20):
+        model = SeverityModel(weights=[rng.random() for _ in range(4)],
+                              label_thresholds=sorted(rng.sample(range(1, 100), 3)))
+        for mode in ("pro", "student"):
+            assert model.score_records(records, mode) == \
+                [model.score(r["error_count"], r["warning_count"], r["error_type"], mode) for r in records]
+
+
+def test_out_of_range_codes_count_as_unknown(backend):
+    model = SeverityModel()
+    out = model.score_batch([1, 1], [0, 0], [-1, 999])
+    unknown = model.score(1, 0, "Unknown Error")["severity_percent"]
+    assert [int(p) for p in out["severity_percent"]] == [unknown, unknown]
+
+
+def test_batch_rejects_mismatched_lengths(backend):
+    with pytest.raises(ValueError):
+        SeverityModel().score_batch([1, 2], [0], [0, 0])
+
+
+def test_invalid_models_are_rejected():
+    with pytest.raises(ValueError):
+        SeverityModel(weights=(1, 0, 0))
+    with pytest.raises(ValueError):
+        SeverityModel(type_levels={"Syntax Error": 9})
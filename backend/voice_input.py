@@ -1,6 +1,11 @@
-import speech_recognition as sr
+from startup import subsystems, SubsystemUnavailable  # speech_recognition is imported on first use
 
 def listen_to_user():
+    try:
+        sr = subsystems.load("speech_recognition")
+    except SubsystemUnavailable:
+        print("⚠️ speech_recognition is not installed.")
+        return "Speech recognition is not available."
     recognizer = sr.Recognizer()
 
     try:
@@ -45,6 +50,7 @@ def listen_to_user():
     
 # ✅ Wake-word listener
 def listen_wake_word():
+    sr = subsystems.load("speech_recognition")
     recognizer = sr.Recognizer()
     WAKE_WORD = "hey codemate"
 
@@ -0,0 +1,263 @@
+# workspace.py
+"""
+Per-job scratch directories for compile / run / autofix requests.
+
+Each request gets its own directory under WORKSPACE_ROOT holding the source
+file and binary; it is removed as soon as the request finishes. A background
+sweeper enforces an age limit and a total size quota for anything left behind
+(crashes, killed workers), so disk and inode usage stay bounded on
+long-running servers.
+
+    with workspace_manager.job() as ws:
+        src = ws.write_source(code)
+        compile_c_program(src, output_file=ws.exe_path)
+
+Environment:
+    WORKSPACE_ROOT          base directory (default: ./workspaces)
+    WORKSPACE_TMPFS=1       put the root on /dev/shm when available
+    WORKSPACE_MAX_AGE       seconds before an abandoned job dir is swept (600)
+    WORKSPACE_MAX_MB        total size quota for the root (256)
+    WORKSPACE_SWEEP_INTERVAL seconds between sweeps (60)
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+TMPFS_DIR = "/dev/shm"
+
+
+def default_root():
+    if os.getenv("WORKSPACE_ROOT"):
+        return os.getenv("WORKSPACE_ROOT")
+    if os.getenv("WORKSPACE_TMPFS", "0") == "1":
+        base = TMPFS_DIR if os.path.isdir(TMPFS_DIR) else tempfile.gettempdir()
+        return os.path.join(base, "codemate-workspaces")
+    return "workspaces"  # relative, like the old temp_submissions, so diagnostics stay short
+
+
+def _tree_usage(path):
+    """(bytes, files) under path; entries vanishing mid-walk are ignored."""
+    if not os.path.isdir(path):
+        try:
+            return os.path.getsize(path), 1
+        except OSError:
+            return 0, 0
+    total, files = 0, 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+                files += 1
+            except OSError:
+                pass
+    return total, files
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return not os.path.exists(path)
+
+
+class Workspace:
+    """One job's scratch directory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = []  # futures of jobs still using the directory
+
+    def keep_until(self, future):
+        """Keep the directory after the job block exits until this concurrent Future is done."""
+        self.pending.append(future)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    @property
+    def exe_path(self):
+        return self.file("main.exe" if os.name == "nt" else "main.out")
+
+    def write_source(self, code_text, name="main.c"):
+        path = self.file(name)
+        with open(path, "w", encoding="utf-8", errors="replace") as f:
+            f.write(code_text)
+        return path
+
+
+class WorkspaceManager:
+    """Allocates job directories and sweeps whatever cleanup missed."""
+
+    def __init__(self, root=None, max_age=None, max_bytes=None, sweep_interval=None):
+        self.root = root or default_root()
+        self.max_age = max_age if max_age is not None else float(os.getenv("WORKSPACE_MAX_AGE", "600"))
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(os.getenv("WORKSPACE_MAX_MB", "256")) * 1024 * 1024)
+        self.sweep_interval = sweep_interval if sweep_interval is not None else \
+            float(os.getenv("WORKSPACE_SWEEP_INTERVAL", "60"))
+        self._active = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.created = 0
+        self.cleaned = 0
+        self.cleanup_failures = 0
+        self.deferred = 0  # cleanups postponed until a running job finished
+        self.swept_age = 0
+        self.swept_quota = 0
+        self.last_sweep_ms = None
+
+    # --- jobs ---
+    @contextmanager
+    def job(self):
+        """
+        Yield a fresh Workspace; its directory is removed when the block exits, or,
+        if a job registered with keep_until() is still running (e.g. the request was
+        cancelled mid-compile), when the last such job finishes.
+        """
+        self.start()
+        name = uuid.uuid4().hex
+        path = os.path.join(self.root, name)
+        os.makedirs(path)
+        with self._lock:
+            self._active.add(name)
+            self.created += 1
+        ws = Workspace(path)
+        try:
+            yield ws
+        finally:
+            pending = [f for f in ws.pending if not f.done()]
+            if pending:
+                self._release_when_done(name, path, pending)
+            else:
+                self._release(name, path)
+
+    def _release_when_done(self, name, path, futures):
+        remaining = [len(futures)]
+        lock = threading.Lock()
+        with self._lock:
+            self.deferred += 1
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._release(name, path)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def _release(self, name, path):
+        ok = _remove(path)
+        with self._lock:
+            self._active.discard(name)
+            if ok:
+                self.cleaned += 1
+            else:
+                self.cleanup_failures += 1  # e.g. binary still locked on Windows; sweeper retries
+
+    # --- sweeper ---
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.root, exist_ok=True)
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._run, name="workspace-sweeper", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Workspace sweep failed: {e}")
+            self._stop_event.wait(self.sweep_interval)
+
+    def _inactive_entries(self):
+        """[(mtime, bytes, path)] for everything under root that no job is using."""
+        entries = []
+        with self._lock:
+            active = set(self._active)
+        try:
+            scan = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return entries
+        for entry in scan:
+            if entry.name in active:
+                continue
+            try:
+                mtime = entry.stat(follow_symlinks=False).st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, _tree_usage(entry.path)[0], entry.path))
+        return entries
+
+    def sweep(self, now=None):
+        """Remove entries older than max_age, then the oldest until under max_bytes."""
+        start = time.perf_counter()
+        now = now if now is not None else time.time()
+        remaining = []
+        for mtime, size, path in self._inactive_entries():
+            if now - mtime > self.max_age:
+                if _remove(path):
+                    self.swept_age += 1
+                    continue
+            remaining.append((mtime, size, path))
+
+        total = self.usage()["bytes"]
+        for mtime, size, path in sorted(remaining):
+            if total <= self.max_bytes:
+                break
+            if _remove(path):
+                self.swept_quota += 1
+                total -= size
+        self.last_sweep_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    # --- metrics ---
+    def usage(self):
+        total, files = _tree_usage(self.root) if os.path.isdir(self.root) else (0, 0)
+        return {"bytes": total, "files": files}
+
+    def stats(self):
+        usage = self.usage()
+        try:
+            disk = shutil.disk_usage(self.root)
+            disk_free_mb = round(disk.free / (1024 * 1024), 1)
+        except OSError:
+            disk_free_mb = None
+        with self._lock:
+            active = len(self._active)
+        return {
+            "root": os.path.abspath(self.root),
+            "active_jobs": active,
+            "bytes": usage["bytes"],
+            "files": usage["files"],
+            "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+            "max_age_s": self.max_age,
+            "disk_free_mb": disk_free_mb,
+            "created": self.created,
+            "cleaned": self.cleaned,
+            "cleanup_failures": self.cleanup_failures,
+            "deferred": self.deferred,
+            "swept_age": self.swept_age,
+            "swept_quota": self.swept_quota,
+            "last_sweep_ms": self.last_sweep_ms,
+        }
+
+
+workspace_manager = WorkspaceManager()
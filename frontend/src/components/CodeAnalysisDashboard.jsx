@@ -29,6 +29,50 @@ const globalStyles = `
   }
 `;
 
+// One id per browser tab; the backend queues AI requests fairly per user
+const CLIENT_ID = (window.crypto && window.crypto.randomUUID)
+  ? window.crypto.randomUUID()
+  : `c-${Date.now()}-${Math.random()}`;
+
+// --- Server-sent events over POST (EventSource only supports GET) ---
+// Calls onEvent(eventName, payload) for every event the backend streams.
+const postSSE = async (url, body, onEvent) => {
+  const res = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'X-User-Id': CLIENT_ID },
+    body: JSON.stringify(body)
+  });
+  if (!res.ok || !res.body) {
+    const json = await res.json().catch(() => ({}));
+    onEvent('error', { error: json.error || `Request failed (${res.status})` });
+    return;
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = 'message';
+      let data = '';
+      raw.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      try {
+        onEvent(event, data ? JSON.parse(data) : {});
+      } catch (e) {
+        console.error('Bad SSE payload:', e);
+      }
+    }
+  }
+};
+
 // --- Main Dashboard Component ---
 const CodeAnalysisDashboard = () => {
   const [codeText, setCodeText] = useState('');
@@ -54,6 +98,12 @@ const CodeAnalysisDashboard = () => {
   // NEW STATE FOR INPUT
   const [programInput, setProgramInput] = useState(''); 
   const [showInputArea, setShowInputArea] = useState(false); // New state to control input visibility
+  // Build handle from /compile so /run can execute the existing binary instead of recompiling
+  const [build, setBuild] = useState({ id: null, code: '' });
+  // Session id: lets /analyze reuse explanations for untouched diagnostics and /chat remember the conversation
+  const sessionId = useRef(
+    (window.crypto && window.crypto.randomUUID) ? window.crypto.randomUUID() : `s-${Date.now()}-${Math.random()}`
+  );
 
   // Check backend connection
   useEffect(() => {
@@ -113,6 +163,7 @@ const CodeAnalysisDashboard = () => {
     setShowCorrectedCode(false);
     setShowOutput(false);
     setCompilationSuccess(false);
+    setBuild({ id: null, code: '' });
     // Hide input area on new analysis (will be shown if input is needed)
     setShowInputArea(false);
     
@@ -120,119 +171,81 @@ const CodeAnalysisDashboard = () => {
     const needsInput = programNeedsInput(codeText); 
 
     try {
-      const compileRes = await fetch('http://localhost:5000/compile', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ code: codeText })
-      });
-      const compileJson = await compileRes.json();
-      setRawError(compileJson.raw_error || ''); 
+      // One request: the backend compiles once, then streams the explanation and the
+      // corrected code while it updates the hardware and speech on its own.
+      let streamed = '';
+      let compiled = false;
+      await postSSE(
+        'http://localhost:5000/analyze',
+        { code: codeText, session_id: sessionId.current, stream: true },
+        (event, payload) => {
+          if (event === 'compile') {
+            compiled = true;
+            setRawError(payload.raw_error || '');
+            const cls = payload.classification || {};
+            const isSuccess = payload.status === "success";
+            setCompilationSuccess(isSuccess);
+            setBuild({ id: payload.build_id || null, code: codeText });
 
-      if (compileRes.ok) {
-        const cls = compileJson.classification || {};
-        const isSuccess = compileJson.status === "success";
-        setCompilationSuccess(isSuccess);
+            setErrorType(cls.error_type || 'Unknown');
+            setErrorCount(cls.error_count || 0);
+            setWarningCount(cls.warning_count || 0);
+            setSeverityPercentage(cls.severity_percent || 0);
 
-        setErrorType(cls.error_type || 'Unknown');
-        setErrorCount(cls.error_count || 0);
-        setWarningCount(cls.warning_count || 0);
-        setSeverityPercentage(cls.severity_percent || 0);
+            // If compilation is successful (0 errors)
+            if (isSuccess) {
+              // Check if program needs input (either detected in code or from backend response)
+              const programOutput = payload.program_output || '';
+              const needsInputFromBackend = programOutput.includes('(Program requires input') ||
+                                           programOutput.includes('requires input');
+              const requiresInput = needsInput || needsInputFromBackend;
 
-        // If compilation is successful (0 errors)
-        if (isSuccess) {
-          // Check if program needs input (either detected in code or from backend response)
-          const programOutput = compileJson.program_output || '';
-          const needsInputFromBackend = programOutput.includes('(Program requires input') || 
-                                       programOutput.includes('requires input');
-          const requiresInput = needsInput || needsInputFromBackend;
-          
-          if (requiresInput) {
-            // Program needs input - don't run automatically, show input area
-            setExplanation('✅ Compilation successful! Your code compiled without errors. This program requires user input. Please provide input below and click "Run Program".');
-            setProgramOutput('');
-            setShowOutput(false);
-            setShowInputArea(true); // Show input area immediately
-            // Scroll to input area after a brief delay
-            setTimeout(() => {
-              document.querySelector('.input-area-container')?.scrollIntoView({ behavior: 'smooth', block: 'center' });
-            }, 300);
-          } else {
-            // Program doesn't need input - show output if available
-            setExplanation('✅ Compilation successful! Your code compiled without errors. The program output is displayed below.');
-            
-            if (compileJson.program_output !== undefined && compileJson.program_output !== null) {
-              const output = String(compileJson.program_output).trim();
-              if (output) {
-                setProgramOutput(output);
+              if (requiresInput) {
+                // Program needs input - don't run automatically, show input area
+                setExplanation('✅ Compilation successful! Your code compiled without errors. This program requires user input. Please provide input below and click "Run Program".');
+                setProgramOutput('');
+                setShowOutput(false);
+                setShowInputArea(true); // Show input area immediately
+                // Scroll to input area after a brief delay
+                setTimeout(() => {
+                  document.querySelector('.input-area-container')?.scrollIntoView({ behavior: 'smooth', block: 'center' });
+                }, 300);
               } else {
-                setProgramOutput('(Program executed successfully with no output)');
+                // Program doesn't need input - show output if available
+                setExplanation('✅ Compilation successful! Your code compiled without errors. The program output is displayed below.');
+                const output = String(programOutput).trim();
+                setProgramOutput(output || '(Program executed successfully with no output)');
+                setShowOutput(true);
+                setShowInputArea(false);
+                // Scroll to output section after a brief delay
+                setTimeout(() => {
+                  outputRef.current?.scrollIntoView({ behavior: 'smooth', block: 'start' });
+                }, 300);
               }
-            } else {
-              setProgramOutput('(Program executed successfully with no output)');
+            } else if (cls.error_count > 0 || cls.warning_count > 0) {
+              // Compilation failed - the explanation streams in next
+              setShowSeverityMeter(true);
             }
-            setShowOutput(true);
-            setShowInputArea(false);
-            // Scroll to output section after a brief delay
-            setTimeout(() => {
-              outputRef.current?.scrollIntoView({ behavior: 'smooth', block: 'start' });
-            }, 300);
-          }
-
-          // Update hardware (non-blocking, don't wait)
-          fetch('http://localhost:5000/hardware/update', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ classification: cls })
-          }).catch(() => {});
-        } else {
-          // Compilation failed - show error explanation
-          if (cls.error_count > 0 || cls.warning_count > 0) {
-            setShowSeverityMeter(true);
-          }
-
-          // 1. Update hardware (non-blocking)
-          fetch('http://localhost:5000/hardware/update', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ classification: cls })
-          }).catch(() => {});
-
-          // 2. Get explanation for errors
-          try {
-            const expRes = await fetch('http://localhost:5000/explain_error', {
-              method: 'POST',
-              headers: { 'Content-Type': 'application/json' },
-              body: JSON.stringify({ raw_error: compileJson.raw_error || '', classification: cls })
-            });
-            const expJson = await expRes.json();
-            if (expRes.ok) {
-              setExplanation(expJson.explanation || 'No explanation available.');
-            } else {
-              setExplanation(expJson.error || 'Failed to get explanation.');
+          } else if (event === 'token') {
+            // Tokens render as they arrive
+            streamed += payload.text || '';
+            setExplanation(streamed);
+          } else if (event === 'fix') {
+            setFixedCode(payload.fixed_code || '');
+          } else if (event === 'done') {
+            if (payload.status !== 'success') {
+              setExplanation(payload.explanation || streamed || 'No explanation available.');
             }
-          } catch (err) {
-            setExplanation('Error connecting to explanation service.');
-          }
-
-          // 3. Get autofix (non-blocking, don't wait for it)
-          fetch('http://localhost:5000/autofix', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ code: codeText })
-          })
-          .then(res => res.json())
-          .then(fixJson => {
-            if (fixJson.fixed_code) {
-              setFixedCode(fixJson.fixed_code || '');
+          } else if (event === 'error') {
+            if (!compiled) {
+              setExplanation(payload.error || 'Compilation failed. Please check your code.');
+              setCompilationSuccess(false);
+            } else if (payload.stage === 'explain' && !streamed) {
+              setExplanation(payload.error || 'Failed to get explanation.');
             }
-          })
-          .catch(() => {});
+          }
         }
-
-      } else {
-        setExplanation(compileJson.error || 'Compilation failed. Please check your code.');
-        setCompilationSuccess(false);
-      }
+      );
     } catch (e) {
       console.error('Error during analysis:', e);
       setExplanation('Error connecting to backend. Please make sure the backend server is running on http://localhost:5000');
@@ -294,8 +307,13 @@ const CodeAnalysisDashboard = () => {
       const runRes = await fetch('http://localhost:5000/run', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        // IMPORTANT: Sending the programInput as stdin to the backend
-        body: JSON.stringify({ code: codeText, stdin: programInput }) 
+        // IMPORTANT: Sending the programInput as stdin to the backend.
+        // build_id reuses the binary from /compile; code is the fallback if it was evicted or edited.
+        body: JSON.stringify({
+          build_id: build.code === codeText ? build.id : null,
+          code: codeText,
+          stdin: programInput
+        })
       });
       const runJson = await runRes.json();
       
@@ -495,19 +513,27 @@ const CodeAnalysisDashboard = () => {
       setInput('');
       setIsSending(true);
       try {
-        const res = await fetch('http://localhost:5000/chat', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ message: msg, mode, voice, tts: false }) // no TTS
-        });
-        const json = await res.json();
-        if (res.ok) {
-          setMessages((m) => [...m, { role: 'bot', text: json.reply || '' }]);
-        } else {
-          const errorMsg = json.error || 'Error contacting chatbot.';
-          console.error('Chatbot error:', errorMsg);
-          setMessages((m) => [...m, { role: 'bot', text: `Error: ${errorMsg}` }]);
-        }
+        // Stream the reply into a placeholder bot message
+        let streamed = '';
+        const setBotText = (text) =>
+          setMessages((m) => [...m.slice(0, -1), { role: 'bot', text }]);
+        setMessages((m) => [...m, { role: 'bot', text: '' }]);
+        await postSSE(
+          'http://localhost:5000/chat/stream',
+          { message: msg, mode, session_id: sessionId.current },
+          (event, payload) => {
+            if (event === 'token') {
+              streamed += payload.text || '';
+              setBotText(streamed);
+            } else if (event === 'done') {
+              setBotText(payload.reply || streamed);
+            } else if (event === 'error') {
+              const errorMsg = payload.error || 'Error contacting chatbot.';
+              console.error('Chatbot error:', errorMsg);
+              setBotText(`Error: ${errorMsg}`);
+            }
+          }
+        );
       } catch (error) {
         console.error('Chatbot connection error:', error);
         setMessages((m) => [...m, { role: 'bot', text: `Error connecting to chatbot. Make sure the backend server is running on http://localhost:5000` }]);